@@ -0,0 +1,171 @@
+"""
+cleaning: turns a raw restaurant csv written by the scraper (e.g. restaurants_data/nyc_restaurants_raw_2021-07-20.csv)
+into the clean schema of restaurants_data/nyc_restaurants_clean.csv, with the same steps as the cleaning cell of
+"data cleaning + EDA code.ipynb" done as whole-column operations instead of per-row lambdas
+
+usage:
+    from cleaning import clean_csv
+    df = clean_csv('restaurants_data/nyc_restaurants_raw_2021-07-20.csv', 'nyc_restaurants_clean.csv')
+"""
+import numpy as np
+import pandas as pd
+
+# use pyarrow's compiled string kernels when it is installed, python string objects otherwise
+try:
+    import pyarrow
+    TEXT = 'string[pyarrow]'
+except ImportError:
+    TEXT = object
+
+
+PRICE_TIERS = {'$30 and under': 1, '$31 to $50': 2, '$50 and over': 3}
+NOISE_LEVELS = ['Quiet', 'Moderate', 'Energetic']
+PRECAUTIONS = ['sanitizing', 'distancing', 'ppe', 'screening']
+
+# dtypes of the raw csv columns
+RAW_DTYPES = {'name': TEXT, 'url': TEXT, 'is_member': 'int64', 'promoted': 'int64', 'price_tier': TEXT,
+              'review_count': TEXT, 'overall': 'float64', 'food': 'float64', 'service': 'float64',
+              'ambience': 'float64', 'value': 'float64', 'noise': TEXT, 'pct_recommended': 'float64',
+              'neighborhood': TEXT, 'cuisines': TEXT, 'dining_style': TEXT, 'dress_code': TEXT, 'chef': TEXT,
+              'tags': TEXT, 'primary_cuisine': TEXT, 'sanitizing': 'float64', 'distancing': 'float64',
+              'ppe': 'float64', 'screening': 'float64'}
+
+CLEAN_COLUMNS = list(RAW_DTYPES) + ['newly_added', 'precautions']
+# free text columns that can carry accented characters
+TEXT_COLUMNS = ['name', 'neighborhood', 'cuisines', 'dining_style', 'dress_code', 'chef', 'tags', 'primary_cuisine']
+
+# low cardinality text columns stored as categoricals
+CATEGORICAL = {'noise': 'category', 'neighborhood': 'category', 'primary_cuisine': 'category'}
+NOISE = pd.CategoricalDtype(NOISE_LEVELS, ordered = True)
+
+# ' restaurant' in the card link label and the 'Newly added ' badge, removed from names in one pass
+NAME_NOISE = ' restaurant|Newly added '
+# query string of a url, from its last '?' like the notebook's re.search('^.*\\?', s)
+QUERY = r'\?[^?]*$'
+
+# utf-8 text that was decoded as iso-8859-1 somewhere on the way, e.g. 'Ã±' for 'ñ'
+MOJIBAKE = '[\xc2-\xf4][\x80-\xbf]'
+
+
+def _per_unique(series, func):
+    # applies a column operation to the distinct values only and broadcasts the result back, for columns with few
+    # distinct values such as review_count
+    codes, uniques = pd.factorize(series)
+    result = func(pd.Series(uniques))
+    return pd.Series(result.to_numpy().take(codes), index = series.index)
+
+
+def _redecode(value):
+    # value re-decoded as utf-8 from its iso-8859-1 bytes, unchanged if either step fails
+    try:
+        return value.encode('iso-8859-1').decode('utf-8')
+    except UnicodeError:
+        return value
+
+
+def read_raw(path, encoding = 'iso-8859-1'):
+    """
+    read_raw: reads a raw restaurant csv with explicit dtypes. The scraper writes utf-8, but the notebook read it as
+        iso-8859-1 and only repaired the name column afterwards, nyc_restaurants_clean.csv keeps the mis-decoded
+        accents in the other text columns (e.g. 'CafÃ©'). The default encoding reproduces that file; see
+        clean_restaurants() to repair every text column instead
+    """
+    return pd.read_csv(path, dtype = RAW_DTYPES, encoding = encoding)
+
+
+def repair_encoding(names):
+    """
+    repair_encoding: re-decodes strings that were utf-8 read as iso-8859-1 (the notebook's
+        s.encode('iso-8859-1').decode('utf-8')). Only strings showing the pattern are touched, the notebook's
+        version raises on names that are already correct, such as 'Anār Indian Cuisine'. A string that doesn't
+        round-trip, e.g. one mixing mojibake with characters outside iso-8859-1, is left unchanged rather than
+        losing those characters
+    """
+    broken = names.str.contains(MOJIBAKE, regex = True, na = False)
+    if not broken.any():
+        return names
+    names = names.copy()
+    names[broken] = _per_unique(names[broken], lambda values: values.map(_redecode))
+    return names
+
+
+def clean_restaurants(raw, repair = ('name',)):
+    """
+    clean_restaurants: cleans a raw restaurant DataFrame (see read_raw())
+
+    args:
+        raw: DataFrame with the scraper's columns (REST_KEYS in scraper/opentablescraper.py)
+        repair: columns passed through repair_encoding(). ('name',) is what the notebook did, TEXT_COLUMNS repairs
+            cuisines, chef, tags etc. as well
+
+    output:
+        df: DataFrame with CLEAN_COLUMNS, one row per restaurant on OpenTable's reservation service
+            price_tier: int, 1 to 3
+            review_count: int
+            promoted, newly_added: bool
+            sanitizing, distancing, ppe, screening, precautions: int, missing counted as 0
+            noise, neighborhood, primary_cuisine: categorical (see fix_noise() for the noise levels)
+            url: restaurant page url without its query string, unique
+    """
+    # remove non-member restaurants, they have no further information populated
+    df = raw.loc[raw['is_member'] != 0, list(RAW_DTYPES)].copy()
+
+    df['price_tier'] = df['price_tier'].map(PRICE_TIERS).astype('int64')
+    df['review_count'] = _per_unique(df['review_count'], lambda counts: counts.str.replace(' Reviews', '', regex = False)
+                                     .str.replace('No', '0', regex = False).astype('int64'))
+
+    df['newly_added'] = df['name'].str.contains('Newly added ', regex = False).astype(bool)
+    df['name'] = df['name'].str.replace(NAME_NOISE, '', regex = True)
+    for column in repair:
+        df[column] = repair_encoding(df[column])
+
+    # query fields (tracking ids) differ between loads of the same restaurant. A restaurant loaded twice during the
+    # crawl can differ in its review count too, the first load is kept
+    df['url'] = df['url'].str.replace(QUERY, '', regex = True)
+    df = df[~df['url'].duplicated(keep = 'first')]
+
+    df['promoted'] = df['promoted'].astype(bool)
+
+    # total precautions is missing (then 0) if any of the four is missing, as with the notebook's sum of columns
+    df['precautions'] = df[PRECAUTIONS].sum(axis = 1, min_count = len(PRECAUTIONS)).fillna(0).astype('int64')
+    df[PRECAUTIONS] = df[PRECAUTIONS].fillna(0).astype('int64')
+
+    df = df.astype(CATEGORICAL)
+
+    return df[CLEAN_COLUMNS].reset_index(drop = True)
+
+
+def fix_noise(df):
+    """
+    fix_noise: the notebook's 'fix noise null values' step, run on the clean data before analysis. Restaurants with no
+        noise rating have other sidebar text scraped into noise, anything but Quiet, Moderate or Energetic becomes
+        missing. noise becomes an ordered categorical, Quiet < Moderate < Energetic
+    """
+    df = df.copy()
+    df['noise'] = df['noise'].astype(object).where(df['noise'].isin(NOISE_LEVELS)).astype(NOISE)
+    return df
+
+
+def write_clean(df, path):
+    """
+    write_clean: writes a clean DataFrame in the format of nyc_restaurants_clean.csv (TRUE/FALSE booleans, whole
+        numbers without a trailing .0)
+    """
+    out = df.copy()
+    for column in out.columns[out.dtypes == bool]:
+        out[column] = np.where(out[column], 'TRUE', 'FALSE')
+    out.to_csv(path, index = False, float_format = '%.15g', encoding = 'utf-8')
+
+
+def clean_csv(raw_path, out_path = None, repair = ('name',)):
+    """
+    clean_csv: reads a raw restaurant csv, cleans it, and writes it to out_path if given. With the default arguments
+        the output is byte for byte nyc_restaurants_clean.csv for nyc_restaurants_raw_2021-07-20.csv
+
+    output:
+        df: the clean DataFrame (see clean_restaurants())
+    """
+    df = clean_restaurants(read_raw(raw_path), repair)
+    if out_path is not None:
+        write_clean(df, out_path)
+    return df
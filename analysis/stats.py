@@ -0,0 +1,201 @@
+"""
+stats: bootstrap confidence intervals and permutation tests for the EDA group comparisons (promoted vs not promoted,
+any_precautions, price tiers, ...) on avg_bookings and the ratings, run for every split and metric at once, and the
+notebook's 3 standard deviation outlier filter as one mask over any number of columns
+
+Each split draws one matrix of bootstrap draw counts per group and one matrix of permuted group labels, shared by
+every metric of the split, and the means of all resamples and metrics are one matrix product. Resamples are drawn in
+chunks of chunk_size, each chunk from its own seed, so results are the same whether the chunks run in this process or
+are spread over worker processes.
+
+usage:
+    from stats import compare, outlier_mask, splits
+    df = df[outlier_mask(df[['avg_bookings', 'weighted_overall']])]
+    results = compare(df, splits(df, ['promoted', 'any_precautions', 'price_tier']),
+                      ['avg_bookings', 'weighted_overall', 'weighted_food'], resamples = 10000, workers = 4)
+"""
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+
+# missing values are skipped, as pandas' mean() and median() do
+STATISTICS = {'mean': np.nanmean, 'median': np.nanmedian}
+
+RESULT_COLUMNS = ['split', 'metric', 'n_a', 'n_b', 'a', 'b', 'diff', 'ci_low', 'ci_high', 'a_low', 'a_high', 'b_low',
+                  'b_high', 'p_value']
+
+
+def outlier_mask(data, k = 3):
+    """
+    outlier_mask: the notebook's df[np.abs(df.col - df.col.mean()) <= 3 * df.col.std()] for every column at once
+
+    args:
+        data: DataFrame, Series or array of rows x columns
+        k: float, number of sample standard deviations from the column mean a value may lie
+
+    output:
+        mask: boolean Series with the index of data (array for an array), True for rows within k standard deviations
+        in every column. Rows with a missing value are False, as they were in the notebook's filter
+    """
+    values = np.asarray(data, dtype = float)
+    if values.ndim == 1:
+        values = values[:, None]
+    # nanmean/nanstd skip missing values like pandas' mean() and std()
+    mean = np.nanmean(values, axis = 0)
+    std = np.nanstd(values, axis = 0, ddof = 1)
+    with np.errstate(invalid = 'ignore'):
+        mask = (np.abs(values - mean) <= k * std).all(axis = 1)
+    if isinstance(data, (pd.DataFrame, pd.Series)):
+        return pd.Series(mask, index = data.index)
+    return mask
+
+
+def splits(df, columns):
+    """
+    splits: group splits of the restaurants for compare()
+
+    args:
+        df: DataFrame of restaurants
+        columns: list of columns. A boolean column gives one split, True vs False (named e.g. 'promoted'), any other
+            column one split per value, that value vs every other value (e.g. 'price_tier=1')
+
+    output:
+        splits: dict of name -> (mask_a, mask_b), boolean arrays over the rows of df
+    """
+    out = {}
+    for column in columns:
+        values = df[column]
+        if values.dtype == bool:
+            out[column] = (values.to_numpy(), ~values.to_numpy())
+            continue
+        present = values.notna().to_numpy()
+        for value in sorted(values.dropna().unique()):
+            mask = (values == value).to_numpy()
+            out[f'{column}={value}'] = (mask, present & ~mask)
+    return out
+
+
+def _counts(rng, n, size):
+    # size x n matrix of how often each of n rows is drawn in each of size bootstrap resamples
+    index = rng.integers(0, n, (size, n)) + (np.arange(size) * n)[:, None]
+    return np.bincount(index.ravel(), minlength = size * n).reshape(size, n).astype(float)
+
+
+def _masked_mean(weights, values, valid):
+    # mean of the present values of every column for each row of weights, missing values weigh 0
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        return (weights @ values) / (weights @ valid)
+
+
+def _resample_chunk(groups, size, seeds, statistic):
+    # size bootstrap and permutation resamples of every (a, b) pair of groups, one seed per pair. Returns a list of
+    # (bootstrap statistics of a, of b, permutation differences), each an array of size x metrics
+    out = []
+    for (a, b), seed in zip(groups, seeds):
+        rng = np.random.default_rng(seed)
+        n_a, n_b = len(a), len(b)
+        pooled = np.concatenate([a, b])
+        valid = ~np.isnan(pooled)
+        # permutation test: the n_a rows with the smallest random keys of a resample form group a, the rest group b
+        keys = rng.random((size, n_a + n_b))
+
+        if statistic == 'mean':
+            # every statistic is a weighted mean: one matrix product per group covers all metrics, with each
+            # resample's row weights the bootstrap draw counts or the 0/1 group labels
+            values, weights = np.where(valid, pooled, 0.0), valid.astype(float)
+            boot_a = _masked_mean(_counts(rng, n_a, size), values[:n_a], weights[:n_a])
+            boot_b = _masked_mean(_counts(rng, n_b, size), values[n_a:], weights[n_a:])
+            in_a = (keys <= np.partition(keys, n_a - 1, axis = 1)[:, n_a - 1:n_a]).astype(float)
+            sum_a, count_a = in_a @ values, in_a @ weights
+            with np.errstate(invalid = 'ignore', divide = 'ignore'):
+                perm = sum_a / count_a - (values.sum(axis = 0) - sum_a) / (weights.sum(axis = 0) - count_a)
+        else:
+            # statistics other than the mean need the resampled values themselves, gathered one metric at a time so
+            # a chunk holds a single size x n matrix of values
+            stat = STATISTICS[statistic]
+            index_a, index_b = rng.integers(0, n_a, (size, n_a)), rng.integers(0, n_b, (size, n_b))
+            labels = np.argpartition(keys, n_a - 1, axis = 1)
+            boot_a, boot_b, perm = (np.column_stack(columns) for columns in zip(*(
+                (stat(a[:, j][index_a], axis = 1), stat(b[:, j][index_b], axis = 1),
+                 stat(pooled[:, j][labels[:, :n_a]], axis = 1) - stat(pooled[:, j][labels[:, n_a:]], axis = 1))
+                for j in range(pooled.shape[1]))))
+        out.append((boot_a, boot_b, perm))
+    return out
+
+
+def compare(df, splits, metrics, resamples = 10000, confidence = 0.95, statistic = 'mean', seed = 0, workers = 1,
+            chunk_size = 1000):
+    """
+    compare: bootstrap confidence intervals and two-sided permutation tests of the difference in a statistic of every
+        metric between the two groups of every split
+
+    args:
+        df: DataFrame of restaurants
+        splits: dict of name -> (mask_a, mask_b) over the rows of df, see splits()
+        metrics: list of numeric columns. Rows missing a metric are left out of that metric's statistics: resamples
+            are drawn over whole rows and skip the missing values they contain
+        resamples: int, number of bootstrap resamples and of permutations per split, shared by all metrics
+        confidence: float, level of the percentile confidence intervals
+        statistic: 'mean' or 'median'
+        seed: int, the results depend only on seed, resamples and chunk_size, not on workers
+        workers: int, processes the chunks are spread over. 1 runs everything in this process
+        chunk_size: int, resamples drawn at once per split, bounds memory at a few chunk_size x rows matrices
+
+    output:
+        results: DataFrame with one row per split and metric, columns RESULT_COLUMNS
+            n_a, n_b: number of rows of each group with the metric
+            a, b, diff: statistic of each group and a - b
+            ci_low, ci_high: bootstrap confidence interval of diff
+            a_low, a_high, b_low, b_high: bootstrap confidence intervals of a and b
+            p_value: share of permutations with a difference at least as large as diff in absolute value, counting
+                the observed split itself
+        Comparisons with a group without values have missing statistics
+    """
+    if statistic not in STATISTICS:
+        raise ValueError(f'statistic must be one of {list(STATISTICS)}')
+    values = df[metrics].to_numpy(dtype = float)
+    groups = {name: (values[np.asarray(mask_a, dtype = bool)], values[np.asarray(mask_b, dtype = bool)])
+              for name, (mask_a, mask_b) in splits.items()}
+    runnable = [name for name, (a, b) in groups.items() if len(a) and len(b)]
+
+    # a seed per split and chunk, in a fixed order, so the draws don't depend on which process runs a chunk
+    sizes = [min(chunk_size, resamples - start) for start in range(0, resamples, chunk_size)]
+    split_seeds = [sequence.spawn(len(sizes)) for sequence in np.random.SeedSequence(seed).spawn(len(runnable))]
+    chunk_seeds = [[seeds[k] for seeds in split_seeds] for k in range(len(sizes))]
+    args = ([[groups[name] for name in runnable]] * len(sizes), sizes, chunk_seeds, [statistic] * len(sizes))
+    # groups, resamples or metrics without a single value give all-missing statistics, reported as missing
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers = workers) as executor:
+                chunks = list(executor.map(_resample_chunk, *args))
+        else:
+            chunks = list(map(_resample_chunk, *args))
+
+        alpha = (1 - confidence) / 2
+        rows = []
+        stat = STATISTICS[statistic]
+        resampled = {name: g for g, name in enumerate(runnable)}
+        for name, (a, b) in groups.items():
+            n_a, n_b = (~np.isnan(a)).sum(axis = 0), (~np.isnan(b)).sum(axis = 0)
+            if name not in resampled:
+                rows.extend({'split': name, 'metric': metric, 'n_a': n_a[j], 'n_b': n_b[j]} for j, metric in enumerate(metrics))
+                continue
+            boot_a, boot_b, perm = (np.concatenate([chunk[resampled[name]][part] for chunk in chunks]) for part in range(3))
+            observed_a, observed_b = stat(a, axis = 0), stat(b, axis = 0)
+            diff = observed_a - observed_b
+            ci = np.nanquantile(boot_a - boot_b, [alpha, 1 - alpha], axis = 0)
+            ci_a = np.nanquantile(boot_a, [alpha, 1 - alpha], axis = 0)
+            ci_b = np.nanquantile(boot_b, [alpha, 1 - alpha], axis = 0)
+            # permuted differences are sums in another order, allow for rounding when one equals the observed difference
+            extreme = np.abs(perm) >= np.abs(diff) - 1e-9 * np.maximum(1, np.abs(diff))
+            p_value = np.where(np.isnan(diff), np.nan, (extreme.sum(axis = 0) + 1) / (resamples + 1))
+            for j, metric in enumerate(metrics):
+                rows.append({'split': name, 'metric': metric, 'n_a': n_a[j], 'n_b': n_b[j], 'a': observed_a[j],
+                             'b': observed_b[j], 'diff': diff[j], 'ci_low': ci[0, j], 'ci_high': ci[1, j],
+                             'a_low': ci_a[0, j], 'a_high': ci_a[1, j], 'b_low': ci_b[0, j], 'b_high': ci_b[1, j],
+                             'p_value': p_value[j]})
+    return pd.DataFrame(rows, columns = RESULT_COLUMNS)
@@ -0,0 +1,128 @@
+"""
+bench_aggregates: cost of reading scraper/aggregates.py's bookings aggregates after a new day arrives, against
+recomputing avg_bookings and the group means over the whole history the way the analysis notebook does, on
+bookings_data_raw/ and restaurants_data/nyc_restaurants_clean.csv
+
+Also checks that the aggregates are right:
+    - appending the days one at a time gives the same groups as rebuild() on a store filled beforehand
+    - restaurant means match BookingsStore.average_bookings()
+    - group means and standard deviations match a pandas groupby over the clean csv (restaurants without bookings
+      counted as 0)
+    - ingesting a day twice changes nothing
+
+usage:
+    python bench_aggregates.py [--save]
+
+    --save adds the times to ingest the last day, to update and read the aggregates and to recompute them, and peak
+    RSS to results/<commit>.json (see results.py)
+"""
+import argparse
+import glob
+import math
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'scraper'))
+
+import results
+from aggregates import ATTRIBUTES, DIMENSIONS, BookingAggregates
+from bookings_store import RAW_FILE, BookingsStore
+
+RAW = os.path.join(HERE, '..', 'bookings_data_raw')
+CLEAN = os.path.join(HERE, '..', 'restaurants_data', 'nyc_restaurants_clean.csv')
+
+
+def same_groups(got, want):
+    # groups of two BookingAggregates, floats equal up to the rounding of the running sums
+    assert [group['value'] for group in got] == [group['value'] for group in want], (got, want)
+    for g, w in zip(got, want):
+        for key, value in w.items():
+            if isinstance(value, float):
+                assert math.isclose(g[key], value, rel_tol = 1e-9, abs_tol = 1e-9), (key, g, w)
+            else:
+                assert g[key] == value, (key, g, w)
+
+
+def recompute(store, clean):
+    # the notebook's way: every restaurant mean and group mean from the whole bookings history
+    means = {store.ids.url(restaurant_id): mean for restaurant_id, (mean, _) in store.average_bookings().items()}
+    df = clean.assign(avg_bookings = clean['url'].map(means).fillna(0))
+    return {column: df.groupby(column)['avg_bookings'].agg(['mean', 'std', 'size']) for column in ATTRIBUTES}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = __doc__.strip().splitlines()[0])
+    parser.add_argument('--save', action = 'store_true', help = 'add the results to results/<commit>.json')
+    args = parser.parse_args()
+
+    files = sorted(path for path in glob.glob(os.path.join(RAW, 'bookings_*.csv')) if RAW_FILE.search(path))
+    days = sorted({RAW_FILE.search(path).group('date') for path in files})
+    clean = pd.read_csv(CLEAN, encoding = 'utf-8')
+    clean = clean[~clean['url'].duplicated()]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # aggregates first, then the days one at a time as bookings_today() would add them
+        store = BookingsStore(os.path.join(tmp, 'incremental.db'))
+        aggregates = BookingAggregates(store)
+        aggregates.load_restaurants(CLEAN)
+        for day in days[:-1]:
+            for path in files:
+                if day in path:
+                    store.ingest_csv(path)
+            aggregates.groups('all')
+        # the trigger's share of the ingest is inside ingest_seconds, the group update inside read_seconds
+        start = time.perf_counter()
+        added = sum(store.ingest_csv(path) for path in files if days[-1] in path)
+        ingest_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        groups = {dimension: aggregates.groups(dimension) for dimension in DIMENSIONS}
+        read_seconds = time.perf_counter() - start
+        print(f'{len(days)} days, last day of {added} rows ingested in {1000 * ingest_seconds:.1f} ms, '
+              f'aggregates updated and read in {1000 * read_seconds:.1f} ms')
+
+        assert sum(store.ingest_csv(path) for path in files) == 0 and aggregates.refresh() == 0, 'duplicate ingest changed the aggregates'
+
+        # the same bookings, aggregates created on the filled store
+        filled = BookingsStore(os.path.join(tmp, 'rebuilt.db'))
+        filled.import_raw(RAW)
+        rebuilt = BookingAggregates(filled)
+        rebuilt.load_restaurants(CLEAN)
+        for dimension in DIMENSIONS:
+            same_groups(groups[dimension], rebuilt.groups(dimension))
+        print('appending days one at a time gives the same groups as rebuild()')
+
+        averages = store.average_bookings()
+        totals = aggregates.restaurants()
+        assert set(averages) == set(totals)
+        for restaurant_id, (mean, n) in averages.items():
+            assert math.isclose(totals[restaurant_id][2], mean, rel_tol = 1e-12) and totals[restaurant_id][1] == n
+        print('restaurant means match BookingsStore.average_bookings()')
+
+        start = time.perf_counter()
+        reference = recompute(store, clean)
+        recompute_seconds = time.perf_counter() - start
+        for column, table in reference.items():
+            got = {group['value']: group for group in groups[column]}
+            assert len(got) == len(table), column
+            for value, row in table.iterrows():
+                group = got['True' if value is True else 'False' if value is False else str(value)]
+                assert group['restaurants'] == row['size'] and math.isclose(group['avg_bookings'], row['mean'], rel_tol = 1e-9)
+                assert (np.isnan(row['std']) and group['std'] is None) or math.isclose(group['std'], row['std'], rel_tol = 1e-6)
+        print('group means and stds match a pandas groupby of the clean csv')
+        print(f'full recompute: {1000 * recompute_seconds:.1f} ms ({recompute_seconds / read_seconds:.1f}x the aggregates read)')
+
+        for closing in (aggregates, store, rebuilt, filled):
+            closing.close()
+
+    if args.save:
+        metrics = {'ingest_day_ms': round(1000 * ingest_seconds, 3), 'read_ms': round(1000 * read_seconds, 3),
+                   'recompute_ms': round(1000 * recompute_seconds, 3), 'speedup': round(recompute_seconds / read_seconds, 2),
+                   'peak_rss_mb': results.peak_rss_mb()}
+        config = {'days': len(days), 'rows_last_day': added}
+        print(f'saved to {results.save("aggregates", metrics, config)}')
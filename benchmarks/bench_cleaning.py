@@ -0,0 +1,104 @@
+"""
+bench_cleaning: rows/sec of the notebook's per-row cleaning code against the vectorized pipeline in
+analysis/cleaning.py, on restaurants_data/nyc_restaurants_raw_2021-07-20.csv scaled up to --scale times its rows
+
+Also checks that the pipeline reproduces restaurants_data/nyc_restaurants_clean.csv byte for byte, and that the scaled
+run keeps every copied restaurant.
+
+usage:
+    python bench_cleaning.py [--scale 100] [--repeat 3] [--save]
+
+    --save adds rows/sec and peak RSS to results/<commit>.json (see results.py)
+"""
+import argparse
+import os
+import re
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'analysis'))
+
+import cleaning
+import results
+
+RAW = os.path.join(HERE, '..', 'restaurants_data', 'nyc_restaurants_raw_2021-07-20.csv')
+CLEAN = os.path.join(HERE, '..', 'restaurants_data', 'nyc_restaurants_clean.csv')
+
+
+def legacy_clean(df):
+    # cleaning cell of "data cleaning + EDA code.ipynb", kept as the baseline
+    df = df[df['is_member'] != 0]
+    price_tier_dict = {'$30 and under': 1, '$31 to $50': 2, '$50 and over':3}
+    df['price_tier'] = df['price_tier'].map(lambda x: price_tier_dict[x])
+    df['review_count']= df['review_count'].map(lambda s: str.replace(s, ' Reviews', '')).map(lambda s: str.replace(s, 'No', '0')).map(lambda x: int(x))
+    df['newly_added'] = df['name'].map(lambda s: 'Newly added ' in s)
+    df['name'] = df['name'].map(lambda s: str.replace(s, ' restaurant', '')).map(lambda s: str.replace(s, 'Newly added ', ''))
+    dupe_mask = df.duplicated(keep = 'first') == False
+    df = df[dupe_mask]
+    df['promoted'] = df['promoted'].apply(lambda x: bool(x))
+    df['weighted_overall'] = df['review_count'] * df['overall']
+    df['precautions'] = sum((df['sanitizing'], df['distancing'], df['ppe'], df['screening']))
+    df['precautions'] = df['precautions'].apply(lambda x: 0 if pd.isnull(x) else x)
+    df['sanitizing'] = df['sanitizing'].apply(lambda x: 0 if pd.isnull(x) else x)
+    df['ppe'] = df['ppe'].apply(lambda x: 0 if pd.isnull(x) else x)
+    df['screening'] = df['screening'].apply(lambda x: 0 if pd.isnull(x) else x)
+    df['distancing'] = df['distancing'].apply(lambda x: 0 if pd.isnull(x) else x)
+    df['name'] = df['name'].apply(lambda s: s.encode('iso-8859-1').decode('utf-8'))
+    df['url'] = df['url'].apply(lambda s: re.search('^.*\?', s).group(0)).apply(lambda s: s[:-1])
+    df = df.loc[:, ~df.columns.str.contains('^Unnamed')]
+    df['noise'] = df['noise'].map(lambda s: None if s not in ['Quiet', 'Moderate', 'Energetic'] else s)
+    return df
+
+
+def scaled(raw, scale):
+    # scale copies of the raw rows, each copy with its own restaurant urls so nothing is dropped as a duplicate
+    copies = []
+    for k in range(scale):
+        copy = raw.copy()
+        copy['url'] = copy['url'].str.replace('?', f'-{k}?', n = 1, regex = False)
+        copies.append(copy)
+    return pd.concat(copies, ignore_index = True)
+
+
+def run(clean, raw, repeat):
+    # returns (rows/sec, result of the last repetition)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = clean(raw.copy())
+    return repeat * len(raw) / (time.perf_counter() - start), result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = __doc__.strip().splitlines()[0])
+    parser.add_argument('--scale', type = int, default = 100)
+    parser.add_argument('--repeat', type = int, default = 3)
+    parser.add_argument('--save', action = 'store_true', help = 'add the results to results/<commit>.json')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        out = os.path.join(tmp, 'clean.csv')
+        cleaning.clean_csv(RAW, out)
+        with open(out, 'rb') as a, open(CLEAN, 'rb') as b:
+            assert a.read() == b.read(), 'output differs from nyc_restaurants_clean.csv'
+    print('output identical to nyc_restaurants_clean.csv')
+
+    raw = cleaning.read_raw(RAW)
+    big = scaled(raw, args.scale)
+    members = raw.loc[raw['is_member'] != 0, 'url'].str.split('?').str[0].nunique()
+    print(f'{len(big)} raw rows ({args.scale}x), text columns as {cleaning.TEXT}')
+
+    # the notebook read the csv without dtypes
+    legacy_rate, _ = run(legacy_clean, scaled(pd.read_csv(RAW, encoding = 'iso-8859-1'), args.scale), args.repeat)
+    print(f'notebook lambdas: {legacy_rate:,.0f} rows/sec')
+    rate, result = run(cleaning.clean_restaurants, big, args.repeat)
+    assert len(result) == args.scale * members, (len(result), args.scale * members)
+    print(f'vectorized:       {rate:,.0f} rows/sec ({rate / legacy_rate:.1f}x)')
+
+    if args.save:
+        metrics = {'rows_per_sec': round(rate), 'speedup': round(rate / legacy_rate, 2), 'peak_rss_mb': results.peak_rss_mb()}
+        config = {'scale': args.scale, 'repeat': args.repeat, 'text': str(cleaning.TEXT)}
+        print(f'saved to {results.save("cleaning", metrics, config)}')
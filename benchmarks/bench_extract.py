@@ -0,0 +1,246 @@
+"""
+bench_extract: pages/sec of the original find/find_all parsing code against the single-pass engine in
+scraper/extract.py, over the saved pages in benchmarks/fixtures (see make_fixtures.py)
+
+Also checks that every engine/parser combination returns exactly the same dicts as the original code, that those
+dicts match the rows in restaurants_data/manhattan_page1.csv the fixtures were built from, and that the review pages
+give the review dates they were built with.
+
+usage:
+    python bench_extract.py [--repeat 3] [--save]
+
+    --save adds pages/sec, p50/p95 per page and peak RSS of the engine to results/<commit>.json (see results.py)
+"""
+from bs4 import BeautifulSoup as soup
+import argparse
+import csv
+import glob
+import os
+import re
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'scraper'))
+
+import extract
+import results
+
+FIXTURES = os.path.join(HERE, 'fixtures')
+SOURCE = os.path.join(HERE, '..', 'restaurants_data', 'manhattan_page1.csv')
+
+REST_KEYS = ['name', 'url', 'is_member', 'promoted', 'price_tier', 'review_count', 'overall', 'food', 'service',
+             'ambience', 'value', 'noise', 'pct_recommended', 'neighborhood', 'cuisines', 'dining_style', 'dress_code',
+             'chef', 'tags', 'primary_cuisine', 'sanitizing', 'distancing', 'ppe', 'screening']
+
+
+def legacy_parse_restaurant_page(rest_html, curr_rest_dict):
+    # parse_restaurant_page() from scraper/opentablescraper.py before the extraction engine, kept as the baseline
+    curr_rest = soup(rest_html, 'html.parser')
+
+    divs = curr_rest.find_all('div', attrs = {"class" : "c3981cf8 _965a91d5"})
+    for div in divs:
+        spans = div.find_all('span')
+        for span in spans:
+            if "Reviews" in span.string:
+                curr_rest_dict['review_count'] = span.string
+            if "$" in span.string:
+                curr_rest_dict['price_tier'] = span.string
+
+    has_reviews = 1
+    if curr_rest_dict['review_count'] == "No Reviews":
+        has_reviews = 0
+
+    if has_reviews:
+        curr_rest_dict['overall'] = float(curr_rest.find('div', attrs = {"class" : "oc-reviews-491257d8"}).span.string)
+        subreviews = curr_rest.find_all('div', attrs = {"class" : "oc-reviews-15d38b07"})
+        if subreviews != []:
+            curr_rest_dict['food'] = float(subreviews[0].string)
+            curr_rest_dict['service'] = float(subreviews[1].string)
+            curr_rest_dict['ambience'] = float(subreviews[2].string)
+            curr_rest_dict['value'] = float(subreviews[3].string)
+
+    noise_level = curr_rest.find('span', attrs = {"class" : "oc-reviews-624ebf8b"})
+    if not (noise_level is None):
+        curr_rest_dict['noise'] = noise_level.string
+
+    if has_reviews:
+        recs_parent = curr_rest.find_all('div', attrs = {"class" : "oc-reviews-8c8e52a0"})
+        has_recs = 0
+        for div in recs_parent:
+            spans = div.find_all('span', attrs = {"class" : "oc-reviews-624ebf8b"})
+            for span in spans:
+                if span.string == 'would recommend it to a friend':
+                    has_recs = 1
+
+        if has_recs == 1:
+            recs = curr_rest.find_all('div', attrs = {"class" : "oc-reviews-dfc07aec"})[1]
+            recs_2 = re.search('\d+%', recs.get_text())
+            if not (recs_2 is None):
+                rec_string = recs_2.group(0)
+                curr_rest_dict['pct_recommended'] = int(re.search('\d+', rec_string).group(0))
+
+    details_tags = ['neighborhood', 'cuisines', 'dining_style', 'dress_code', 'chef', 'tags']
+
+    sidebar = curr_rest.find('div', attrs = {"class":"_1e466fbf"})
+    if not(sidebar is None):
+        details = sidebar.find_all('div', attrs = {"class":"df8add00"})
+        details_list = [zip(item.find_all('div', attrs = {"class":"c3981cf8 _965a91d5"}),
+                            item.find_all('div', attrs = {"class":"e7ff71b6 b2f6d1a4"})) for item in details]
+        for i in range(len(details_list)):
+            for x, y in details_list[i]:
+                details_list[i] = (x.string, y.string)
+
+        desired_details = zip(['Neighborhood', 'Cuisines', 'Dining Style', 'Dress code', '(?i)(.*chef.*)', 'Additional'], details_tags)
+
+        for x, y in desired_details:
+            for a, b in details_list:
+                if re.search(x, a):
+                    curr_rest_dict[y] = b
+
+    if not (curr_rest_dict['cuisines'] is None):
+        curr_rest_dict['primary_cuisine'] = curr_rest_dict['cuisines'].split(',')[0]
+
+    if not (curr_rest.find('div', attrs = {"id" : "safety-precautions"}) is None):
+
+        safety_categories = ['Cleaning & Sanitizing', 'Physical Distancing', 'Protective Equipment','Screening']
+        safety_tags = ['sanitizing', 'distancing', 'ppe', 'screening']
+
+        for item in safety_tags:
+            curr_rest_dict[item] = 0
+
+        safety_html = curr_rest.find_all('div', attrs = {"class" : "_77b505d0 _965a91d5"})
+        safety_features = [item.find('span').string for item in safety_html]
+
+        for i in range(len(safety_categories)):
+            for j in range(len(safety_features)):
+                if safety_categories[i] == safety_features[j]:
+                    curr_rest_dict[safety_tags[i]] = 1
+
+
+def legacy_parse_cards(results_html):
+    # card parsing from get_restaurants() and bookings_today() before the extraction engine, kept as the baseline
+    results = soup(results_html, 'html.parser')
+    cards = []
+    for restaurant in results.find_all('div', attrs = {"class" : "_3uVfVbI1iLfMbszbU6KoOL"}):
+        restaurant_child = restaurant.find('a', attrs = {"class":"_1e9PcCDb012hY4BcGfraQB"})
+        is_member = 0 if restaurant.find('p', attrs = {"class":"_1RzTbFM0hmdDgWfT_RmXel"}) else 1
+        booked_raw = restaurant.find_all('span', attrs = {"class": "_2VIffaVUDxw_-tEh-6XOB_ _2EluNCOTdgGq9H4SxGZwUg"})
+        booked_today = 0
+        for span in booked_raw:
+            if 'Booked' in span.string:
+                booked_today = int(re.search('\d+', span.string).group(0))
+        cards.append({'name': restaurant_child.get('aria-label'), 'url': restaurant_child.get('href'),
+                      'is_member': is_member, 'promoted': 1 if restaurant.get('data-promoted') == 'true' else 0,
+                      'booked': booked_today})
+    return cards
+
+
+def run(parse, pages, repeat):
+    # returns (pages/sec, seconds per page and results of the last repetition)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        parsed, seconds = [], []
+        for html in pages:
+            t0 = time.perf_counter()
+            rest_dict = dict.fromkeys(REST_KEYS)
+            parse(html, rest_dict)
+            seconds.append(time.perf_counter() - t0)
+            parsed.append(rest_dict)
+    return len(pages) * repeat / (time.perf_counter() - start), seconds, parsed
+
+
+def timed_pages(parse, pages, repeat):
+    # returns (pages/sec, seconds per page of the last repetition, outputs of the last repetition) of parse(html)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        outputs, seconds = [], []
+        for html in pages:
+            t0 = time.perf_counter()
+            outputs.append(parse(html))
+            seconds.append(time.perf_counter() - t0)
+    return len(pages) * repeat / (time.perf_counter() - start), seconds, outputs
+
+
+def as_row(rest_dict):
+    # formats a parsed dict the way csv.writer writes it, for comparison with manhattan_page1.csv
+    return {key: '' if value is None else str(value) for key, value in rest_dict.items()}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = __doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type = int, default = 3)
+    parser.add_argument('--save', action = 'store_true', help = 'add the results to results/<commit>.json')
+    args = parser.parse_args()
+    metrics = {}
+
+    with open(SOURCE, encoding = 'utf-8') as f:
+        expected = list(csv.DictReader(f))
+    with open(os.path.join(FIXTURES, 's.html'), encoding = 'utf-8') as f:
+        results_html = f.read()
+    pages = []
+    for row in expected:
+        path = os.path.join(FIXTURES, *row['url'].split('://')[1].split('?')[0].split('/')[1:]) + '.html'
+        with open(path, encoding = 'utf-8') as f:
+            pages.append(f.read())
+
+    print(f'{len(pages)} restaurant pages, {sum(map(len, pages)) / len(pages) / 1024:.0f} KB average')
+    print()
+
+    print('restaurant pages')
+    baseline, _, baseline_results = run(legacy_parse_restaurant_page, pages, args.repeat)
+    print(f'    {"original, html.parser":<28}{baseline:8.1f} pages/sec')
+
+    for builder in dict.fromkeys(['html.parser', extract.PARSER]):
+        rate, seconds, parsed = run(lambda html, d: extract.extract_restaurant(html, d, builder), pages, args.repeat)
+        assert parsed == baseline_results, f'engine with {builder} does not match the original parser'
+        print(f'    {"engine, " + builder:<28}{rate:8.1f} pages/sec  ({rate / baseline:.1f}x)')
+    metrics.update({'restaurant_pages_per_sec': round(rate, 2), 'restaurant_speedup': round(rate / baseline, 2),
+                    **results.latency_metrics(seconds, 'restaurant_')})
+
+    # keys filled in from the results page are left out, only the restaurant page fields are compared
+    for rest_dict, row in zip(baseline_results, expected):
+        got, want = as_row(rest_dict), row
+        for key in REST_KEYS[4:]:
+            if key in ('overall', 'food', 'service', 'ambience', 'value', 'pct_recommended', 'sanitizing',
+                       'distancing', 'ppe', 'screening'):
+                assert (got[key] == '' and want[key] == '') or float(got[key]) == float(want[key]), (key, got, want)
+            else:
+                assert got[key] == want[key], (key, got[key], want[key])
+
+    print()
+    print('search results page')
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        legacy_cards = legacy_parse_cards(results_html)
+    baseline = args.repeat / (time.perf_counter() - start)
+    print(f'    {"original, html.parser":<28}{baseline:8.1f} pages/sec')
+
+    for builder in dict.fromkeys(['html.parser', extract.PARSER]):
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            cards = extract.extract_cards(results_html, builder)
+        rate = args.repeat / (time.perf_counter() - start)
+        assert cards == legacy_cards, f'engine with {builder} does not match the original card parsing'
+        print(f'    {"engine, " + builder:<28}{rate:8.1f} pages/sec  ({rate / baseline:.1f}x)')
+    metrics.update({'results_pages_per_sec': round(rate, 2), 'results_speedup': round(rate / baseline, 2)})
+
+    # pages 2 to 5 of the reviews of every restaurant with reviews, page 1 is the restaurant page
+    review_pages = []
+    for path in sorted(glob.glob(os.path.join(FIXTURES, '**', '*.page*.html'), recursive = True)):
+        with open(path, encoding = 'utf-8') as f:
+            review_pages.append(f.read())
+    print()
+    print(f'review pages ({len(review_pages)})')
+    for builder in dict.fromkeys(['html.parser', extract.PARSER]):
+        rate, seconds, reviews = timed_pages(lambda html: extract.extract_reviews(html, builder), review_pages, args.repeat)
+        for dates, num_pages in reviews:
+            assert num_pages == 5 and len(dates) == 20 and all(date.startswith('Dined on ') for date in dates)
+        print(f'    {"engine, " + builder:<28}{rate:8.1f} pages/sec')
+    metrics.update({'review_pages_per_sec': round(rate, 2), **results.latency_metrics(seconds, 'review_'),
+                    'peak_rss_mb': results.peak_rss_mb()})
+
+    print()
+    print('all outputs identical to the original parsing code')
+    if args.save:
+        print(f'saved to {results.save("extract", metrics, {"repeat": args.repeat, "parser": extract.PARSER})}')
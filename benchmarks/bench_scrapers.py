@@ -0,0 +1,279 @@
+"""
+bench_scrapers: end-to-end runs of nyc_opentable_scraper(), bookings_today() and get_earliest_review() against the
+stand-in server (standin_server.py) serving the saved pages in benchmarks/fixtures (see make_fixtures.py)
+
+The scrapers run unchanged, with OPENTABLE_BASE_URL pointing them at the stand-in (see scraper/urls.py), so chrome
+and chromedriver are needed as for a real crawl. With --no-browser the pooled chrome sessions are replaced by
+HttpDriver, which downloads pages over http and answers the scrapers' element lookups from the html: every scraper
+code path but the browser runs, and the times leave out page rendering. Each scraper runs in its own python process
+and temporary directory, so its peak memory and output files are its own. The output is checked against the rows the fixtures were built
+from, a parser change that drops fields shows up as mismatches rather than as a speedup.
+
+Reported for each scraper:
+    pages_per_sec: requests answered by the stand-in per second of the run, errors included
+    p50_ms, p95_ms: latency of one page fetch (nyc_opentable_scraper, bookings_today) or of one restaurant
+        (get_earliest_review, up to two page loads and the review checks)
+    peak_rss_mb: peak RSS of the python process running the scraper
+    browser_peak_rss_mb: peak RSS of the largest browser process, read once the pool is closed
+    errors_served: requests the stand-in answered with a 503 (see --error-rate)
+    mismatched: fields (nyc_opentable_scraper), rows (bookings_today) or dates (get_earliest_review) that differ
+        from the source data
+
+usage:
+    python bench_scrapers.py [--scrapers opentable bookings first_review] [--latency 0.05] [--error-rate 0]
+                             [--workers 4] [--backend selenium] [--no-browser] [--save]
+"""
+import argparse
+import csv
+import datetime
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import urlsplit
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SCRAPER = os.path.join(HERE, '..', 'scraper')
+sys.path.insert(0, HERE)
+
+import requests
+from bs4 import BeautifulSoup
+from selenium.common.exceptions import NoSuchElementException, WebDriverException
+from selenium.webdriver.common.by import By
+
+import make_fixtures
+import results
+from standin_server import start_standin
+
+FIXTURES = os.path.join(HERE, 'fixtures')
+SOURCE = os.path.join(HERE, '..', 'restaurants_data', 'manhattan_page1.csv')
+SCRAPERS = ['opentable', 'bookings', 'first_review']
+
+# restaurant page fields compared with manhattan_page1.csv, numbers compared as floats
+FIELDS = ['is_member', 'promoted', 'price_tier', 'review_count', 'overall', 'food', 'service', 'ambience', 'value',
+          'noise', 'pct_recommended', 'neighborhood', 'cuisines', 'dining_style', 'dress_code', 'chef', 'tags',
+          'primary_cuisine', 'sanitizing', 'distancing', 'ppe', 'screening']
+NUMBERS = {'overall', 'food', 'service', 'ambience', 'value', 'pct_recommended', 'sanitizing', 'distancing', 'ppe',
+           'screening'}
+
+
+def source_rows():
+    with open(SOURCE, encoding = 'utf-8') as f:
+        return list(csv.DictReader(f))
+
+
+def earliest_review(row):
+    # 'Dined on <date>' of the oldest review in the fixtures of a restaurant, see make_fixtures.review_page()
+    if row['review_count'] == 'No Reviews':
+        return 'No reviews'
+    last = (datetime.date(2021, 7, 1) - datetime.timedelta(days = (make_fixtures.REVIEW_PAGES - 2) * make_fixtures.REVIEWS_PER_PAGE + 1)
+            - datetime.timedelta(days = make_fixtures.REVIEWS_PER_PAGE - 1))
+    return 'Dined on ' + last.strftime('%B %-d, %Y')
+
+
+def mismatched_fields(out_path):
+    # fields of the scraped csv that differ from manhattan_page1.csv, restaurants missing from it count as every field
+    with open(out_path, encoding = 'utf-8') as f:
+        scraped = {urlsplit(row['url']).path: row for row in csv.DictReader(f)}
+    mismatched = 0
+    for want in source_rows():
+        got = scraped.get(urlsplit(want['url']).path)
+        if got is None:
+            mismatched += len(FIELDS)
+            continue
+        for key in FIELDS:
+            if key in NUMBERS and got[key] != '' and want[key] != '':
+                mismatched += float(got[key]) != float(want[key])
+            else:
+                mismatched += got[key] != want[key]
+    return mismatched
+
+
+class HttpElement:
+    # element found by HttpDriver, read-only
+    def __init__(self, tag):
+        self.tag = tag
+
+    @property
+    def text(self):
+        return self.tag.get_text()
+
+    def get_attribute(self, name):
+        return self.tag.decode_contents() if name == 'innerHTML' else self.tag.get(name)
+
+    def click(self):
+        raise WebDriverException('clicking needs a browser')
+
+
+class HttpDriver:
+    # stand-in for a chrome session (--no-browser): pages are downloaded over http and element lookups answered from
+    # the html. The stand-in serves every card in the html, so the first scroll step finds them all
+    def __init__(self, options = None):
+        self.session = requests.Session()
+        self.current_url = None
+        self.page_source = ''
+        self._page = None
+
+    def get(self, url):
+        # like chrome, an error response is shown as a page rather than raised
+        response = self.session.get(url, timeout = 30)
+        self.current_url = url
+        self.page_source = response.text
+        self._page = None
+
+    def find_element(self, by, value):
+        if self._page is None:
+            self._page = BeautifulSoup(self.page_source, 'lxml')
+        if by == By.ID:
+            tag = self._page.find(id = value)
+        elif by == By.CSS_SELECTOR:
+            tag = self._page.select_one(value)
+        else:
+            raise WebDriverException(f'{by} lookups need a browser')
+        if tag is None:
+            raise NoSuchElementException(f'{by} {value}')
+        return HttpElement(tag)
+
+    def execute_script(self, script, selector, step):
+        # the only script run on pages is waits.SCROLL_SCRIPT: [cards loaded, at the bottom of the page]
+        if self._page is None:
+            self._page = BeautifulSoup(self.page_source, 'lxml')
+        return [len(self._page.select(selector)), True]
+
+    def maximize_window(self):
+        pass
+
+    def quit(self):
+        self.session.close()
+
+
+def timed(fetch, latencies):
+    # wraps a fetcher's fetch method to record the duration of every call
+    def wrapper(self, url):
+        start = time.perf_counter()
+        try:
+            return fetch(self, url)
+        finally:
+            latencies.append(time.perf_counter() - start)
+    return wrapper
+
+
+def run_scraper(scraper, base_url, args):
+    # runs in the child process: one scraper against the stand-in, in a temporary directory
+    os.environ['OPENTABLE_BASE_URL'] = base_url
+    sys.path.insert(0, SCRAPER)
+    import driver_pool
+    import fetch
+    from rate_limit import set_rate
+
+    if args.no_browser:
+        driver_pool.webdriver.Chrome = HttpDriver
+    latencies = []
+    for fetcher in (fetch.SeleniumFetcher, fetch.HttpFetcher):
+        fetcher.fetch = timed(fetcher.fetch, latencies)
+    set_rate(args.rate, burst = args.workers)
+    workdir = tempfile.mkdtemp(prefix = f'bench_{scraper}_')
+    os.chdir(workdir)
+    date = (datetime.date.today() + datetime.timedelta(days = 1)).strftime('%Y-%m-%d')
+
+    start = time.perf_counter()
+    if scraper == 'opentable':
+        from opentablescraper import nyc_opentable_scraper
+        nyc_opentable_scraper('manhattan', date, workers = args.workers, requests_per_second = args.rate,
+                              backend = args.backend, retry_backoff = 0.1)
+        elapsed = time.perf_counter() - start
+        mismatched = mismatched_fields(f'{date}_manhattan_page1.csv')
+    elif scraper == 'bookings':
+        from nyc_daily_bookings import bookings_today
+        bookings_today('manhattan')
+        elapsed = time.perf_counter() - start
+        with open(f'bookings_manhattan_{datetime.date.today():%Y-%m-%d}.csv', encoding = 'utf-8') as f:
+            scraped = {urlsplit(row['url']).path for row in csv.DictReader(f)}
+        mismatched = len({urlsplit(row['url']).path for row in source_rows()} ^ scraped)
+    else:
+        from first_review_scraper import get_earliest_review
+        mismatched = 0
+        for row in source_rows()[:args.restaurants]:
+            url = base_url + urlsplit(row['url']).path
+            t0 = time.perf_counter()
+            try:
+                first_review = get_earliest_review(url)
+            except Exception as e:
+                # get_earliest_review() doesn't retry, a page it can't read counts as a mismatch
+                print(f'{url}: {e!r}')
+                first_review = None
+            latencies.append(time.perf_counter() - t0)
+            mismatched += first_review != earliest_review(row)
+        elapsed = time.perf_counter() - start
+
+    driver_pool.close_pool()
+    os.chdir(HERE)
+    shutil.rmtree(workdir)
+    metrics = {'seconds': round(elapsed, 3), **(results.latency_metrics(latencies) if latencies else {}),
+               'peak_rss_mb': results.peak_rss_mb(), 'browser_peak_rss_mb': results.peak_rss_mb(resource.RUSAGE_CHILDREN),
+               'mismatched': mismatched}
+    print('RESULT ' + json.dumps(metrics))
+
+
+def bench(scraper, server, base_url, args):
+    # runs one scraper in a child process and adds the stand-in's request counts to its metrics
+    counts = server.RequestHandlerClass.counts
+    before = dict(counts)
+    command = [sys.executable, os.path.abspath(__file__), '--child', scraper, '--base-url', base_url,
+               '--workers', str(args.workers), '--backend', args.backend, '--restaurants', str(args.restaurants)]
+    if args.rate is not None:
+        command += ['--rate', str(args.rate)]
+    if args.no_browser:
+        command.append('--no-browser')
+    out = subprocess.run(command, capture_output = True, text = True)
+    lines = [line for line in out.stdout.splitlines() if line.startswith('RESULT ')]
+    if out.returncode != 0 or not lines:
+        raise RuntimeError(f'{scraper} failed:\n{out.stdout[-2000:]}\n{out.stderr[-2000:]}')
+
+    metrics = json.loads(lines[-1][len('RESULT '):])
+    served = {status: counts.get(status, 0) - before.get(status, 0) for status in counts}
+    metrics['pages_per_sec'] = round(sum(served.values()) / metrics['seconds'], 2)
+    metrics['errors_served'] = served.get(503, 0)
+    return metrics
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = __doc__.strip().splitlines()[0])
+    parser.add_argument('--scrapers', nargs = '+', choices = SCRAPERS, default = SCRAPERS)
+    parser.add_argument('--latency', type = float, default = 0.05, help = 'seconds the stand-in waits per request')
+    parser.add_argument('--error-rate', type = float, default = 0.0, help = 'fraction of requests answered with a 503')
+    parser.add_argument('--workers', type = int, default = 4)
+    parser.add_argument('--backend', default = 'selenium', choices = ['selenium', 'http'],
+                        help = 'restaurant page backend of nyc_opentable_scraper')
+    parser.add_argument('--rate', type = float, default = None, help = 'requests per second limit, none by default')
+    parser.add_argument('--restaurants', type = int, default = 100, help = 'restaurants get_earliest_review is run on')
+    parser.add_argument('--no-browser', action = 'store_true', help = 'run without chrome, pages fetched by HttpDriver')
+    parser.add_argument('--save', action = 'store_true', help = 'add the results to results/<commit>.json')
+    parser.add_argument('--child', choices = SCRAPERS, help = argparse.SUPPRESS)
+    parser.add_argument('--base-url', help = argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_scraper(args.child, args.base_url, args)
+        sys.exit(0)
+
+    server, base_url = start_standin(FIXTURES, args.latency, error_rate = args.error_rate)
+    config = {'latency': args.latency, 'error_rate': args.error_rate, 'workers': args.workers,
+              'backend': args.backend, 'rate': args.rate, 'restaurants': args.restaurants, 'browser': not args.no_browser}
+    print(f'stand-in at {base_url}, {json.dumps(config)}')
+    try:
+        for scraper in args.scrapers:
+            metrics = bench(scraper, server, base_url, args)
+            print(f'{scraper:<14}{metrics["pages_per_sec"]:8.1f} pages/sec  p50 {metrics.get("p50_ms", 0):8.1f} ms  '
+                  f'p95 {metrics.get("p95_ms", 0):8.1f} ms  peak rss {metrics["peak_rss_mb"]:6.1f} MB  '
+                  f'{metrics["mismatched"]} mismatched')
+            if args.save:
+                results.save(f'scraper_{scraper}', metrics, config)
+    finally:
+        server.shutdown()
+    if args.save:
+        print(f'saved to {os.path.join(results.RESULTS_DIR, results.git_commit() + ".json")}')
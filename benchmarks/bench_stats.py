@@ -0,0 +1,98 @@
+"""
+bench_stats: resamples/sec of analysis/stats.py's batched bootstrap and permutation tests against a per-resample python
+loop, on the EDA comparisons of 5_day_results.csv (promoted, any_precautions, newly_added, price tiers and
+precautions against avg_bookings and the weighted ratings)
+
+The loop baseline runs --baseline-resamples resamples per comparison and is reported as a rate, a full 10k run of it
+takes minutes. Also checks that the results don't depend on the number of worker processes.
+
+usage:
+    python bench_stats.py [--resamples 10000] [--workers 1 4] [--save]
+
+    --save adds resamples/sec, the wall time and peak RSS to results/<commit>.json (see results.py)
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'analysis'))
+
+import results
+import stats
+
+RESULTS_CSV = os.path.join(HERE, '..', '5_day_results.csv')
+RATINGS = ['overall', 'food', 'service', 'ambience', 'value']
+SPLITS = ['promoted', 'any_precautions', 'newly_added', 'price_tier', 'precautions']
+
+
+def load():
+    df = pd.read_csv(RESULTS_CSV)
+    for rating in RATINGS:
+        df[f'weighted_{rating}'] = df['review_count'] * df[rating]
+    return df
+
+
+def legacy_compare(df, splits, metrics, resamples, seed = 0):
+    # one bootstrap draw and one shuffle per resample, comparison by comparison, as an ad-hoc notebook cell would
+    rng = np.random.default_rng(seed)
+    out = []
+    for mask_a, mask_b in splits.values():
+        for metric in metrics:
+            a = df.loc[mask_a, metric].dropna().to_numpy()
+            b = df.loc[mask_b, metric].dropna().to_numpy()
+            diff = a.mean() - b.mean()
+            boot, extreme = [], 0
+            pooled = np.concatenate([a, b])
+            for _ in range(resamples):
+                boot.append(rng.choice(a, len(a)).mean() - rng.choice(b, len(b)).mean())
+                shuffled = rng.permutation(pooled)
+                extreme += abs(shuffled[:len(a)].mean() - shuffled[len(a):].mean()) >= abs(diff)
+            out.append((np.quantile(boot, [0.025, 0.975]), (extreme + 1) / (resamples + 1)))
+    return out
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = __doc__.strip().splitlines()[0])
+    parser.add_argument('--resamples', type = int, default = 10000)
+    parser.add_argument('--baseline-resamples', type = int, default = 200)
+    parser.add_argument('--workers', type = int, nargs = '+', default = [1, os.cpu_count() or 1])
+    parser.add_argument('--save', action = 'store_true', help = 'add the results to results/<commit>.json')
+    args = parser.parse_args()
+
+    df = load()
+    splits = stats.splits(df, SPLITS)
+    columns = ['avg_bookings'] + [f'weighted_{rating}' for rating in RATINGS]
+    comparisons = len(splits) * len(columns)
+    print(f'{comparisons} comparisons ({len(splits)} splits x {len(columns)} metrics), {len(df)} restaurants')
+
+    start = time.perf_counter()
+    legacy_compare(df, splits, columns, args.baseline_resamples)
+    legacy_rate = comparisons * args.baseline_resamples / (time.perf_counter() - start)
+    print(f'python loop: {legacy_rate:,.0f} resamples/sec')
+
+    timings = {}
+    first = None
+    for workers in dict.fromkeys(args.workers):
+        start = time.perf_counter()
+        out = stats.compare(df, splits, columns, resamples = args.resamples, workers = workers)
+        timings[workers] = time.perf_counter() - start
+        if first is None:
+            first = out
+        pd.testing.assert_frame_equal(out, first)
+        rate = comparisons * args.resamples / timings[workers]
+        print(f'batched, {workers} workers: {timings[workers]:.2f}s for {args.resamples} resamples, {rate:,.0f} '
+              f'resamples/sec ({rate / legacy_rate:.0f}x)')
+    print('results identical for every number of workers')
+
+    if args.save:
+        workers = min(timings, key = timings.get)
+        rate = comparisons * args.resamples / timings[workers]
+        metrics = {'resamples_per_sec': round(rate), 'speedup': round(rate / legacy_rate, 1),
+                   'seconds': round(timings[workers], 3), 'peak_rss_mb': results.peak_rss_mb()}
+        config = {'resamples': args.resamples, 'comparisons': comparisons, 'workers': workers}
+        print(f'saved to {results.save("stats", metrics, config)}')
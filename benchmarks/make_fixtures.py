@@ -0,0 +1,158 @@
+"""
+make_fixtures: rebuilds the saved page fixtures in benchmarks/fixtures from restaurants_data/manhattan_page1.csv
+
+The pages reproduce the markup the scrapers read on opentable.com (same classes, ids and nesting) around the values
+that were scraped into manhattan_page1.csv, plus a page worth of reviews and page chrome, so a parser run over a
+fixture has to come back with the csv row it was built from.
+
+usage:
+    python make_fixtures.py
+
+output:
+    fixtures/s.html                  search results page with 100 restaurant cards
+    fixtures/<url path>.html         one restaurant page per card, e.g. fixtures/r/seaport-house-new-york.html
+    fixtures/<url path>.page<k>.html pages 2 to 5 of the reviews of every restaurant with reviews, older reviews on
+                                     later pages, served by standin_server.py for <url>?page=<k>
+"""
+from html import escape
+import datetime
+from urllib.parse import urlsplit
+import csv
+import os
+import random
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FIXTURES = os.path.join(HERE, 'fixtures')
+SOURCE = os.path.join(HERE, '..', 'restaurants_data', 'manhattan_page1.csv')
+
+WORDS = ('great food service friendly staff ambience lovely dinner wait table drinks pasta dessert '
+         'recommend again cozy loud brunch outdoor seating delicious portions price value').split()
+
+# reviews per page and pages of reviews of every restaurant with reviews
+REVIEWS_PER_PAGE = 20
+REVIEW_PAGES = 5
+
+SAFETY_LABELS = [('sanitizing', 'Cleaning & Sanitizing'), ('distancing', 'Physical Distancing'),
+                 ('ppe', 'Protective Equipment'), ('screening', 'Screening')]
+
+
+def fixture_path(url):
+    # saved under the url path, the way standin_server.py looks pages up
+    return os.path.join(FIXTURES, *urlsplit(url).path.strip('/').split('/')) + '.html'
+
+
+def page_chrome(title, body):
+    nav = ''.join(f'<li class="nav-item"><a href="/c/{w}">{w.title()}</a></li>' for w in WORDS)
+    script = '<script>window.__CSP_NONCE__="x";' + 'var a=1;' * 200 + '</script>'
+    return (f'<!DOCTYPE html><html lang="en"><head><meta charset="utf-8"><title>{escape(title)}</title>{script}</head>'
+            f'<body><header><nav><ul>{nav}</ul></nav></header><main id="mainContent">{body}</main>'
+            f'<footer><ul>{nav}</ul></footer></body></html>')
+
+
+def reviews_html(rng, count, dates = None):
+    # dates: one 'July 20, 2021' style date per review, newest first. The first page's dates by default
+    reviews = []
+    for n in range(count):
+        text = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(20, 60)))
+        date = dates[n] if dates is not None else f'July {20 - n % 19}, 2021'
+        reviews.append(f'<div class="oc-reviews-5a88ccc3"><div class="oc-reviews-6a4c6a4e">'
+                       f'<div class="oc-reviews-eb5d1c1f"><span>{rng.choice(WORDS).title()}</span></div>'
+                       f'<div><div><div><div class="oc-reviews-e3e61235"><span>5</span></div>'
+                       f'<div><span>Dined on {date}</span></div></div></div>'
+                       f'<p class="oc-reviews-2c95ef2c">{text}</p></div></div></div>')
+    pages = ''.join(f'<button>{p}</button>' for p in range(1, REVIEW_PAGES + 1))
+    return (f'<section id="reviews"><div id="reviews-results">{"".join(reviews)}</div>'
+            f'<div id="review-feed-pagination"><div>{pages}</div></div></section>')
+
+
+def restaurant_page(row, rng):
+    parts = []
+
+    # header with review count and price tier
+    parts.append('<section class="_7ee4c0ee"><div class="c3981cf8 _965a91d5">'
+                 f'<span>{escape(row["review_count"])}</span></div>'
+                 f'<div class="c3981cf8 _965a91d5"><span>{escape(row["price_tier"])}</span></div></section>')
+
+    if row['review_count'] != 'No Reviews':
+        sub = ''.join(f'<div class="oc-reviews-9c4a5a4d"><span>{label}</span>'
+                      f'<div class="oc-reviews-15d38b07">{row[key]}</div></div>'
+                      for key, label in [('food', 'Food'), ('service', 'Service'),
+                                         ('ambience', 'Ambience'), ('value', 'Value')])
+        noise = (f'<div class="oc-reviews-dfc07aec"><span class="oc-reviews-624ebf8b">{row["noise"]}</span>'
+                 f'<span>Noise</span></div>') if row['noise'] else '<div class="oc-reviews-dfc07aec"></div>'
+        if row['pct_recommended']:
+            recs = (f'<div class="oc-reviews-dfc07aec"><span>{int(float(row["pct_recommended"]))}%</span> '
+                    f'<span class="oc-reviews-624ebf8b">would recommend it to a friend</span></div>')
+        else:
+            recs = '<div class="oc-reviews-dfc07aec"><span>Be the first to recommend</span></div>'
+        parts.append(f'<section id="ratings"><div class="oc-reviews-491257d8"><span>{row["overall"]}</span></div>'
+                     f'{sub}<div class="oc-reviews-8c8e52a0">{noise}{recs}</div></section>')
+        parts.append(reviews_html(rng, REVIEWS_PER_PAGE))
+
+    # sidebar details
+    details = [('Neighborhood', 'neighborhood'), ('Cuisines', 'cuisines'), ('Dining Style', 'dining_style'),
+               ('Dress code', 'dress_code'), ('Executive Chef', 'chef'), ('Additional', 'tags')]
+    items = ''.join(f'<div class="df8add00"><div class="_5b1e3f4e"><svg></svg></div><div>'
+                    f'<div class="c3981cf8 _965a91d5">{label}</div>'
+                    f'<div class="e7ff71b6 b2f6d1a4">{escape(row[key])}</div></div></div>'
+                    for label, key in details if row[key])
+    parts.append(f'<div class="_1e466fbf">{"".join(items)}</div>')
+
+    # COVID-19 precautions
+    if row['sanitizing'] != '':
+        measures = ''.join(f'<div class="_77b505d0 _965a91d5"><span>{escape(label)}</span>'
+                           f'<ul><li>{" ".join(rng.choice(WORDS) for _ in range(8))}</li></ul></div>'
+                           for key, label in SAFETY_LABELS if float(row[key]) == 1)
+        parts.append(f'<div id="safety-precautions"><h2>Safety precautions</h2>{measures}</div>')
+
+    return page_chrome(row['name'], ''.join(parts))
+
+
+def review_page(row, rng, page):
+    # page 2 starts the day before July 1, 2021, every review one day older than the one above it
+    start = datetime.date(2021, 7, 1) - datetime.timedelta(days = (page - 2) * REVIEWS_PER_PAGE + 1)
+    dates = [(start - datetime.timedelta(days = n)).strftime('%B %-d, %Y') for n in range(REVIEWS_PER_PAGE)]
+    return page_chrome(row['name'], reviews_html(rng, REVIEWS_PER_PAGE, dates))
+
+
+def results_page(rows, rng):
+    cards = []
+    for row in rows:
+        promoted = 'true' if row['promoted'] == '1' else 'false'
+        booked = rng.choice([0, 0, 1, 3, 8, 15, 42])
+        booked_span = (f'<span class="_2VIffaVUDxw_-tEh-6XOB_ _2EluNCOTdgGq9H4SxGZwUg">Booked {booked} times today</span>'
+                       if booked else '')
+        member = '' if row['is_member'] == '1' else '<p class="_1RzTbFM0hmdDgWfT_RmXel">Not available on OpenTable</p>'
+        cards.append(f'<div class="_3uVfVbI1iLfMbszbU6KoOL" data-promoted="{promoted}">'
+                     f'<a class="_1e9PcCDb012hY4BcGfraQB" aria-label="{escape(row["name"])}" href="{escape(row["url"])}">'
+                     f'<img src="/img/{rng.randint(1000, 9999)}.jpg"></a><div class="_2mU9eN3y-wnIETR2zK8Tz6">'
+                     f'<h6>{escape(row["name"])}</h6><span>{escape(row["price_tier"])}</span>'
+                     f'{booked_span}{member}</div></div>')
+    header = (f'<h3 class="_6X5n-Vu8eAbxx_nrEuxjc" data-test="multi-search-total-count">'
+              f'{len(rows)} restaurants available in Manhattan</h3>')
+    return page_chrome('Restaurants in Manhattan', header + ''.join(cards))
+
+
+if __name__ == '__main__':
+    rng = random.Random(20210720)
+    with open(SOURCE, encoding = 'utf-8') as f:
+        rows = list(csv.DictReader(f))
+
+    os.makedirs(FIXTURES, exist_ok = True)
+    with open(os.path.join(FIXTURES, 's.html'), 'w', encoding = 'utf-8') as f:
+        f.write(results_page(rows, rng))
+    for row in rows:
+        os.makedirs(os.path.dirname(fixture_path(row['url'])), exist_ok = True)
+        with open(fixture_path(row['url']), 'w', encoding = 'utf-8') as f:
+            f.write(restaurant_page(row, rng))
+
+    # separate generator, so adding review pages leaves the pages above unchanged
+    rng = random.Random(20210721)
+    reviewed = [row for row in rows if row['review_count'] != 'No Reviews']
+    for row in reviewed:
+        for page in range(2, REVIEW_PAGES + 1):
+            with open(fixture_path(row['url'])[:-len('.html')] + f'.page{page}.html', 'w', encoding = 'utf-8') as f:
+                f.write(review_page(row, rng, page))
+
+    print(f'wrote {len(rows)} restaurant pages, {len(reviewed) * (REVIEW_PAGES - 1)} review pages and 1 results page '
+          f'to {FIXTURES}')
@@ -0,0 +1,126 @@
+"""
+results: machine-readable benchmark results, one json file per commit in benchmarks/results, so a regression can be
+traced to the commit that introduced it
+
+Every benchmark run with --save adds its metrics to results/<commit>.json (commit is 'git rev-parse --short HEAD',
+with '-dirty' if the tree has uncommitted changes):
+    {"commit": "7555539", "benchmarks": {"extract": {"time": ..., "python": ..., "config": {...},
+                                                      "metrics": {"restaurant_pages_per_sec": 412.3, ...}}}}
+
+usage:
+    python results.py <old commit> <new commit> [--threshold 0.05]
+        prints every metric of both commits and flags the changes for the worse by more than threshold
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(HERE, 'results')
+
+
+def percentile(values, q):
+    # nearest-rank percentile, q in [0, 100]
+    values = sorted(values)
+    if not values:
+        return None
+    return values[max(0, math.ceil(q / 100 * len(values)) - 1)]
+
+
+def latency_metrics(seconds, prefix = ''):
+    # p50/p95 in milliseconds of a list of durations in seconds
+    return {f'{prefix}p50_ms': round(1000 * percentile(seconds, 50), 3),
+            f'{prefix}p95_ms': round(1000 * percentile(seconds, 95), 3)}
+
+
+def peak_rss_mb(who = resource.RUSAGE_SELF):
+    # peak resident set size of this process (RUSAGE_SELF) or of its largest finished child process
+    peak = resource.getrusage(who).ru_maxrss
+    # kilobytes on linux, bytes on macos
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd = HERE, capture_output = True,
+                                text = True, check = True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd = HERE,
+                               capture_output = True, text = True, check = True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return commit + ('-dirty' if dirty else '')
+
+
+def save(benchmark, metrics, config = None):
+    """
+    save: adds the metrics of one benchmark to results/<commit>.json, replacing that benchmark's earlier results for
+        the same commit
+
+    args:
+        benchmark: string, e.g. 'extract' or 'scraper_http'
+        metrics: dict of metric name -> number. Names ending in '_per_sec' or 'speedup' are better when higher, every
+            other metric (latencies, memory, failures) is better when lower
+        config: dict of the settings the benchmark ran with
+
+    output:
+        path: string, the results file
+    """
+    commit = git_commit()
+    os.makedirs(RESULTS_DIR, exist_ok = True)
+    path = os.path.join(RESULTS_DIR, f'{commit}.json')
+    data = load(path) if os.path.exists(path) else {'commit': commit, 'benchmarks': {}}
+    data['benchmarks'][benchmark] = {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+                                     'config': config or {}, 'metrics': metrics}
+    with open(path + '.tmp', 'w', encoding = 'utf-8') as f:
+        json.dump(data, f, indent = 2, sort_keys = True)
+    os.replace(path + '.tmp', path)
+    return path
+
+
+def load(commit_or_path):
+    path = commit_or_path if commit_or_path.endswith('.json') else os.path.join(RESULTS_DIR, f'{commit_or_path}.json')
+    with open(path, encoding = 'utf-8') as f:
+        return json.load(f)
+
+
+def higher_is_better(metric):
+    return metric.endswith('_per_sec') or metric.endswith('speedup')
+
+
+def compare(old, new, threshold = 0.05):
+    """
+    compare: list of (benchmark, metric, old value, new value, relative change, regressed) for every metric in both
+        results, regressed is True when the new value is worse by more than threshold
+    """
+    rows = []
+    for benchmark, result in new['benchmarks'].items():
+        before = old['benchmarks'].get(benchmark, {}).get('metrics', {})
+        for metric, value in result['metrics'].items():
+            if metric not in before or not isinstance(value, (int, float)) or not before[metric]:
+                continue
+            change = (value - before[metric]) / abs(before[metric])
+            worse = -change if higher_is_better(metric) else change
+            rows.append((benchmark, metric, before[metric], value, change, worse > threshold))
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'compare the saved benchmark results of two commits')
+    parser.add_argument('old')
+    parser.add_argument('new')
+    parser.add_argument('--threshold', type = float, default = 0.05)
+    args = parser.parse_args()
+
+    rows = compare(load(args.old), load(args.new), args.threshold)
+    for benchmark, metric, before, after, change, regressed in rows:
+        flag = '  REGRESSION' if regressed else ''
+        print(f'{benchmark:<16}{metric:<32}{before:>12.6g}{after:>12.6g}{change:>+9.1%}{flag}')
+    regressions = sum(row[-1] for row in rows)
+    print(f'{len(rows)} metrics compared, {regressions} regressed by more than {args.threshold:.0%}')
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,123 @@
+"""
+standin_server: a local HTTP stand-in for opentable.com that serves saved pages with artificial latency and errors, so
+the scrapers can be run and timed without touching the real site
+
+usage:
+    python standin_server.py <pages_dir> --port 8000 --latency 0.5 --error-rate 0.05
+
+    or from python:
+        server, base_url = start_standin('saved_pages', latency = 0.5, error_rate = 0.05)
+        ...
+        server.shutdown()
+
+    and point the scrapers at it with OPENTABLE_BASE_URL=<base_url> (see scraper/urls.py)
+
+Requests are mapped to files in pages_dir by path, ignoring the query string except for the page of reviews:
+    /r/seaport-house-new-york         ->  <pages_dir>/r/seaport-house-new-york.html
+    /r/seaport-house-new-york?page=3  ->  <pages_dir>/r/seaport-house-new-york.page3.html if it exists
+    /s?...&page=2                     ->  <pages_dir>/s.html
+
+Links to https://www.opentable.com in the served pages are rewritten to the stand-in's own address, so the scrapers
+follow restaurant links back to it.
+"""
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+import argparse
+import os
+import random
+import threading
+import time
+
+SITE = b'https://www.opentable.com'
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    pages_dir = '.'
+    latency = 0.0
+    error_rate = 0.0
+    base_url = b''
+    random = random.Random(0)
+    # requests answered, by status code, shared by every handler of a server
+    counts = None
+    counts_lock = threading.Lock()
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        if self.error_rate and self.random.random() < self.error_rate:
+            self._count(503)
+            self.send_error(503)
+            return
+
+        parts = urlsplit(self.path)
+        path = parts.path.strip('/') or 'index'
+        filename = os.path.normpath(os.path.join(self.pages_dir, path + '.html'))
+        page = parse_qs(parts.query).get('page', [None])[0]
+        if page is not None and page.isdigit() and os.path.isfile(filename[:-len('.html')] + f'.page{page}.html'):
+            filename = filename[:-len('.html')] + f'.page{page}.html'
+
+        # don't serve anything outside pages_dir, a sibling directory sharing its name as a prefix included
+        root = os.path.abspath(self.pages_dir)
+        if os.path.commonpath([filename, root]) != root or not os.path.isfile(filename):
+            self._count(404)
+            self.send_error(404)
+            return
+
+        with open(filename, 'rb') as f:
+            body = f.read()
+        if self.base_url:
+            body = body.replace(SITE, self.base_url)
+        self._count(200)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _count(self, status):
+        with self.counts_lock:
+            self.counts[status] = self.counts.get(status, 0) + 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_standin(pages_dir, latency=0.0, port=0, error_rate=0.0, seed=0):
+    """
+    start_standin: starts the stand-in server on a background thread
+
+    args:
+        pages_dir: string, directory of saved .html pages
+        latency: float, seconds to wait before answering each request
+        port: int, port to listen on, 0 picks a free one
+        error_rate: float, fraction of requests answered with a 503 instead of the page
+        seed: int, seed of the random choice of failed requests, so a run can be repeated
+
+    output:
+        (server, base_url): the running ThreadingHTTPServer and its 'http://127.0.0.1:<port>' url.
+            server.RequestHandlerClass.counts is a dict of status code -> requests answered
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', port), StandinHandler)
+    base_url = f'http://127.0.0.1:{server.server_address[1]}'
+    server.RequestHandlerClass = type('Handler', (StandinHandler,), {
+        'pages_dir': os.path.abspath(pages_dir), 'latency': latency, 'error_rate': error_rate,
+        'base_url': base_url.encode(), 'random': random.Random(seed), 'counts': {}, 'counts_lock': threading.Lock()})
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, base_url
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='serve saved OpenTable pages locally')
+    parser.add_argument('pages_dir')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    server, base_url = start_standin(args.pages_dir, args.latency, args.port, args.error_rate)
+    print(f'serving {args.pages_dir} at {base_url}')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,305 @@
+"""
+aggregates: running bookings aggregates kept next to a BookingsStore (see bookings_store.py), so the analysis reads
+per-restaurant and per-group average bookings instead of re-merging the restaurant csv with the whole bookings history
+and recomputing every mean.
+
+Per restaurant: total bookings, number of days with data and their mean, the avg_bookings of the analysis notebook.
+Per group of restaurants: the same sums over the restaurants of each promoted, precautions, price_tier, borough and
+primary_cuisine value, plus the sum and sum of squares of the restaurant means for the group's mean and spread.
+
+Both are updated in O(new rows): sqlite triggers on the bookings table add every new row to its restaurant's totals
+in the transaction that stores it, whichever code appends the day, and only the restaurants touched since the last
+read are moved between group totals.
+
+usage:
+    store = BookingsStore('bookings.db')
+    aggregates = BookingAggregates(store)
+    aggregates.load_restaurants('restaurants_data/nyc_restaurants_clean.csv')
+    store.ingest_csv('bookings_manhattan_2021-07-24.csv')     # aggregates follow, nothing else to call
+    aggregates.groups('promoted')
+
+    python aggregates.py bookings.db [--restaurants nyc_restaurants_clean.csv] [--dimension promoted ...]
+"""
+import argparse
+import csv
+import json
+import math
+import sqlite3
+
+
+# restaurant columns of the clean csv restaurants are grouped by, borough comes from the bookings
+ATTRIBUTES = ('promoted', 'precautions', 'price_tier', 'primary_cuisine')
+DIMENSIONS = ('all',) + ATTRIBUTES + ('borough',)
+
+# a restaurant listed in several boroughs on the same day shows the same count in each, its day counts once with the
+# largest count, the rule of BookingsStore.average_bookings(). Its borough is the first in alphabetical order
+_OTHER_BOROUGHS = """FROM bookings WHERE restaurant_id = NEW.restaurant_id AND date = NEW.date
+                     AND borough != NEW.borough"""
+
+SCHEMA = f"""
+    CREATE TABLE IF NOT EXISTS restaurant_totals (
+        restaurant_id INTEGER PRIMARY KEY,
+        borough TEXT NOT NULL,
+        bookings INTEGER NOT NULL,
+        days INTEGER NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS restaurant_attributes (
+        restaurant_id INTEGER PRIMARY KEY,
+        promoted TEXT,
+        precautions TEXT,
+        price_tier TEXT,
+        primary_cuisine TEXT
+    );
+    CREATE TABLE IF NOT EXISTS group_totals (
+        dimension TEXT NOT NULL,
+        value TEXT NOT NULL,
+        restaurants INTEGER NOT NULL,
+        booked INTEGER NOT NULL,
+        mean_sum REAL NOT NULL,
+        mean_sumsq REAL NOT NULL,
+        bookings INTEGER NOT NULL,
+        days INTEGER NOT NULL,
+        PRIMARY KEY (dimension, value)
+    );
+    -- the groups and totals each restaurant is currently counted in group_totals with
+    CREATE TABLE IF NOT EXISTS counted (
+        restaurant_id INTEGER PRIMARY KEY,
+        groups TEXT NOT NULL,
+        bookings INTEGER NOT NULL,
+        days INTEGER NOT NULL
+    );
+    -- restaurants whose totals or attributes changed since group_totals was last brought up to date
+    CREATE TABLE IF NOT EXISTS dirty (
+        restaurant_id INTEGER PRIMARY KEY
+    );
+    CREATE TRIGGER IF NOT EXISTS bookings_aggregates AFTER INSERT ON bookings BEGIN
+        INSERT OR IGNORE INTO restaurant_totals VALUES (NEW.restaurant_id, NEW.borough, 0, 0);
+        UPDATE restaurant_totals SET
+            borough = MIN(borough, NEW.borough),
+            bookings = bookings + MAX(0, NEW.bookings - COALESCE((SELECT MAX(bookings) {_OTHER_BOROUGHS}), 0)),
+            days = days + NOT EXISTS (SELECT 1 {_OTHER_BOROUGHS})
+            WHERE restaurant_id = NEW.restaurant_id;
+        INSERT OR IGNORE INTO dirty VALUES (NEW.restaurant_id);
+    END;
+"""
+
+
+def _normalize(column, value):
+    # attribute values as group names: True/False for promoted whether written TRUE, True or 1, '' as missing
+    if value is None or value == '':
+        return None
+    if column == 'promoted':
+        return 'True' if value.strip().upper() in ('TRUE', '1', '1.0') else 'False'
+    if column in ('precautions', 'price_tier'):
+        return str(int(float(value)))
+    return value
+
+
+class BookingAggregates:
+    """
+    BookingAggregates: materialized bookings aggregates in the sqlite file of a BookingsStore. Creating it on a
+        store that already holds bookings computes the totals once, after that the store's own inserts keep them
+        current.
+
+    args:
+        store: BookingsStore, its path and restaurant ids are used
+
+    Bookings are only ever added to a store, the aggregates rely on it: rows deleted or changed by hand need a
+    rebuild(). Group totals of restaurants touched by new bookings are brought up to date on the next read, or by
+    refresh(). Only use from one thread, like the store.
+    """
+
+    def __init__(self, store):
+        self.path = store.path
+        self.ids = store.ids
+        self._db = sqlite3.connect(store.path)
+        new = self._db.execute("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'bookings_aggregates'").fetchone() is None
+        self._db.executescript(SCHEMA)
+        self._db.commit()
+        if new:
+            self.rebuild()
+
+    def rebuild(self):
+        """
+        rebuild: recomputes every aggregate from the bookings table, for a store filled before the aggregates existed
+            or changed other than by appending
+        """
+        with self._db:
+            for table in ('restaurant_totals', 'group_totals', 'counted', 'dirty'):
+                self._db.execute(f'DELETE FROM {table}')
+            self._db.execute("""INSERT INTO restaurant_totals
+                                SELECT restaurant_id, MIN(borough), SUM(bookings), COUNT(*) FROM (
+                                    SELECT restaurant_id, MIN(borough) AS borough, MAX(bookings) AS bookings
+                                    FROM bookings GROUP BY restaurant_id, date)
+                                GROUP BY restaurant_id""")
+            self._db.execute("""INSERT INTO dirty SELECT restaurant_id FROM restaurant_totals
+                                UNION SELECT restaurant_id FROM restaurant_attributes""")
+        self.refresh()
+
+    def load_restaurants(self, path):
+        """
+        load_restaurants: sets the group attributes (promoted, precautions, price_tier, primary_cuisine) of every
+            restaurant in a clean restaurant csv, e.g. restaurants_data/nyc_restaurants_clean.csv. Only restaurants
+            with attributes are counted in the group aggregates, restaurants already loaded keep their groups unless
+            the csv changes them. A restaurant_id column, if the csv has one, is used as is and must come from the
+            store's index (see BookingsStore)
+
+        output:
+            changed: int, number of restaurants added or moved to another group
+        """
+        with open(path, encoding = 'utf-8', newline = '') as csvfile:
+            rows = [row for row in csv.DictReader(csvfile)]
+        attributes = {}
+        urls = [row['url'] for row in rows]
+        if rows and 'restaurant_id' in rows[0]:
+            restaurant_ids = self.ids.check(urls, [row['restaurant_id'] for row in rows])
+        else:
+            restaurant_ids = self.ids.intern_many(urls)
+        for restaurant_id, row in zip(restaurant_ids, rows):
+            # the first row of a restaurant listed twice wins, as in the cleaning
+            attributes.setdefault(restaurant_id, tuple(_normalize(column, row[column]) for column in ATTRIBUTES))
+
+        stored = {row[0]: tuple(row[1:]) for row in self._db.execute('SELECT * FROM restaurant_attributes')}
+        changed = [(restaurant_id,) + values for restaurant_id, values in attributes.items()
+                   if stored.get(restaurant_id) != values]
+        with self._db:
+            self._db.executemany('INSERT OR REPLACE INTO restaurant_attributes VALUES (?, ?, ?, ?, ?)', changed)
+            self._db.executemany('INSERT OR IGNORE INTO dirty VALUES (?)', [row[:1] for row in changed])
+        return len(changed)
+
+    def refresh(self):
+        """
+        refresh: moves the restaurants whose bookings or attributes changed since the last refresh into their current
+            group totals, called by every read
+
+        output:
+            refreshed: int, number of restaurants updated
+        """
+        rows = self._db.execute(f"""SELECT d.restaurant_id, t.borough, t.bookings, t.days, c.groups, c.bookings, c.days,
+                                           {', '.join('a.' + column for column in ATTRIBUTES)}, a.restaurant_id
+                                    FROM dirty AS d
+                                    LEFT JOIN restaurant_totals AS t USING (restaurant_id)
+                                    LEFT JOIN counted AS c USING (restaurant_id)
+                                    LEFT JOIN restaurant_attributes AS a USING (restaurant_id)""").fetchall()
+        if not rows:
+            return 0
+
+        deltas = {}
+        counted = []
+        uncounted = []
+
+        def add(groups, bookings, days, sign):
+            mean = bookings / days if days else 0.0
+            for group in groups.items():
+                delta = deltas.setdefault(group, [0, 0, 0.0, 0.0, 0, 0])
+                delta[0] += sign
+                delta[1] += sign * (days > 0)
+                delta[2] += sign * mean
+                delta[3] += sign * mean * mean
+                delta[4] += sign * bookings
+                delta[5] += sign * days
+
+        for restaurant_id, borough, bookings, days, old_groups, old_bookings, old_days, *attributes, has_attributes in rows:
+            if old_groups is not None:
+                add(json.loads(old_groups), old_bookings, old_days, -1)
+            if has_attributes is None:
+                uncounted.append((restaurant_id,))
+                continue
+            groups = {'all': 'all'}
+            groups.update((column, value) for column, value in zip(ATTRIBUTES, attributes) if value is not None)
+            if borough is not None:
+                groups['borough'] = borough
+            add(groups, bookings or 0, days or 0, 1)
+            counted.append((restaurant_id, json.dumps(groups), bookings or 0, days or 0))
+
+        with self._db:
+            self._db.executemany("""INSERT INTO group_totals VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                                    ON CONFLICT (dimension, value) DO UPDATE SET
+                                        restaurants = restaurants + excluded.restaurants, booked = booked + excluded.booked,
+                                        mean_sum = mean_sum + excluded.mean_sum, mean_sumsq = mean_sumsq + excluded.mean_sumsq,
+                                        bookings = bookings + excluded.bookings, days = days + excluded.days""",
+                                 [group + tuple(delta) for group, delta in deltas.items() if any(delta)])
+            self._db.execute('DELETE FROM group_totals WHERE restaurants = 0')
+            self._db.executemany('INSERT OR REPLACE INTO counted VALUES (?, ?, ?, ?)', counted)
+            self._db.executemany('DELETE FROM counted WHERE restaurant_id = ?', uncounted)
+            self._db.execute('DELETE FROM dirty')
+        return len(rows)
+
+    def restaurants(self):
+        """
+        restaurants: dict of restaurant id -> (total bookings, days with data, mean bookings) over the whole history,
+            self.ids.url() gives the restaurant url of an id
+        """
+        return {restaurant_id: (bookings, days, bookings / days)
+                for restaurant_id, bookings, days in self._db.execute('SELECT restaurant_id, bookings, days FROM restaurant_totals')}
+
+    def restaurant(self, url):
+        """
+        restaurant: (total bookings, days with data, mean bookings) of one restaurant, None if it has no bookings
+        """
+        row = self._db.execute('SELECT bookings, days FROM restaurant_totals WHERE restaurant_id = ?',
+                               (self.ids.get(url),)).fetchone()
+        return None if row is None else (row[0], row[1], row[0] / row[1])
+
+    def groups(self, dimension):
+        """
+        groups: aggregates of every group of one dimension
+
+        args:
+            dimension: string, one of DIMENSIONS. 'all' has the single group 'all'
+
+        output:
+            groups: list of dicts sorted by value, with keys
+                value: string, e.g. 'True' for promoted, '2' for price_tier, 'manhattan' for borough
+                restaurants: int, restaurants in the group. borough groups only hold restaurants with bookings
+                booked: int, restaurants in the group with at least one day of bookings
+                avg_bookings: float, mean of the restaurants' mean bookings, restaurants without bookings counted
+                    as 0 as in the analysis notebook
+                avg_bookings_booked: float, the same over booked restaurants only, None if there are none
+                std: float, sample standard deviation of the restaurants' mean bookings (0 for no bookings), None
+                    for a group of one
+                bookings: int, total bookings of the group's restaurants
+                days: int, restaurant days with data
+        """
+        if dimension not in DIMENSIONS:
+            raise ValueError(f'dimension must be one of {DIMENSIONS}')
+        self.refresh()
+        out = []
+        for value, n, booked, mean_sum, mean_sumsq, bookings, days in self._db.execute(
+                'SELECT value, restaurants, booked, mean_sum, mean_sumsq, bookings, days FROM group_totals WHERE dimension = ?',
+                (dimension,)):
+            mean = mean_sum / n
+            # running sums pick up rounding error, clamp the variance at 0
+            std = math.sqrt(max(0.0, (mean_sumsq - n * mean * mean) / (n - 1))) if n > 1 else None
+            out.append({'value': value, 'restaurants': n, 'booked': booked, 'avg_bookings': mean,
+                        'avg_bookings_booked': mean_sum / booked if booked else None, 'std': std,
+                        'bookings': bookings, 'days': days})
+        numeric = dimension in ('precautions', 'price_tier')
+        out.sort(key = lambda group: int(group['value']) if numeric else group['value'])
+        return out
+
+    def close(self):
+        self._db.close()
+
+
+if __name__ == '__main__':
+    from bookings_store import BookingsStore
+
+    parser = argparse.ArgumentParser(description = 'average bookings by restaurant group from the aggregates of a bookings store')
+    parser.add_argument('store')
+    parser.add_argument('--restaurants', help = 'clean restaurant csv to load the group attributes from')
+    parser.add_argument('--dimension', nargs = '+', choices = DIMENSIONS, default = list(DIMENSIONS))
+    args = parser.parse_args()
+
+    store = BookingsStore(args.store)
+    aggregates = BookingAggregates(store)
+    if args.restaurants:
+        print(f'{aggregates.load_restaurants(args.restaurants)} restaurants added or regrouped')
+    for dimension in args.dimension:
+        print(dimension)
+        for group in aggregates.groups(dimension):
+            std = f"{group['std']:8.2f}" if group['std'] is not None else f"{'':8}"
+            print(f"  {group['value'][:24]:<24}{group['restaurants']:6d} restaurants {group['booked']:6d} booked "
+                  f"{group['avg_bookings']:8.2f} avg bookings {std} std")
+    aggregates.close()
+    store.close()
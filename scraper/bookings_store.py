@@ -0,0 +1,185 @@
+import csv
+import datetime
+import glob
+import os
+import re
+import sqlite3
+from restaurant_ids import get_ids
+
+
+# bookings_<borough>_<date>.csv as written by bookings_today(), borough names may contain '_'
+RAW_FILE = re.compile(r'bookings_(?P<borough>[a-z_]+)_(?P<date>\d{4}-\d{2}-\d{2})\.csv$')
+
+
+def normalize_date(date):
+    """
+    normalize_date: 'YYYY-mm-dd' for a date written as 'YYYY-mm-dd' or 'm/d/YYYY' (the format spreadsheet software
+        left in the total_bookings csv headers)
+    """
+    date = date.strip()
+    for fmt in ('%Y-%m-%d', '%m/%d/%Y'):
+        try:
+            return datetime.datetime.strptime(date, fmt).strftime('%Y-%m-%d')
+        except ValueError:
+            pass
+    raise ValueError(f'unrecognized date {date!r}')
+
+
+class BookingsStore:
+    """
+    BookingsStore: sqlite time series of daily bookings in long format, one row per (restaurant, date, borough),
+        replacing the wide total_bookings csv that gained a column every day. Restaurants are identified by their
+        integer id in a RestaurantIds index (see restaurant_ids.py) kept in the store's own sqlite file, so the ids
+        of a store mean the same wherever it is opened from. The scrapers given a store_path write their csv files
+        with this index, and ingest_csv() stores their restaurant_id column as is.
+
+    args:
+        path: string, sqlite file, created if needed
+        ids: RestaurantIds, get_ids(path) by default. An index in another file is refused
+
+    Days are only ever appended: adding a (restaurant, date, borough) that is already stored keeps the stored value,
+    so ingesting the same file twice is harmless. When a restaurant shows up twice in one day's results the first
+    row wins, the same rule bookings_all_boroughs() uses.
+    """
+
+    def __init__(self, path, ids = None):
+        self.path = path
+        if ids is not None and os.path.abspath(ids.path) != os.path.abspath(path):
+            raise ValueError(f'the restaurant ids of a bookings store are kept in its own file {path}, not {ids.path}')
+        self.ids = ids if ids is not None else get_ids(path)
+        self._db = sqlite3.connect(path)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS bookings (
+                restaurant_id INTEGER NOT NULL,
+                date TEXT NOT NULL,
+                borough TEXT NOT NULL,
+                bookings INTEGER NOT NULL,
+                PRIMARY KEY (restaurant_id, date, borough)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS bookings_date ON bookings (date, restaurant_id, bookings);
+        """)
+        self._db.commit()
+        # a store whose bookings were keyed on an index in another file can't be joined to restaurants, don't add to
+        # it. Ids are handed out in order, so its largest restaurant id is missing from the restaurants table
+        unknown = self._db.execute('SELECT (SELECT MAX(restaurant_id) FROM bookings) > (SELECT COALESCE(MAX(id), 0) FROM restaurants)').fetchone()[0]
+        if unknown:
+            raise ValueError(f'{path} has bookings of restaurants missing from its restaurants table, they were stored '
+                             'with a separate restaurant id index')
+
+    def add_day(self, date, rows):
+        """
+        add_day: appends one day of bookings
+
+        args:
+            date: string, 'YYYY-mm-dd' or 'm/d/YYYY'
+            rows: iterable of (url, borough, bookings), any url variant of a restaurant
+
+        output:
+            added: int, number of rows stored, rows already in the store are not counted
+        """
+        rows = list(rows)
+        return self._add(date, self.ids.intern_many([row[0] for row in rows]), rows)
+
+    def _add(self, date, restaurant_ids, rows):
+        # rows of (url, borough, bookings) with the id of each restaurant
+        date = normalize_date(date)
+        first = {}
+        for restaurant_id, (url, borough, bookings) in zip(restaurant_ids, rows):
+            first.setdefault((restaurant_id, borough), int(float(bookings)))
+        with self._db:
+            # rowcount leaves out rows written by triggers on the table, such as those of aggregates.py
+            return self._db.executemany('INSERT OR IGNORE INTO bookings VALUES (?, ?, ?, ?)',
+                                        [(restaurant_id, date, borough, bookings)
+                                         for (restaurant_id, borough), bookings in first.items()]).rowcount
+
+    def ingest_csv(self, path, borough = None):
+        """
+        ingest_csv: appends a bookings csv. Reads the per-borough files of bookings_today() (header 'url', <date>,
+            with a 'name' or 'restaurant_id' column; borough taken from the file name unless given) and the combined
+            files of bookings_all_boroughs() (header 'url', 'restaurant_id', 'borough', <date>). The restaurant_id
+            column is stored as is, a ValueError is raised if the file was written with an index other than the
+            store's. Files without one are added by url
+
+        output:
+            added: int, number of rows stored
+        """
+        with open(path, encoding = 'utf-8', newline = '') as csvfile:
+            reader = csv.reader(csvfile)
+            header = next(reader)
+            lines = [row for row in reader if row and row[-1] != '']
+        date = header[-1]
+        if 'borough' in header:
+            column = header.index('borough')
+            rows = [(row[0], row[column], row[-1]) for row in lines]
+        else:
+            if borough is None:
+                match = RAW_FILE.search(os.path.basename(path))
+                if match is None:
+                    raise ValueError(f'no borough column in {path} and none in its name, pass borough')
+                borough = match.group('borough')
+            rows = [(row[0], borough, row[-1]) for row in lines]
+        if 'restaurant_id' not in header:
+            return self.add_day(date, rows)
+        column = header.index('restaurant_id')
+        return self._add(date, self.ids.check([row[0] for row in lines], [row[column] for row in lines]), rows)
+
+    def import_raw(self, directory):
+        """
+        import_raw: appends every bookings_<borough>_<date>.csv in directory, e.g. bookings_data_raw/
+
+        output:
+            added: int, number of rows stored
+        """
+        added = 0
+        for path in sorted(glob.glob(os.path.join(directory, 'bookings_*.csv'))):
+            if RAW_FILE.search(os.path.basename(path)):
+                added += self.ingest_csv(path)
+        return added
+
+    def dates(self):
+        """
+        dates: list of the dates in the store, oldest first
+        """
+        return [date for (date,) in self._db.execute('SELECT DISTINCT date FROM bookings ORDER BY date')]
+
+    def average_bookings(self, days = None, end = None, start = None):
+        """
+        average_bookings: mean daily bookings of every restaurant over a date range, averaged over the days the
+            restaurant appeared in the results (days it is missing count as no data, not as 0)
+
+        args:
+            days: int, use the last `days` dates in the store up to end. Ignored if start is given
+            end: string, last date of the range, latest date in the store by default
+            start: string, first date of the range
+
+        output:
+            averages: dict of restaurant id -> (mean bookings, number of days with data), self.ids.url() gives the
+            restaurant url of an id
+        """
+        end = normalize_date(end) if end is not None else '9999-12-31'
+        if start is not None:
+            start = normalize_date(start)
+        elif days is not None:
+            row = self._db.execute('SELECT MIN(date) FROM (SELECT DISTINCT date FROM bookings WHERE date <= ? ORDER BY date DESC LIMIT ?)',
+                                   (end, days)).fetchone()
+            start = row[0] or end
+        else:
+            start = '0000-01-01'
+
+        # a restaurant listed in two boroughs on the same day shows the same count in both, count it once
+        rows = self._db.execute("""SELECT restaurant_id, AVG(bookings), COUNT(*) FROM (
+                                       SELECT restaurant_id, date, MAX(bookings) AS bookings FROM bookings
+                                       WHERE date BETWEEN ? AND ? GROUP BY restaurant_id, date)
+                                   GROUP BY restaurant_id""", (start, end))
+        return {restaurant_id: (mean, n) for restaurant_id, mean, n in rows}
+
+    def history(self, url):
+        """
+        history: list of (date, borough, bookings) of one restaurant, oldest first
+        """
+        restaurant_id = self.ids.get(url)
+        return self._db.execute('SELECT date, borough, bookings FROM bookings WHERE restaurant_id = ? ORDER BY date',
+                                (restaurant_id,)).fetchall()
+
+    def close(self):
+        self._db.close()
@@ -0,0 +1,200 @@
+import json
+import sqlite3
+import time
+
+
+class CrawlJournal:
+    """
+    CrawlJournal: sqlite record of a crawl, so a crawl that stops partway can be restarted without redoing
+        finished work. Every search results page and every restaurant on it is stored with a status of
+        'pending', 'done' or 'failed', and each restaurant keeps its extracted record.
+
+    args:
+        path: string, sqlite file, created if needed. One journal can hold any number of (borough, date) crawls
+
+    Only use a journal from one thread, the crawl functions write to it from the main thread as workers finish.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._db = sqlite3.connect(path)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS crawls (
+                borough TEXT NOT NULL,
+                date TEXT NOT NULL,
+                num_pages INTEGER NOT NULL,
+                PRIMARY KEY (borough, date)
+            );
+            CREATE TABLE IF NOT EXISTS pages (
+                borough TEXT NOT NULL,
+                date TEXT NOT NULL,
+                page INTEGER NOT NULL,
+                url TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt REAL NOT NULL DEFAULT 0,
+                last_error TEXT,
+                PRIMARY KEY (borough, date, page)
+            );
+            CREATE TABLE IF NOT EXISTS restaurants (
+                borough TEXT NOT NULL,
+                date TEXT NOT NULL,
+                page INTEGER NOT NULL,
+                position INTEGER NOT NULL,
+                url TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt REAL NOT NULL DEFAULT 0,
+                last_error TEXT,
+                record TEXT NOT NULL,
+                PRIMARY KEY (borough, date, page, position)
+            );
+            CREATE INDEX IF NOT EXISTS restaurants_status ON restaurants (borough, date, status);
+        """)
+        self._db.commit()
+
+    def page_count(self, borough, date):
+        """
+        page_count: number of results pages recorded for the crawl, None if the front page hasn't been read yet
+            (see begin())
+        """
+        row = self._db.execute('SELECT num_pages FROM crawls WHERE borough = ? AND date = ?', (borough, date)).fetchone()
+        return None if row is None else row[0]
+
+    def begin(self, borough, date, front_url):
+        """
+        begin: adds the front page (results page 1) as pending before the number of pages is known, so it is fetched
+            and retried like any other page. Does nothing if the page is already in the journal
+        """
+        with self._db:
+            self._db.execute("INSERT OR IGNORE INTO pages (borough, date, page, url, status) VALUES (?, ?, 1, ?, 'pending')",
+                             (borough, date, front_url))
+
+    def start(self, borough, date, page_urls):
+        """
+        start: records the number of results pages and adds each page as pending. Pages already in the journal
+            keep their status
+
+        args:
+            page_urls: list of results page urls, page 1 first
+        """
+        with self._db:
+            self._db.execute('INSERT OR REPLACE INTO crawls VALUES (?, ?, ?)', (borough, date, len(page_urls)))
+            self._db.executemany("INSERT OR IGNORE INTO pages (borough, date, page, url, status) VALUES (?, ?, ?, ?, 'pending')",
+                                 [(borough, date, i, url) for i, url in enumerate(page_urls, start = 1)])
+
+    def pages_to_fetch(self, borough, date, max_attempts):
+        """
+        pages_to_fetch: list of (page, url) for results pages that are pending, or failed fewer than max_attempts
+            times and past their backoff
+        """
+        return self._db.execute("""SELECT page, url FROM pages WHERE borough = ? AND date = ? AND status != 'done'
+                                   AND attempts < ? AND next_attempt <= ? ORDER BY page""",
+                                (borough, date, max_attempts, time.time())).fetchall()
+
+    def page_done(self, borough, date, page, records, carried = ()):
+        """
+        page_done: marks a results page done and adds the restaurants found on it, in page order. Restaurants that
+            don't need a restaurant page fetch (non-members, and the positions in carried) are added as done
+
+        args:
+            records: list of restaurant dicts from the results page cards
+            carried: positions in records already filled in from an earlier crawl (see snapshots.py)
+        """
+        with self._db:
+            self._db.execute('DELETE FROM restaurants WHERE borough = ? AND date = ? AND page = ?', (borough, date, page))
+            self._db.executemany('INSERT INTO restaurants (borough, date, page, position, url, status, record) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                 [(borough, date, page, position, record['url'],
+                                   'pending' if record['is_member'] == 1 and position not in carried else 'done',
+                                   json.dumps(record))
+                                  for position, record in enumerate(records)])
+            self._db.execute("UPDATE pages SET status = 'done', last_error = NULL WHERE borough = ? AND date = ? AND page = ?",
+                             (borough, date, page))
+
+    def page_failed(self, borough, date, page, error, backoff):
+        """
+        page_failed: marks a results page failed, it can be retried after backoff * 2**(previous attempts) seconds
+        """
+        self._fail('pages', 'borough = ? AND date = ? AND page = ?', (borough, date, page), error, backoff)
+
+    def restaurants_to_fetch(self, borough, date, max_attempts):
+        """
+        restaurants_to_fetch: list of (page, position, record) for restaurants that are pending, or failed fewer
+            than max_attempts times and past their backoff, in page order
+        """
+        rows = self._db.execute("""SELECT page, position, record FROM restaurants WHERE borough = ? AND date = ?
+                                   AND status != 'done' AND attempts < ? AND next_attempt <= ? ORDER BY page, position""",
+                                (borough, date, max_attempts, time.time())).fetchall()
+        return [(page, position, json.loads(record)) for page, position, record in rows]
+
+    def restaurant_done(self, borough, date, page, position, record):
+        """
+        restaurant_done: stores the extracted record of a restaurant and marks it done
+        """
+        with self._db:
+            self._db.execute("""UPDATE restaurants SET status = 'done', record = ?, last_error = NULL
+                                WHERE borough = ? AND date = ? AND page = ? AND position = ?""",
+                             (json.dumps(record), borough, date, page, position))
+
+    def restaurant_failed(self, borough, date, page, position, error, backoff):
+        """
+        restaurant_failed: marks a restaurant failed, it can be retried after backoff * 2**(previous attempts) seconds
+        """
+        self._fail('restaurants', 'borough = ? AND date = ? AND page = ? AND position = ?', (borough, date, page, position),
+                   error, backoff)
+
+    def _fail(self, table, where, params, error, backoff):
+        # exponential backoff: backoff, 2 * backoff, 4 * backoff, ... after the 1st, 2nd, 3rd failure
+        with self._db:
+            self._db.execute(f"""UPDATE {table} SET status = 'failed', last_error = ?,
+                                 next_attempt = ? + ? * (1 << attempts), attempts = attempts + 1 WHERE {where}""",
+                             (repr(error), time.time(), backoff) + params)
+
+    def retry_failed(self, borough, date):
+        """
+        retry_failed: gives every failed page and restaurant of the crawl a fresh set of attempts, called when a
+            crawl is restarted
+        """
+        with self._db:
+            for table in ('pages', 'restaurants'):
+                self._db.execute(f"UPDATE {table} SET attempts = 0, next_attempt = 0 WHERE borough = ? AND date = ? AND status = 'failed'",
+                                 (borough, date))
+
+    def next_retry(self, borough, date, max_attempts):
+        """
+        next_retry: time.time() at which the next failed page or restaurant may be retried, None if nothing is
+            left to retry
+        """
+        row = self._db.execute("""SELECT MIN(next_attempt) FROM (
+                                      SELECT next_attempt FROM pages WHERE borough = ? AND date = ? AND status != 'done' AND attempts < ?
+                                      UNION ALL
+                                      SELECT next_attempt FROM restaurants WHERE borough = ? AND date = ? AND status != 'done' AND attempts < ?)""",
+                               (borough, date, max_attempts) * 2).fetchone()
+        return row[0]
+
+    def status(self, borough, date):
+        """
+        status: dict of counts, e.g. {'pages': {'done': 9, 'failed': 1}, 'restaurants': {'done': 890, 'pending': 10}}
+        """
+        out = {}
+        for table in ('pages', 'restaurants'):
+            out[table] = dict(self._db.execute(f'SELECT status, COUNT(*) FROM {table} WHERE borough = ? AND date = ? GROUP BY status',
+                                               (borough, date)).fetchall())
+        return out
+
+    def records(self, borough, date, page = None):
+        """
+        records: generator of the restaurant records of the crawl in page order, done or not, optionally for one page
+            only. Records are read from sqlite as they are consumed, so exporting a crawl holds one record at a time.
+            Don't write to the journal while iterating
+        """
+        query = 'SELECT record FROM restaurants WHERE borough = ? AND date = ?'
+        params = (borough, date)
+        if page is not None:
+            query += ' AND page = ?'
+            params += (page,)
+        for (record,) in self._db.execute(query + ' ORDER BY page, position', params):
+            yield json.loads(record)
+
+    def close(self):
+        self._db.close()
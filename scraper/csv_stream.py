@@ -0,0 +1,122 @@
+import csv
+import os
+from tracing import tracer
+
+
+class StreamingCsvWriter:
+    """
+    StreamingCsvWriter: writes records to csv as they are produced, holding at most one batch in memory. Rows go to
+        '<file>.part' and the file is renamed to its final name when it is complete, so a file under its final name
+        is never half written. If the writer is left by an exception the rows written so far stay in the .part file.
+
+    args:
+        path: string, output file. With max_rows it must contain '{part}', replaced by the file number (1, 2, ...)
+        columns: list of column names. The header is written once per file in this order, and each record is written
+            as [record.get(column) for column in columns], whatever the order of its keys
+        batch_size: int, rows buffered before they are written out and flushed to disk
+        max_rows: int, rows per file before rotating to the next one, None for a single file
+
+    usage:
+        with StreamingCsvWriter('out.csv', REST_KEYS) as writer:
+            writer.write_all(records)
+    """
+
+    def __init__(self, path, columns, batch_size=100, max_rows=None):
+        if max_rows is not None and '{part}' not in path:
+            raise ValueError("path must contain '{part}' when max_rows is set")
+        self.path = path
+        self.columns = list(columns)
+        self.batch_size = batch_size
+        self.max_rows = max_rows
+        self.rows = 0
+        self.paths = []       # completed files, in order
+        self._part = 0
+        self._file = None
+        self._writer = None
+        self._file_rows = 0
+        self._batch = []
+
+    def _final_path(self):
+        return self.path.format(part=self._part) if self.max_rows is not None else self.path
+
+    def _open(self):
+        self._part += 1
+        self._file = open(self._final_path() + '.part', 'w', encoding='utf-8', newline='')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(self.columns)
+        self._file_rows = 0
+
+    def _flush(self):
+        batch = self._batch
+        self._batch = []
+        if batch:
+            with tracer.span('csv_write', path=self.path, rows=len(batch)):
+                self._write(batch)
+
+    def _write(self, batch):
+        # writes a batch out, rotating to a new file whenever the current one is full
+        while batch:
+            if self._file is None:
+                self._open()
+            room = len(batch) if self.max_rows is None else self.max_rows - self._file_rows
+            self._writer.writerows(batch[:room])
+            self._file_rows += len(batch[:room])
+            batch = batch[room:]
+            self._file.flush()
+            if self.max_rows is not None and self._file_rows >= self.max_rows:
+                self._finish()
+
+    def _finish(self):
+        # closes the current file and gives it its final name
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self._file.name, self._final_path())
+        self.paths.append(self._final_path())
+        self._file = None
+
+    def write(self, record):
+        """
+        write: adds one record (a dict)
+        """
+        self._batch.append([record.get(column) for column in self.columns])
+        self.rows += 1
+        if len(self._batch) >= self.batch_size:
+            self._flush()
+
+    def write_all(self, records):
+        """
+        write_all: adds every record of an iterable, e.g. a scraper generator, as it is produced
+
+        output:
+            count: int, number of records written
+        """
+        count = 0
+        for record in records:
+            self.write(record)
+            count += 1
+        return count
+
+    def close(self):
+        """
+        close: writes out the last batch and renames the current file to its final name. A writer that received no
+            rows still produces a file with the header
+        """
+        self._flush()
+        if self._file is None and not self.paths:
+            self._open()
+        if self._file is not None:
+            with tracer.span('csv_write', path=self.path, rows=0):
+                self._finish()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        elif self._file is not None or self._batch:
+            # keep what was scraped before the error in the .part file, without claiming the file is complete
+            self._flush()
+            if self._file is not None:
+                self._file.close()
+        return False
@@ -0,0 +1,243 @@
+import atexit
+from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
+from contextlib import contextmanager
+import threading
+import time
+from tracing import tracer
+
+
+# file extensions blocked by the fast-load profile, images are also disabled through chrome prefs
+BLOCKED_URLS = ['*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.svg', '*.ico',
+                '*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot']
+
+
+def chrome_options(headless=True, fast_load=True):
+    """
+    chrome_options: builds the ChromeOptions used for every pooled browser session
+
+    args:
+        headless: bool, run chrome without a visible window
+        fast_load: bool, disable images, block font/image requests and return from driver.get() once the
+            DOM is ready (eager page-load strategy) instead of waiting for every subresource
+
+    output:
+        options: selenium ChromeOptions object
+    """
+    options = webdriver.ChromeOptions()
+    if headless:
+        options.add_argument('--headless')
+        # headless windows can't be maximized, so give them a full size window to make sure the page sidebar is loaded
+        options.add_argument('--window-size=1920,1080')
+    options.add_argument('--disable-gpu')
+    options.add_argument('--disable-extensions')
+    options.add_argument('--no-first-run')
+
+    if fast_load:
+        options.add_argument('--blink-settings=imagesEnabled=false')
+        options.add_experimental_option('prefs', {'profile.managed_default_content_settings.images': 2})
+        options.page_load_strategy = 'eager'
+
+    return options
+
+
+class DriverPool:
+    """
+    DriverPool: a bounded pool of warm chrome sessions shared by the scrapers, so a crawl launches a handful of
+    browsers instead of one per page
+
+    args:
+        max_size: int, maximum number of browser sessions open at the same time
+        max_pages: int, number of pages a session serves before it is quit and relaunched
+        headless: bool, passed to chrome_options()
+        fast_load: bool, passed to chrome_options()
+
+    usage:
+        pool = DriverPool(max_size = 2)
+        with pool.driver() as driver:
+            driver.get(url)
+            html = driver.page_source
+        pool.report()
+        pool.close()
+    """
+
+    def __init__(self, max_size=2, max_pages=50, headless=True, fast_load=True):
+        if max_size < 1:
+            raise ValueError('max_size must be at least 1')
+        self.max_size = max_size
+        self.max_pages = max_pages
+        self.headless = headless
+        self.fast_load = fast_load
+
+        self._idle = []            # warm drivers waiting to be handed out
+        self._pages = {}           # driver -> number of pages served since launch
+        self._open = 0             # drivers currently alive, idle or checked out
+        self._cond = threading.Condition()
+
+        # run statistics used by report()
+        self.launches = 0
+        self.launch_seconds = 0.0
+        self.pages_served = 0
+        self.recycled = 0
+        self.crashed = 0
+
+    def _launch(self):
+        start = time.perf_counter()
+        with tracer.span('launch'):
+            driver = webdriver.Chrome(options=chrome_options(self.headless, self.fast_load))
+            if self.fast_load:
+                # fonts can't be switched off through prefs, block them (and any images that slip through) at the network layer
+                try:
+                    driver.execute_cdp_cmd('Network.enable', {})
+                    driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': BLOCKED_URLS})
+                except (AttributeError, WebDriverException):
+                    pass
+        elapsed = time.perf_counter() - start
+
+        with self._cond:
+            self.launches += 1
+            self.launch_seconds += elapsed
+            self._pages[driver] = 0
+        return driver
+
+    def _discard(self, driver):
+        # quit() rather than close(), close() only closes the window and leaves chromedriver running
+        try:
+            driver.quit()
+        except WebDriverException:
+            pass
+        with self._cond:
+            self._pages.pop(driver, None)
+            self._open -= 1
+            self._cond.notify()
+
+    def acquire(self):
+        """
+        acquire: returns a warm driver from the pool, launching a new one if the pool is below max_size.
+            Blocks until a driver is free if max_size drivers are already checked out.
+        """
+        with self._cond:
+            while not self._idle and self._open >= self.max_size:
+                self._cond.wait()
+            if self._idle:
+                return self._idle.pop()
+            self._open += 1
+
+        try:
+            return self._launch()
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, driver, crashed=False):
+        """
+        release: returns a driver to the pool after it has served one page. The driver is quit instead if it
+            crashed or has reached max_pages.
+        """
+        with self._cond:
+            self.pages_served += 1
+            self._pages[driver] = self._pages.get(driver, 0) + 1
+            if crashed:
+                self.crashed += 1
+            elif self._pages[driver] >= self.max_pages:
+                self.recycled += 1
+            else:
+                self._idle.append(driver)
+                self._cond.notify()
+                return
+        self._discard(driver)
+
+    @contextmanager
+    def driver(self):
+        """
+        driver: context manager wrapping acquire() and release(). A WebDriverException raised inside the block
+            marks the session as crashed so it gets relaunched instead of being handed out again.
+        """
+        driver = self.acquire()
+        crashed = False
+        try:
+            yield driver
+        except WebDriverException:
+            crashed = True
+            raise
+        finally:
+            self.release(driver, crashed)
+
+    def grow(self, max_size):
+        """
+        grow: raises max_size so that max_size workers can each hold a driver at the same time. Never shrinks
+            the pool.
+        """
+        with self._cond:
+            if max_size > self.max_size:
+                self.max_size = max_size
+                self._cond.notify_all()
+
+    def close(self):
+        """
+        close: quits every idle driver. Drivers still checked out are quit when they are released.
+        """
+        with self._cond:
+            idle, self._idle = self._idle, []
+        for driver in idle:
+            self._discard(driver)
+
+    def stats(self):
+        """
+        stats: returns a dict of launch count, total launch time, pages served and the launch time saved compared
+            to starting one browser per page
+        """
+        with self._cond:
+            avg_launch = self.launch_seconds / self.launches if self.launches else 0.0
+            return {'launches': self.launches,
+                    'launch_seconds': round(self.launch_seconds, 2),
+                    'pages_served': self.pages_served,
+                    'recycled': self.recycled,
+                    'crashed': self.crashed,
+                    'seconds_saved': round(avg_launch * max(self.pages_served - self.launches, 0), 2)}
+
+    def report(self):
+        """
+        report: prints stats() for the current run
+        """
+        s = self.stats()
+        print(f"{s['launches']} browser launches ({s['launch_seconds']}s) for {s['pages_served']} pages, "
+              f"{s['recycled']} recycled, {s['crashed']} crashed, ~{s['seconds_saved']}s of launch time saved")
+
+
+_shared_pool = None
+_shared_lock = threading.Lock()
+
+
+def get_pool(**kwargs):
+    """
+    get_pool: returns the DriverPool shared by all three scrapers, creating it on first use. Its browsers stay warm
+        between scraper calls and are quit by close_pool(), at the latest when the python process (e.g. the
+        notebook kernel) exits
+
+    args:
+        **kwargs: passed to DriverPool() the first time the pool is created, ignored afterwards
+    """
+    global _shared_pool
+    with _shared_lock:
+        if _shared_pool is None:
+            _shared_pool = DriverPool(**kwargs)
+        return _shared_pool
+
+
+def close_pool():
+    """
+    close_pool: reports on and closes the shared pool, the next get_pool() call creates a fresh one
+    """
+    global _shared_pool
+    with _shared_lock:
+        pool, _shared_pool = _shared_pool, None
+    if pool is not None:
+        pool.report()
+        pool.close()
+
+
+# quit the shared browsers and chromedrivers when the process exits, nothing else would
+atexit.register(close_pool)
@@ -0,0 +1,361 @@
+from bs4 import BeautifulSoup as soup, SoupStrainer
+from bs4.element import Tag
+import re
+from tracing import traced
+
+# use lxml's C parser when it is installed, it builds the same tree as html.parser several times faster
+try:
+    import lxml
+    PARSER = 'lxml'
+except ImportError:
+    PARSER = 'html.parser'
+
+
+# (tag name, class) -> field fed by tags matching it. Built once at import.
+# A class with a space only matches the full class attribute, a single class matches any tag that has it,
+# the same rules as BeautifulSoup's find_all(attrs = {"class" : ...}) used by the original scraper code
+RESTAURANT_SELECTORS = {
+    ('div', 'c3981cf8 _965a91d5'): 'info',         # review count / price spans, also the sidebar detail labels
+    ('div', 'oc-reviews-491257d8'): 'overall',
+    ('div', 'oc-reviews-15d38b07'): 'subrating',
+    ('span', 'oc-reviews-624ebf8b'): 'noise',
+    ('div', 'oc-reviews-8c8e52a0'): 'recs_parent',
+    ('div', 'oc-reviews-dfc07aec'): 'recs',
+    ('div', '_1e466fbf'): 'sidebar',
+    ('div', 'df8add00'): 'detail',
+    ('div', 'e7ff71b6 b2f6d1a4'): 'detail_value',
+    ('div', '_77b505d0 _965a91d5'): 'safety',
+}
+
+CARD_SELECTORS = {
+    ('div', '_3uVfVbI1iLfMbszbU6KoOL'): 'card',
+    ('a', '_1e9PcCDb012hY4BcGfraQB'): 'link',
+    ('p', '_1RzTbFM0hmdDgWfT_RmXel'): 'not_member',
+    ('span', '_2VIffaVUDxw_-tEh-6XOB_ _2EluNCOTdgGq9H4SxGZwUg'): 'booked',
+}
+
+
+class _SelectorStrainer(SoupStrainer):
+    """
+    _SelectorStrainer: SoupStrainer that only builds the subtrees of tags carrying one of the selector classes or
+        ids, everything inside a kept tag is kept. Implements the hook for both the bs4 >= 4.13 (allow_tag_creation)
+        and older (search_tag) tree builders
+    """
+
+    def __init__(self, selectors, ids = ()):
+        SoupStrainer.__init__(self)
+        self.classes = frozenset(cls for name, cls in selectors)
+        self.ids = frozenset(ids)
+
+    def _keep(self, attrs):
+        if not attrs:
+            return False
+        if attrs.get('id') in self.ids:
+            return True
+        classes = attrs.get('class')
+        if not classes:
+            return False
+        if isinstance(classes, str):
+            classes = classes.split()
+        return ' '.join(classes) in self.classes or any(c in self.classes for c in classes)
+
+    def allow_tag_creation(self, nsprefix, name, attrs):
+        return self._keep(attrs)
+
+    def search_tag(self, markup_name = None, markup_attrs = {}):
+        if isinstance(markup_name, Tag):
+            return markup_name if self._keep(markup_name.attrs) else None
+        return markup_name if self._keep(dict(markup_attrs)) else None
+
+
+# only the tags holding restaurant fields are built, the rest of the page (reviews, scripts, navigation) is skipped
+RESTAURANT_STRAINER = _SelectorStrainer(RESTAURANT_SELECTORS, ids = ['safety-precautions'])
+
+# only the result cards and the result count are needed from a search results page, skip building the rest of the tree
+CARD_STRAINER = SoupStrainer('div', attrs = {"class" : "_3uVfVbI1iLfMbszbU6KoOL"})
+TOTAL_STRAINER = SoupStrainer('h3', attrs = {"data-test" : "multi-search-total-count"})
+
+# the review list and its page buttons, for the first review scraper
+REVIEWS_STRAINER = SoupStrainer(id = ['reviews-results', 'review-feed-pagination'])
+
+DIGITS = re.compile(r'\d+')
+PERCENT = re.compile(r'\d+%')
+
+# (pattern matched against the sidebar label, key in the restaurant dict)
+DETAIL_PATTERNS = [(re.compile('Neighborhood'), 'neighborhood'),
+                   (re.compile('Cuisines'), 'cuisines'),
+                   (re.compile('Dining Style'), 'dining_style'),
+                   (re.compile('Dress code'), 'dress_code'),
+                   (re.compile('(?i)(.*chef.*)'), 'chef'),
+                   (re.compile('Additional'), 'tags')]
+
+SAFETY_CATEGORIES = {'Cleaning & Sanitizing': 'sanitizing', 'Physical Distancing': 'distancing',
+                     'Protective Equipment': 'ppe', 'Screening': 'screening'}
+
+RECOMMEND = 'would recommend it to a friend'
+
+# text of the date line of a review, 'Dined on July 20, 2021', 'Dined 3 days ago', 'Reviewed on ...'
+REVIEW_DATE = re.compile(r'^(Dined|Reviewed) ')
+
+
+def _fields(tag, selectors):
+    """
+    _fields: returns the list of fields in selectors that tag matches
+    """
+    classes = tag.get('class')
+    if not classes:
+        return ()
+    name = tag.name
+    found = [selectors[(name, c)] for c in classes if (name, c) in selectors]
+    if len(classes) > 1 and (name, ' '.join(classes)) in selectors:
+        found.append(selectors[(name, ' '.join(classes))])
+    return found
+
+
+def _walk(root, selectors):
+    """
+    _walk: single depth-first pass over root in document order
+
+    output:
+        generator of (tag, fields, scopes) where fields is the list of selector fields tag matches and scopes is
+        the list of (field, ancestor) pairs for every matching ancestor of tag, innermost last
+    """
+    stack = [(root, ())]
+    while stack:
+        tag, scopes = stack.pop()
+        fields = _fields(tag, selectors)
+        yield tag, fields, scopes
+
+        if fields:
+            scopes = scopes + tuple((field, tag) for field in fields)
+        children = [child for child in tag.contents if isinstance(child, Tag)]
+        for child in reversed(children):
+            stack.append((child, scopes))
+
+
+@traced('parse')
+def extract_restaurant(rest_html, curr_rest_dict, parser = PARSER):
+    """
+    extract_restaurant: single-pass replacement for the find/find_all calls that parse_restaurant_page() used to
+        make, fills in curr_rest_dict with exactly the same values
+
+    args:
+        rest_html: string, html of the restaurant page
+        curr_rest_dict: the dict of information on each restaurant generated by get_restaurants()
+        parser: string, BeautifulSoup tree builder, PARSER (lxml if installed) by default
+
+    output:
+        no return, mutating function, see get_restaurant_info() for the keys
+    """
+    page = soup(rest_html, parser, parse_only = RESTAURANT_STRAINER)
+
+    # dicts below are keyed by id(tag), BeautifulSoup tags hash and compare by their contents
+    info_spans = {}       # info div -> spans inside it
+    overall = []          # overall rating divs
+    first_span = {}       # overall/safety div -> first span inside it
+    subratings = []
+    noise = None
+    has_recs = 0
+    recs = []
+    sidebar = None
+    details = {}          # sidebar detail div -> ([label divs], [value divs])
+    safety = []
+    safety_section = False
+
+    for tag, fields, scopes in _walk(page, RESTAURANT_SELECTORS):
+        name = tag.name
+
+        # feed the tag to the matching ancestors it sits inside
+        if scopes:
+            for scope, ancestor in scopes:
+                if name == 'span':
+                    if scope == 'info':
+                        info_spans[id(ancestor)].append(tag)
+                    elif scope in ('overall', 'safety'):
+                        first_span.setdefault(id(ancestor), tag)
+                    elif scope == 'recs_parent' and 'noise' in fields and tag.string == RECOMMEND:
+                        has_recs = 1
+                elif scope == 'detail' and id(ancestor) in details:
+                    if 'info' in fields:
+                        details[id(ancestor)][0].append(tag)
+                    if 'detail_value' in fields:
+                        details[id(ancestor)][1].append(tag)
+
+        if name == 'div' and tag.get('id') == 'safety-precautions':
+            safety_section = True
+
+        for field in fields:
+            if field == 'info':
+                info_spans[id(tag)] = []
+            elif field == 'overall':
+                overall.append(tag)
+            elif field == 'subrating':
+                subratings.append(tag)
+            elif field == 'noise':
+                if noise is None:
+                    noise = tag
+            elif field == 'recs':
+                recs.append(tag)
+            elif field == 'sidebar':
+                if sidebar is None:
+                    sidebar = tag
+            elif field == 'detail':
+                # only details inside the first sidebar count
+                if any(ancestor is sidebar for scope, ancestor in scopes if scope == 'sidebar'):
+                    details[id(tag)] = ([], [])
+            elif field == 'safety':
+                safety.append(tag)
+
+    # get number of reviews, price range
+    for spans in info_spans.values():
+        for span in spans:
+            string = span.string
+            if string is None:
+                continue
+            if "Reviews" in string:
+                curr_rest_dict['review_count'] = string
+            if "$" in string:
+                curr_rest_dict['price_tier'] = string
+
+    has_reviews = 0 if curr_rest_dict['review_count'] == "No Reviews" else 1
+
+    # get overall rating and subratings
+    if has_reviews:
+        curr_rest_dict['overall'] = float(first_span[id(overall[0])].string)
+        if subratings != []:
+            curr_rest_dict['food'] = float(subratings[0].string)
+            curr_rest_dict['service'] = float(subratings[1].string)
+            curr_rest_dict['ambience'] = float(subratings[2].string)
+            curr_rest_dict['value'] = float(subratings[3].string)
+
+    # get noise level
+    if noise is not None:
+        curr_rest_dict['noise'] = noise.string
+
+    # get percent of reviewers who would recommended to a friend
+    if has_reviews and has_recs:
+        recs_2 = PERCENT.search(recs[1].get_text())
+        if recs_2 is not None:
+            curr_rest_dict['pct_recommended'] = int(DIGITS.search(recs_2.group(0)).group(0))
+
+    # sidebar details, each detail keeps its last (label, value) pair
+    if sidebar is not None:
+        details_list = []
+        for labels, values in details.values():
+            pairs = list(zip(labels, values))
+            if pairs:
+                details_list.append((pairs[-1][0].string, pairs[-1][1].string))
+
+        for pattern, key in DETAIL_PATTERNS:
+            for label, value in details_list:
+                if label is not None and pattern.search(label):
+                    curr_rest_dict[key] = value
+
+    # gets first tag in cuisines as primary cuisine
+    if curr_rest_dict['cuisines'] is not None:
+        curr_rest_dict['primary_cuisine'] = curr_rest_dict['cuisines'].split(',')[0]
+
+    # get COVID-19 safety information, only if the page has a safety element at all
+    if safety_section:
+        for key in SAFETY_CATEGORIES.values():
+            curr_rest_dict[key] = 0
+        for div in safety:
+            key = SAFETY_CATEGORIES.get(first_span[id(div)].string)
+            if key is not None:
+                curr_rest_dict[key] = 1
+
+
+@traced('parse')
+def extract_cards(results_html, parser = PARSER):
+    """
+    extract_cards: parses every restaurant card on a search results page in a single pass
+
+    args:
+        results_html: string, html of the search results page
+        parser: string, BeautifulSoup tree builder, PARSER (lxml if installed) by default
+
+    output:
+        cards: list of dicts in page order, with keys
+            name: string, aria-label of the restaurant link
+            url: string, href of the restaurant link
+            is_member: int, 0 if the card says the restaurant isn't on OpenTable's reservation service, else 1
+            promoted: int, 1 if the card is a promoted listing, else 0
+            booked: int, number of bookings today shown on the card, 0 if not shown
+    """
+    page = soup(results_html, parser, parse_only = CARD_STRAINER)
+
+    cards = []
+    by_tag = {}           # id(card div) -> card dict
+    linked = set()        # id(card div) of cards whose first link has been read
+    for tag, fields, scopes in _walk(page, CARD_SELECTORS):
+        for scope, ancestor in scopes:
+            if scope != 'card':
+                continue
+            card = by_tag[id(ancestor)]
+            if 'link' in fields and id(ancestor) not in linked:
+                linked.add(id(ancestor))
+                card['name'] = tag.get('aria-label')
+                card['url'] = tag.get('href')
+            if 'not_member' in fields:
+                card['is_member'] = 0
+            if 'booked' in fields and tag.string is not None and 'Booked' in tag.string:
+                card['booked'] = int(DIGITS.search(tag.string).group(0))
+
+        if 'card' in fields:
+            card = {'name': None, 'url': None, 'is_member': 1,
+                    'promoted': 1 if tag.get('data-promoted') == 'true' else 0, 'booked': 0}
+            by_tag[id(tag)] = card
+            cards.append(card)
+
+    return cards
+
+
+@traced('parse')
+def extract_total_count(results_html, parser = PARSER):
+    """
+    extract_total_count: returns the total number of restaurants found, as shown at the top of a search results page
+    """
+    page = soup(results_html, parser, parse_only = TOTAL_STRAINER)
+    header = page.find('h3', attrs = {"class" : "_6X5n-Vu8eAbxx_nrEuxjc", "data-test" : "multi-search-total-count"})
+    return int(DIGITS.search(header.string).group(0))
+
+
+def results_page_count(total_restaurants, page_size = 100):
+    """
+    results_page_count: number of search results pages needed to show total_restaurants
+    """
+    return -(-total_restaurants // page_size)
+
+
+@traced('parse')
+def extract_reviews(rest_html, parser = PARSER):
+    """
+    extract_reviews: reads the review list currently shown on a restaurant page
+
+    args:
+        rest_html: string, html of the restaurant page, on whichever page of reviews is loaded
+        parser: string, BeautifulSoup tree builder, PARSER (lxml if installed) by default
+
+    output:
+        dates: list of strings in page order, the date line of each review, e.g. 'Dined on July 20, 2021', None for
+            a review without one. None if the page has no review list
+        num_pages: int, highest page number on the review page buttons, 1 if there are no buttons
+    """
+    page = soup(rest_html, parser, parse_only = REVIEWS_STRAINER)
+
+    results = page.find(id = 'reviews-results')
+    if results is None:
+        return None, 1
+    dates = []
+    for review in results.find_all('div', recursive = False):
+        span = review.find('span', string = REVIEW_DATE)
+        dates.append(None if span is None else span.string)
+
+    num_pages = 1
+    pagination = page.find(id = 'review-feed-pagination')
+    if pagination is not None:
+        for button in pagination.find_all('button'):
+            label = button.get_text(strip = True)
+            if label.isdigit():
+                num_pages = max(num_pages, int(label))
+    return dates, num_pages
@@ -0,0 +1,123 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from driver_pool import get_pool
+from page_cache import CachedFetcher
+from rate_limit import opentable_limiter
+from tracing import tracer
+from waits import expected_cards, scroll_until_loaded
+
+
+# desktop browser user agent, restaurant pages are served the same server-rendered html as in chrome
+USER_AGENT = ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) '
+              'Chrome/92.0.4515.107 Safari/537.36')
+
+
+class SeleniumFetcher:
+    """
+    SeleniumFetcher: fetch backend that loads pages in a pooled chrome session (see driver_pool.py). Every page
+        load takes a token from the global rate limit in rate_limit.py
+
+    args:
+        maximize: bool, maximize the window before reading the page so the restaurant page sidebar is loaded
+        scroll: bool, scroll down the page before reading it so every restaurant on a search results page is loaded
+        scroll_deadline: float, seconds after which scrolling stops even if cards are still missing
+    """
+
+    def __init__(self, maximize=True, scroll=False, scroll_deadline=30):
+        self.maximize = maximize
+        self.scroll = scroll
+        self.scroll_deadline = scroll_deadline
+
+    def fetch(self, url):
+        """
+        fetch: returns the page source of url as a string
+        """
+        with tracer.context(url=url):
+            with tracer.span('rate_limit'):
+                opentable_limiter.acquire()
+            with get_pool().driver() as driver:
+                with tracer.span('get'):
+                    driver.get(url)
+                if self.maximize:
+                    driver.maximize_window() # maximize to make sure page sidebar is loaded
+                if self.scroll:
+                    # scroll down page until every restaurant element the header count promises is loaded
+                    with tracer.span('scroll'):
+                        scroll_until_loaded(driver, expected_cards(driver, url), deadline=self.scroll_deadline, url=url)
+                with tracer.span('page_source') as span:
+                    html = driver.page_source
+                    span.set(size=len(html))
+                return html
+
+
+class HttpFetcher:
+    """
+    HttpFetcher: fetch backend that GETs pages over a pooled keep-alive HTTP session, no browser involved.
+        Only suitable for pages whose content is in the served html, i.e. restaurant detail pages. Search
+        results pages need scrolling and should keep using SeleniumFetcher.
+
+    args:
+        pool_size: int, number of keep-alive connections kept open per host, should be >= the number of workers
+        timeout: float, seconds before a request is abandoned
+        retries: int, number of retries, with exponential backoff, of a connection that couldn't be opened. Nothing
+            reached the site, so they take no rate limit token. Error responses (429/5xx) and read timeouts are not
+            retried here: they raise, and the crawl journal retries the page with backoff and a new token
+    """
+
+    def __init__(self, pool_size=10, timeout=20, retries=3):
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update({'User-Agent': USER_AGENT, 'Accept-Language': 'en-US,en;q=0.9'})
+        retry = Retry(total=None, connect=retries, read=0, status=0, other=0, backoff_factor=0.5)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, pool_block=True, max_retries=retry)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def fetch(self, url):
+        """
+        fetch: returns the html of url as a string, raises requests.HTTPError on a 4xx/5xx response. Every request
+            sent takes one token from the global rate limit
+        """
+        with tracer.context(url=url):
+            with tracer.span('rate_limit'):
+                opentable_limiter.acquire()
+            with tracer.span('get') as span:
+                response = self.session.get(url, timeout=self.timeout)
+                response.raise_for_status()
+                span.set(size=len(response.content))
+            return response.text
+
+    def close(self):
+        self.session.close()
+
+
+def get_fetcher(backend, workers=1, cache=None, page_type='restaurant', query_date=None):
+    """
+    get_fetcher: returns a fetch backend by name
+
+    args:
+        backend: string, 'selenium', 'selenium_scroll' (search results pages) or 'http'
+        workers: int, number of threads that will share the fetcher, used to size the http connection pool
+        cache: PageCache from page_cache.py to serve pages from and store them in, None for no caching
+        page_type: string, page type used for the cache ttl, 'search', 'restaurant' or 'reviews'
+        query_date: string, date the pages are requested for, part of the cache key
+
+    output:
+        fetcher: object with a fetch(url) method returning the page html as a string
+    """
+    if cache is not None and cache.replay:
+        # replay never touches the network or a browser
+        fetcher = None
+    elif backend == 'selenium':
+        fetcher = SeleniumFetcher()
+    elif backend == 'selenium_scroll':
+        fetcher = SeleniumFetcher(maximize=False, scroll=True)
+    elif backend == 'http':
+        fetcher = HttpFetcher(pool_size=max(10, workers))
+    else:
+        raise ValueError("backend must be 'selenium', 'selenium_scroll' or 'http'")
+
+    if cache is not None:
+        fetcher = CachedFetcher(fetcher, cache, page_type, query_date)
+    return fetcher
@@ -1,67 +1,245 @@
-from selenium import webdriver
 import re
-import time
 import csv
+import os
+from collections import defaultdict
 import pandas as pd
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from selenium.common.exceptions import TimeoutException
 from selenium.webdriver.support.wait import WebDriverWait
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions as EC
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
 import datetime
+from driver_pool import get_pool
+from extract import extract_restaurant, extract_reviews
+from rate_limit import opentable_limiter, set_rate
+from tracing import tracer
+from urls import canonical_url
+from waits import wait_for_change, wait_log
+
+
+# query parameter selecting the page of reviews shown on a restaurant page
+REVIEW_PAGE_PARAM = 'page'
+
+RELATIVE_DATE = re.compile(r'(\d+|an?) (day|week|month|year)s? ago')
+RELATIVE_DAYS = {'day': 1, 'week': 7, 'month': 30, 'year': 365}
+
+
+def review_page_url(url, page):
+    """
+    review_page_url: url of a restaurant page showing the given page of reviews
+    """
+    parts = urlsplit(url)
+    query = [(key, value) for key, value in parse_qsl(parts.query, keep_blank_values = True) if key != REVIEW_PAGE_PARAM]
+    query.append((REVIEW_PAGE_PARAM, str(page)))
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), parts.fragment))
+
+
+def review_date(text, today = None):
+    """
+    review_date: datetime.date of a review date line, e.g. 'Dined on July 20, 2021' or 'Dined 3 days ago'.
+        None if the text can't be read. Relative dates are approximate (a month is 30 days)
+    """
+    if text is None:
+        return None
+    if ' on ' in text:
+        try:
+            return datetime.datetime.strptime(text.split(' on ', 1)[1].strip(), '%B %d, %Y').date()
+        except ValueError:
+            return None
+    today = today or datetime.date.today()
+    if 'yesterday' in text:
+        return today - datetime.timedelta(days = 1)
+    if 'today' in text:
+        return today
+    match = RELATIVE_DATE.search(text)
+    if match is None:
+        return None
+    n = 1 if match.group(1) in ('a', 'an') else int(match.group(1))
+    return today - datetime.timedelta(days = n * RELATIVE_DAYS[match.group(2)])
+
+
+def check_last_page(first_dates, last_dates, num_pages):
+    """
+    check_last_page: checks the review list read as the last page of reviews against the review ordering, reviews
+        are listed newest first
+
+    args:
+        first_dates: list of review date lines on the first page of reviews
+        last_dates: list of review date lines on the page read as the last page
+        num_pages: int, number of review pages
+
+    output:
+        problem: string saying why the page can't be the last page of reviews, None if it looks right
+    """
+    if not last_dates or last_dates[-1] is None:
+        return 'no review date on the last page'
+    if num_pages > 1 and last_dates == first_dates:
+        return 'still showing the first page of reviews'
+    dates = [d for d in map(review_date, last_dates) if d is not None]
+    if any(newer < older for newer, older in zip(dates, dates[1:])):
+        return 'reviews on the last page are not in date order'
+    first = [d for d in map(review_date, first_dates) if d is not None]
+    if dates and first and dates[-1] > min(first):
+        return 'the first page has an earlier review than the last page'
+    return None
+
+
+def _page_source(driver):
+    # driver.page_source, timed as its own stage
+    with tracer.span('page_source') as span:
+        html = driver.page_source
+        span.set(size = len(html))
+    return html
+
+
+def _earliest_review(url, delay = 5, deadline = 15):
+    """
+    _earliest_review: reads the earliest review date of one restaurant. Loads the restaurant page, reads the number
+        of review pages from the page buttons and jumps straight to the last page by url. If that doesn't land on the
+        last page it falls back to clicking the last page button and waiting for the review list to change.
+
+    output:
+        (first_review, problem): first_review is 'Dined on <date>' or 'No reviews', problem is None if the result
+        passed check_last_page() (or the page shows 'No Reviews'), else the reason it didn't
+    """
+    reviews_list = (By.ID, 'reviews-results')
+    with tracer.context(url = url), get_pool().driver() as driver:
+        opentable_limiter.acquire()
+        with tracer.span('get'):
+            driver.get(url)
+
+        # try to find the reviews element on the restaurant page for 5 seconds
+        try:
+            with tracer.span('wait'):
+                WebDriverWait(driver, delay).until(EC.presence_of_element_located(reviews_list))
+        except TimeoutException:
+            # no review list: only a page whose review count says 'No Reviews' has none. A slow render, captcha or
+            # error page is reported as a problem so earliest_reviews() tries it again
+            info = defaultdict(lambda: None)
+            try:
+                extract_restaurant(_page_source(driver), info)
+            except Exception:
+                pass # the review count is read first, a page missing the later fields still gives it
+            if info['review_count'] == 'No Reviews':
+                return 'No reviews', None
+            return None, f'no review list after {delay}s and review count {info["review_count"]!r}'
+
+        first_dates, num_pages = extract_reviews(_page_source(driver))
+        if num_pages == 1:
+            return (first_dates[-1] if first_dates else None), check_last_page(first_dates, first_dates, 1)
+
+        # jump to the last page of reviews by url
+        opentable_limiter.acquire()
+        with tracer.span('get', review_page = num_pages):
+            driver.get(review_page_url(url, num_pages))
+        try:
+            with tracer.span('wait'):
+                WebDriverWait(driver, delay).until(EC.presence_of_element_located(reviews_list))
+            last_dates, _ = extract_reviews(_page_source(driver))
+        except TimeoutException:
+            last_dates = None
+        problem = check_last_page(first_dates, last_dates, num_pages)
+        if problem is None:
+            return last_dates[-1], None
+
+        # the page parameter was ignored, click the last page button instead
+        with tracer.span('click'):
+            before = driver.find_element(*reviews_list).get_attribute('innerHTML')
+            driver.find_element(By.XPATH, '//*[@id="review-feed-pagination"]/div/button[last()]').click()
+            wait_for_change(driver, reviews_list, before, deadline = deadline, kind = 'review_page')
+        last_dates, _ = extract_reviews(_page_source(driver))
+        return (last_dates[-1] if last_dates else None), check_last_page(first_dates, last_dates, num_pages)
+
 
 def get_earliest_review(url):
     """
-    get_earliest_review: visits a restaurant page on OpenTable, scrolls to the last page of reviews, finds the
+    get_earliest_review: visits a restaurant page on OpenTable, goes to the last page of reviews, finds the
     first review ever made at that restaurant, and extracts the date that review was made
-    
+
     args:
         url: string, the url of the restaurant page from which to extract the earliest review
-        
+
     output:
-        first review: string, 'Dined/Reviewed on <date>' or 'No Reviews' if no reviews
-    
-    WARNING: has bugs, ~5% of the time takes the last review on the first review page depending on how long the
-    page takes to load. Adding the WebDriverWait blocks improved but did not fully solve the problem.
-    
-    Best used on urls taken from OpenTable search results page sorted by Newest, so that earliest reviews should be in 
-    chronological order and you can identify ones where it has not navigated the reviews correctly
+        first review: string, 'Dined/Reviewed on <date>' or 'No reviews' if no reviews
+
+    The result is checked against the date order of the reviews (see check_last_page()) and a warning is printed if
+    it fails. earliest_reviews() runs many restaurants in parallel and retries the ones that fail the check.
     """
-    driver=webdriver.Chrome()
-    driver.get(url)
-    driver.maximize_window() # maximize to make sure page sidebar is loaded
-    
-    first_review = None
-    
-    reviews = True
-    
-    delay = 5
-    
-    # try to find the reviews element on the restaurant page for 5 seconds
-    try:
-        WebDriverWait(driver, delay).until(EC.presence_of_element_located((By.XPATH, '//*[@id="reviews-results"]')))
-    except:
-        print("couldn't find reviews on page")
-        reviews = False
-        
-    # if reviews found, try to find the element corresponding to the list of reviews pages
-    # if reviews found to have more than 1 page, click button corresponding to final review page
-    # after clicking, or if no review pagination found, get earliest review currently loaded on page
-    if reviews:
-        try:
-            WebDriverWait(driver, delay).until(EC.presence_of_element_located((By.XPATH, '//*[@id="review-feed-pagination"]')))
-            driver.find_element_by_xpath('//*[@id="review-feed-pagination"]/div/button[last()]').click()
-            try:
-                WebDriverWait(driver, delay).until(EC.presence_of_element_located((By.XPATH, '//*[@id="reviews-results"]/div[last()]/div/div[2]/div[1]/div[1]/div[2]/span')))
-                time.sleep(5)
-                first_review = driver.find_element_by_xpath('//*[@id="reviews-results"]/div[last()]/div/div[2]/div[1]/div[1]/div[2]/span').get_attribute('innerHTML')
-            except:
-                print("couldnt find final review on page")
-                
-        except:
-            print("couldnt find button on page")
-            first_review = driver.find_element_by_xpath('//*[@id="reviews-results"]/div[last()]/div/div[2]/div[1]/div[1]/div[2]/span').get_attribute('innerHTML')
-    else:
-        first_review = 'No reviews' # if entire reviews element missing, first review = 'No reviews'
-    
-    driver.close()
-    return first_review
\ No newline at end of file
+    first_review, problem = _earliest_review(url)
+    if problem is not None:
+        print(f'{url}: {problem}')
+    return first_review
+
+
+def earliest_reviews(urls, out_path = 'first_rev_date.csv', workers = 4, requests_per_second = 2, max_attempts = 3):
+    """
+    earliest_reviews: finds the earliest review of every restaurant in urls with a pool of browser workers, and
+        appends each result to a csv as soon as it is found
+
+    args:
+        urls: list of restaurant page urls, e.g. the 'url' column of nyc_restaurants_clean.csv. Urls of the same
+            restaurant (see urls.canonical_url) are read and written once
+        out_path: string, csv file with columns 'url' and 'earliest'. Restaurants already in it are skipped, so an
+            interrupted run picks up where it stopped when called again
+        workers: int, number of restaurant pages loaded in parallel
+        requests_per_second: float, global limit on page loads sent to OpenTable. None for no limit
+        max_attempts: int, number of times a restaurant is tried before it is given up on. A restaurant is retried
+            when loading it fails or its result fails check_last_page()
+
+    output:
+        failed: dict of url -> reason for restaurants given up on. They are left out of the csv, so the next run
+            tries them again
+    """
+    done = set()
+    if os.path.exists(out_path):
+        with open(out_path, encoding = 'utf-8', newline = '') as csvfile:
+            done = {canonical_url(row['url']) for row in csv.DictReader(csvfile)}
+    # url variants of one restaurant (tracking parameters etc.) are read once, under their first url
+    todo = {}
+    for url in urls:
+        key = canonical_url(url)
+        if key not in done:
+            todo.setdefault(key, url)
+    todo = list(todo.values())
+    print(f'{len(done)} restaurants already done, {len(todo)} to go')
+
+    set_rate(requests_per_second, burst = workers)
+    if workers > 1:
+        get_pool().grow(workers)
+
+    failed = {}
+    with open(out_path, 'a', encoding = 'utf-8', newline = '') as csvfile:
+        csv_writer = csv.writer(csvfile)
+        if csvfile.tell() == 0:
+            csv_writer.writerow(['url', 'earliest'])
+
+        for attempt in range(1, max_attempts + 1):
+            if not todo:
+                break
+            retry = []
+            with ThreadPoolExecutor(max_workers = workers) as executor:
+                futures = {executor.submit(_earliest_review, url): url for url in todo}
+                for future in as_completed(futures):
+                    url = futures[future]
+                    try:
+                        first_review, problem = future.result()
+                    except Exception as e:
+                        first_review, problem = None, repr(e)
+                    if problem is None:
+                        with tracer.span('csv_write', path = out_path, rows = 1):
+                            csv_writer.writerow([url, first_review])
+                            csvfile.flush()
+                        failed.pop(url, None)
+                        print(url, first_review)
+                    else:
+                        failed[url] = problem
+                        retry.append(url)
+                        print(f'{url} attempt {attempt} flagged: {problem}')
+            todo = retry
+
+    get_pool().report()
+    wait_log.report()
+    tracer.report()
+    return failed
@@ -1,102 +1,226 @@
-from selenium import webdriver
-from bs4 import BeautifulSoup as soup
-import re
-import time
-import csv
 import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from bookings_store import BookingsStore
+from csv_stream import StreamingCsvWriter
+from driver_pool import get_pool
+from extract import extract_cards, extract_total_count, results_page_count
+from fetch import SeleniumFetcher
+from rate_limit import set_rate
+from restaurant_ids import IDS_PATH, get_ids
+from tracing import tracer
+from urls import BASE_URL, canonical_url
+from waits import wait_log
+
 
+# dict of string to 'regionId' identifier number to be used in OpenTable search results url
+BOROUGHS = {'manhattan':'16', 'bronx':'324', 'queens':'17', 'staten_island':'18', 'brooklyn':'24'}
 
-def bookings_today(borough):
+
+def bookings_page_url(borough, date, page):
+    """
+    bookings_page_url: url of one page of OpenTable search results for a borough, for a 10pm table on date
+    """
+    return (f'{BASE_URL}/s?dateTime={date}T22%3A00%3A00&covers=1&metroId=8&regionIds%5B0%5D={BOROUGHS[borough]}'
+            f'&neighborhoodIds%5B0%5D=&term=&page={page}')
+
+
+def _open_store(store_path, ids_path):
+    # (BookingsStore or None, RestaurantIds the csv is written with). The store is opened before scraping, it refuses
+    # an ids_path other than its own file
+    if store_path is None:
+        return None, get_ids(ids_path or IDS_PATH)
+    store = BookingsStore(store_path, get_ids(ids_path) if ids_path is not None else None)
+    return store, store.ids
+
+
+def bookings_today(borough, store_path = None, ids_path = None):
     """
     bookings_today(): given borough, visits current OpenTable search results page for that borough and extracts the number
     of bookings today for every restaurant
     
     args:
         borough: string, 'manhattan', 'bronx', 'queens', 'staten_island', or 'brooklyn'
+        store_path: string, sqlite file of a BookingsStore (see bookings_store.py) the day is appended to, None to
+            only write the csv
+        ids_path: string, sqlite file of the restaurant id index (see restaurant_ids.py). Defaults to store_path
+            when a store is given, so the csv's restaurant_id are the store's ids, and to IDS_PATH otherwise
     
     output:
         csv file named 'bookings_<borough>_<date>', where date format is 'YYYY-mm-dd'
-        column headers are 'url' and <date>
+        column headers are 'url', 'restaurant_id' and <date>, one row per restaurant (a restaurant listed twice keeps
+        its first listing). Rows are streamed to the file page by page (see csv_stream.py), which only appears under
+        its name once every page is read
     
     
     """
     
     today = datetime.datetime.today().strftime('%Y-%m-%d')
-    tomorrow = (datetime.datetime.today()+datetime.timedelta(days=1)).strftime('%Y-%m-%d')
+    out_path = f'bookings_{borough}_{today}.csv'
     
-    # dict of string to 'regionId' identifier number to be used in OpenTable search results url
-    boroughs = {'manhattan':'16', 'bronx':'324', 'queens':'17', 'staten_island':'18', 'brooklyn':'24'}
-    
-    sel_borough = boroughs[borough]
+    store, ids = _open_store(store_path, ids_path)
+
+    with tracer.context(borough = borough), StreamingCsvWriter(out_path, ['url', 'restaurant_id', today]) as writer:
+        writer.write_all(iter_bookings(borough, today, ids = ids))
+
+    if store is not None:
+        print(f'{store.ingest_csv(out_path, borough)} rows added to {store_path}')
+        store.close()
+
+    get_pool().report()
+    wait_log.report()
+    tracer.report()
+
+def iter_bookings(borough, today, fetcher = None, ids = None):
+    """
+    iter_bookings: generator of the bookings of every restaurant in a borough's search results for a 10pm table
+        tomorrow, one dict per restaurant with keys 'url', 'restaurant_id' and today. Results pages are fetched as
+        the generator is consumed, so only one page is held in memory however many pages the borough has
     
-    url = f'https://www.opentable.com/s?dateTime={tomorrow}T22%3A00%3A00&covers=1&metroId=8&regionIds%5B0%5D={sel_borough}&neighborhoodIds%5B0%5D=&term=&page=1'
-    driver=webdriver.Chrome()
-    driver.get(url)
-    html = driver.page_source
-    time.sleep(0.1)
-    driver.close()
+    args:
+        borough: string, key of BOROUGHS
+        today: string, 'YYYY-mm-dd', the key the bookings count is stored under
+        fetcher: fetch backend from fetch.py for the results pages, SeleniumFetcher(scroll = True) if None
+        ids: RestaurantIds from restaurant_ids.py, get_ids() if None
+    """
+    tomorrow = (datetime.datetime.strptime(today, '%Y-%m-%d')+datetime.timedelta(days=1)).strftime('%Y-%m-%d')
+    if fetcher is None:
+        # every results page is scrolled until its restaurant elements are loaded
+        fetcher = SeleniumFetcher(maximize=False, scroll=True)
+    if ids is None:
+        ids = get_ids()
     
-    # calculates how many pages of search results there are
-    results_soup = soup(html, 'html.parser')
-    total_restaurants = int(re.search('\d+', results_soup.find('h3', attrs = {"class" : "_6X5n-Vu8eAbxx_nrEuxjc", "data-test" : "multi-search-total-count"}).string).group(0))
-    if total_restaurants % 100 == 0:
-        num_results_pages = (total_restaurants/100)
-    else:
-        num_results_pages = int((total_restaurants/100) + 1)
+    # page 1 is read once, for the page count and its cards
+    url = bookings_page_url(borough, tomorrow, 1)
+    with tracer.context(borough = borough, url = url):
+        html = fetcher.fetch(url)
+        
+        # calculates how many pages of search results there are
+        num_results_pages = results_page_count(extract_total_count(html))
     
     print(num_results_pages, ' pages of results')
-    bookings_list = []
+    seen = set()
     
     # visits each search results page 
-    for i in range(0, int(num_results_pages)):
-        page_i = f'https://www.opentable.com/s?dateTime={tomorrow}T22%3A00%3A00&covers=1&metroId=8&regionIds%5B0%5D={sel_borough}&neighborhoodIds%5B0%5D=&term=&page={i+1}'     
-        driver=webdriver.Chrome()
-        driver.get(page_i)
-        
-        # scroll down page incrementally to load restaurant elements
-        y = 500
-        for timer in range(0,70):
-            driver.execute_script("window.scrollTo(0, "+str(y)+")")
-            y += 500
-            time.sleep(0.05)
-        page_i_html = driver.page_source
-        time.sleep(0.1)
-        driver.close()
-        
-        text = soup(page_i_html, 'html.parser')
-        restaurants = text.find_all('div', attrs = {"class" : "_3uVfVbI1iLfMbszbU6KoOL"})
-        
-        for restaurant in restaurants:
-            
-            restaurant_child = restaurant.find('a', attrs = {"class":"_1e9PcCDb012hY4BcGfraQB"})
+    for i in range(1, num_results_pages + 1):
+        url = bookings_page_url(borough, tomorrow, i)
+        with tracer.context(borough = borough, url = url):
+            if i > 1:
+                html = fetcher.fetch(url)
             
-            # get restaurant url
-            rest_url = restaurant_child.get('href')
+            cards = extract_cards(html)
+        for card, restaurant_id in zip(cards, ids.intern_many([card['url'] for card in cards])):
             
-            # get number of bookings per day
-            booked_raw = restaurant.find_all('span', attrs = {"class": "_2VIffaVUDxw_-tEh-6XOB_ _2EluNCOTdgGq9H4SxGZwUg"})
-            booked_today = 0
-            if not (booked_raw is None):
-                for span in booked_raw:
-                    if 'Booked' in span.string:
-                        booked_today = int(re.search('\d+', span.string).group(0)) 
-                        
-            # zip url and bookings into dict
-            bookings_keys = ['url', today]
-            bookings_dict = dict(zip(bookings_keys, [None]*2))
-            bookings_dict['url'] = rest_url
-            bookings_dict[today] = booked_today
+            # collapse repeated listings of the same restaurant
+            if restaurant_id in seen:
+                continue
+            seen.add(restaurant_id)
             
-            # append current restaurant dict to bookings_list
-            bookings_list.append(bookings_dict)
-            
-        i+=1
-    
-    # write bookings_list to csv
-    headings_list = ['url', today]
-    with open(f'bookings_{borough}_{today}.csv', 'w', encoding = 'utf-8', newline='') as csvfile:
-        csv_writer = csv.writer(csvfile)
-        csv_writer.writerow(headings_list)
-
-        for item in bookings_list:
-            csv_writer.writerow(item.values())
\ No newline at end of file
+            # url and number of bookings per day
+            yield {'url': card['url'], 'restaurant_id': restaurant_id, today: card['booked']}
+
+def bookings_all_boroughs(boroughs = tuple(BOROUGHS), workers = 4, requests_per_second = 2, deadline = 45 * 60,
+                          out_path = None, store_path = None, ids_path = None):
+    """
+    bookings_all_boroughs: takes the daily bookings snapshot of every borough in one run. The results pages of all
+    boroughs share one pool of browser workers: each borough's front page is loaded first, and the rest of its pages
+    are queued as soon as its page count is known. Once every page is in, cards are deduplicated by restaurant id in
+    a fixed order, the order of boroughs then page order, so a restaurant listed in several boroughs is always
+    kept under the same one, and written by a single writer (the calling thread).
+
+    args:
+        boroughs: iterable of borough names, keys of BOROUGHS
+        workers: int, number of results pages loaded in parallel across all boroughs
+        requests_per_second: float, global limit on page loads sent to OpenTable. None for no limit
+        deadline: float, seconds the snapshot may take. Pages still queued then are left out and reported. Pages
+            already loading are waited for so no browser is left checked out of the pool, and then left out as
+            well, so the run ends at most one page load (chrome's page load timeout plus the scroll deadline) past
+            the deadline. None for no deadline
+        out_path: string, output csv, 'bookings_<date>.csv' by default
+        store_path: string, sqlite file of a BookingsStore (see bookings_store.py) the day is appended to, None to
+            only write the csv
+        ids_path: string, sqlite file of the restaurant id index (see restaurant_ids.py). Defaults to store_path
+            when a store is given, so the csv's restaurant_id are the store's ids, and to IDS_PATH otherwise
+
+    output:
+        csv file with columns 'url', 'restaurant_id', 'borough' and <date> (date format 'YYYY-mm-dd'), one row per
+        restaurant, url in canonical form. Rows are written to '<out_path>.part' in batches and the file is renamed
+        when they are all written (see csv_stream.py), so a crashed run never leaves a partial file under out_path
+        summary: dict with the number of 'rows' written, 'duplicates' dropped, and the list of (borough, page) that
+        were 'missed' because they failed or ran past the deadline
+    """
+    today = datetime.datetime.today().strftime('%Y-%m-%d')
+    tomorrow = (datetime.datetime.today()+datetime.timedelta(days=1)).strftime('%Y-%m-%d')
+    out_path = out_path or f'bookings_{today}.csv'
+    boroughs = list(boroughs)
+    end = None if deadline is None else time.monotonic() + deadline
+
+    set_rate(requests_per_second, burst = workers)
+    get_pool().grow(workers)
+    fetcher = SeleniumFetcher(maximize=False, scroll=True)
+
+    store, ids = _open_store(store_path, ids_path)
+    summary = {'rows': 0, 'duplicates': 0, 'missed': []}
+    # cards of each (borough, page) as it comes in, deduplicated once every page is in
+    pages = {}
+    executor = ThreadPoolExecutor(max_workers = workers)
+    try:
+        # front pages first, they decide how many more pages each borough has
+        pending = {executor.submit(tracer.bind(fetcher.fetch, borough = borough), bookings_page_url(borough, tomorrow, 1)): (borough, 1)
+                   for borough in boroughs}
+        while pending:
+            timeout = None if end is None else max(0, end - time.monotonic())
+            finished, _ = wait(pending, timeout = timeout, return_when = FIRST_COMPLETED)
+            if not finished:
+                print(f'deadline reached with {len(pending)} pages left')
+                break
+
+            for future in finished:
+                borough, page = pending.pop(future)
+                try:
+                    with tracer.context(borough = borough, url = bookings_page_url(borough, tomorrow, page)):
+                        html = future.result()
+                        pages[borough, page] = extract_cards(html)
+                        num_pages = results_page_count(extract_total_count(html)) if page == 1 else None
+                except Exception as e:
+                    print(f'{borough} page {page} failed: {e!r}')
+                    summary['missed'].append((borough, page))
+                    continue
+
+                if num_pages is not None:
+                    print(f'{borough}: {num_pages} pages of results')
+                    for i in range(2, num_pages + 1):
+                        pending[executor.submit(tracer.bind(fetcher.fetch, borough = borough),
+                                                bookings_page_url(borough, tomorrow, i))] = (borough, i)
+
+        summary['missed'] += sorted(pending.values())
+    finally:
+        # pages still queued at the deadline are cancelled, and the pages already loading are waited for so their
+        # browsers are back in the pool when the function returns. Their results are dropped
+        executor.shutdown(wait = True, cancel_futures = True)
+
+    # a restaurant listed in several boroughs is kept under the first of them in boroughs, on its first page there,
+    # whatever order the pages finished loading in
+    order = {borough: i for i, borough in enumerate(boroughs)}
+    seen = set()
+    with StreamingCsvWriter(out_path, ['url', 'restaurant_id', 'borough', today], batch_size = 500) as writer:
+        for borough, page in sorted(pages, key = lambda key: (order[key[0]], key[1])):
+            cards = pages[borough, page]
+            for card, restaurant_id in zip(cards, ids.intern_many([card['url'] for card in cards])):
+                if restaurant_id in seen:
+                    summary['duplicates'] += 1
+                    continue
+                seen.add(restaurant_id)
+                writer.write({'url': canonical_url(card['url']), 'restaurant_id': restaurant_id,
+                              'borough': borough, today: card['booked']})
+                summary['rows'] += 1
+
+    print(f"{summary['rows']} restaurants written to {out_path}, {summary['duplicates']} duplicates dropped, "
+          f"{len(summary['missed'])} pages missed")
+    if store is not None:
+        print(f'{store.ingest_csv(out_path)} rows added to {store_path}')
+        store.close()
+    get_pool().report()
+    wait_log.report()
+    tracer.report()
+    return summary
@@ -1,140 +1,315 @@
-from selenium import webdriver
-from bs4 import BeautifulSoup as soup
-import re
 import time
-import csv
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from crawl_journal import CrawlJournal
+from csv_stream import StreamingCsvWriter
+from driver_pool import get_pool
+from fetch import SeleniumFetcher, get_fetcher
+from extract import extract_cards, extract_restaurant, extract_total_count, results_page_count
+from page_cache import PageCache
+from rate_limit import set_rate
+from restaurant_ids import IDS_PATH, get_ids
+from snapshots import MAX_AGE, SNAPSHOTS_PATH, SnapshotStore
+from tracing import tracer
+from urls import BASE_URL
+from waits import wait_log
 
-def nyc_opentable_scraper(borough, date, starting_page):
+
+REST_KEYS = ['name', 'url', 'is_member', 'promoted', 'price_tier', 'review_count', 'overall', 'food', 'service', 'ambience', 'value',
+   'noise', 'pct_recommended', 'neighborhood', 'cuisines', 'dining_style', 'dress_code', 'chef', 'tags',
+   'primary_cuisine', 'sanitizing', 'distancing', 'ppe', 'screening', 'restaurant_id']
+
+# 'regionIds' identifier number of each borough in OpenTable search results urls
+REGION_IDS = {'manhattan': '16', 'brooklyn': '24', 'queens': '17', 'bronx': '324', 'staten_island': '18'}
+
+
+def results_page_url(borough, date, page):
+    """
+    results_page_url: url of one page of OpenTable search results for a borough and date, sorted by newest arrivals
+    """
+    return (f'{BASE_URL}/s?dateTime={date}T20%3A00%3A00&covers=1&metroId=8&regionIds%5B%5D={REGION_IDS[borough]}'
+            f'&term=&sortBy=newest_arrivals&queryUnderstandingType=none&page={page}')
+
+
+def nyc_opentable_scraper(borough, date, workers = 1, requests_per_second = 2, backend = 'selenium',
+                          cache_dir = None, replay = False, journal_path = 'crawl_journal.db', max_attempts = 3,
+                          retry_backoff = 30, ids_path = IDS_PATH, snapshot_path = SNAPSHOTS_PATH, refresh = False,
+                          max_age = MAX_AGE):
     """
     nyc_opentable_scraper: given a borough and date, scrapes the OpenTable search results front page to see how many pages of
-    results there are for that borough and date. Calls get_restaurants() on each of those results pages, and writes
-    the information scraped from each restaurant to a line in a csv file by calling restaurants_to_csv()
+    results there are for that borough and date. Scrapes the cards on each of those results pages, then the restaurant page
+    of every restaurant found with get_restaurant_info(), and writes the information scraped from each restaurant to a line
+    in a csv file by calling restaurants_to_csv()
+
+    Progress is kept in a crawl journal (see crawl_journal.py): calling the function again with the same borough, date and
+    journal skips every results page and restaurant already done and only retries what failed.
+
+    With refresh = True only the restaurant pages of new restaurants, restaurants whose card changed (name, 'Newly added'
+    badge, membership or promoted status) and restaurants last read more than max_age seconds ago are fetched. Every
+    other restaurant is carried forward from its last snapshot (see snapshots.py), so a periodic refresh costs the
+    results pages plus the restaurant pages that changed.
     
     args:
         borough: string, one of 'manhattan', 'brooklyn', 'bronx', 'queens', or 'staten_island'
         date: string in format 'YYYY-mm-dd'
             WARNING: passing a date earlier than the current date will not provide correct information
-        starting_page: int, the number of the search results pages to start scraping from
-            Usually 1. Mostly implemented to pick up where it left off during debugging if there was an error
+        workers: int, number of restaurant pages fetched in parallel
+        requests_per_second: float, global limit on requests sent to OpenTable across all workers. None for no limit
+        backend: string, 'selenium' or 'http', how restaurant pages are downloaded (see fetch.py). 'http' skips the
+            browser for restaurant pages and is much faster, results pages always use selenium
+        cache_dir: string, directory of a PageCache (see page_cache.py). Pages found there are not fetched again
+            while fresh, fetched pages are stored. Search results are cached per date, restaurant pages once for all
+            dates. None to fetch everything
+        replay: bool, serve every page from cache_dir and never touch the network, for re-extracting a past crawl.
+            Raises page_cache.CacheMiss on a page that isn't cached
+        journal_path: string, sqlite file of the crawl journal
+        max_attempts: int, number of times a results page or restaurant page is tried before it is left as failed
+        retry_backoff: float, seconds before the first retry of a failed page, doubled after every further failure
+        ids_path: string, sqlite file of the restaurant id index (see restaurant_ids.py). A restaurant found on more
+            than one results page is only kept the first time. Pass the file of a BookingsStore (see bookings_store.py)
+            so the restaurant_id column joins its bookings and BookingAggregates
+        snapshot_path: string, sqlite file of the restaurant snapshots, updated with every restaurant page read. None
+            to keep no snapshots
+        refresh: bool, carry unchanged restaurants forward from snapshot_path instead of reading their pages again
+        max_age: float, seconds after which a restaurant page is read again in a refresh even if its card is
+            unchanged. None to never expire snapshots
     
     output:
-        Creates a csv file named <date>_<borough>_page<i> for each page of search results for input borough and date
+        Creates a csv file named <date>_<borough>_page<i> for each page of search results for input borough and date,
+        rebuilt from the journal. Restaurants that failed every attempt are written with only their card information
     
     """
-    i = starting_page
-    frontpages = {
-    'manhattan' : f'https://www.opentable.com/s?dateTime={date}T20%3A00%3A00&covers=1&metroId=8&regionIds%5B%5D=16&term=&corrid=d0436a58-4f45-4c4f-9992-e70b98b5157f&sortBy=newest_arrivals&queryUnderstandingType=none&page={i}',
-    'brooklyn' : f'https://www.opentable.com/s?dateTime={date}T20%3A00%3A00&covers=1&metroId=8&regionIds%5B%5D=24&term=&corrid=d12a66c7-6561-4119-8bd9-8ddfb2719cca&sortBy=newest_arrivals&queryUnderstandingType=none&page={i}',
-    'queens' : f'https://www.opentable.com/s?dateTime={date}T20%3A00%3A00&covers=1&metroId=8&regionIds%5B%5D=17&term=&corrid=b58c0eae-160f-4ef7-90d7-c228211fe416&sortBy=newest_arrivals&queryUnderstandingType=none&page={i}',
-    'bronx' : f'https://www.opentable.com/s?dateTime={date}-20T20%3A00%3A00&covers=1&metroId=8&regionIds%5B%5D=324&term=&corrid=b58c0eae-160f-4ef7-90d7-c228211fe416&sortBy=newest_arrivals&queryUnderstandingType=none&page={i}',
-    'staten_island' :  f'https://www.opentable.com/s?dateTime={date}T20%3A00%3A00&covers=1&metroId=8&regionIds%5B%5D=18&term=&corrid=b58c0eae-160f-4ef7-90d7-c228211fe416&sortBy=newest_arrivals&queryUnderstandingType=none&page={i}'   
-    }
-    
-    if borough not in frontpages:
+    if borough not in REGION_IDS:
         raise ValueError("The 5 boroughs are 'manhattan', 'brooklyn', 'bronx', 'queens', and 'staten_island'")
-    
-    results_frontpage = frontpages[borough]
-    driver=webdriver.Chrome()
-    driver.get(results_frontpage)
-    frontpage_html = driver.page_source
-    time.sleep(0.1)
-    driver.close()
-    
-    frontpage_soup = soup(frontpage_html, 'html.parser')
-    total_restaurants = int(re.search('\d+', frontpage_soup.find('h3', attrs = {"class" : "_6X5n-Vu8eAbxx_nrEuxjc", "data-test" : "multi-search-total-count"}).string).group(0))
-    print(total_restaurants)
-    if total_restaurants % 100 == 0:
-        num_results_pages = (total_restaurants/100)
+    if refresh and snapshot_path is None:
+        raise ValueError('refresh needs a snapshot_path')
+
+    set_rate(requests_per_second, burst = workers)
+    cache = PageCache(cache_dir, replay = replay) if cache_dir is not None else None
+    # restaurant pages don't depend on the search date, cached copies are shared by the crawls of every date
+    fetcher = get_fetcher(backend, workers, cache, 'restaurant')
+    results_fetcher = get_fetcher('selenium_scroll', cache = cache, page_type = 'search', query_date = date)
+    journal = CrawlJournal(journal_path)
+    ids = get_ids(ids_path)
+    snapshots = SnapshotStore(snapshot_path) if snapshot_path is not None else None
+    carried_total = 0
+
+    num_results_pages = journal.page_count(borough, date)
+    if num_results_pages is None:
+        # the front page is results page 1 and gives the number of pages. It is journaled before it is fetched, so a
+        # failure on it is retried with backoff like any other page
+        journal.begin(borough, date, results_page_url(borough, date, 1))
     else:
-        num_results_pages = int((total_restaurants/100) + 1)
-    
-    print(f'Total results pages: {num_results_pages}')
-          
-    rest_keys = ['name', 'url', 'is_member', 'promoted', 'price_tier', 'review_count', 'overall', 'food', 'service', 'ambience', 'value',
-       'noise', 'pct_recommended', 'neighborhood', 'cuisines', 'dining_style', 'dress_code', 'chef', 'tags',
-       'primary_cuisine', 'sanitizing', 'distancing', 'ppe', 'screening']
-    i = 1
-    while i <= num_results_pages:
-        page_i = frontpages[borough]
-        print(page_i)
-        page_i_rest_list = get_restaurants(page_i)
-        restaurants_to_csv(page_i_rest_list, f'{date}_{borough}_page{i}.csv', rest_keys)
-        print()
+        print(f'Total results pages: {num_results_pages}')
+    # restarted crawl: finished work is skipped, everything that failed last time gets retried
+    journal.retry_failed(borough, date)
+
+    if workers > 1:
+        get_pool().grow(workers)
+
+    def fetch_info(record):
+        get_restaurant_info(record['url'], record, fetcher)
+        return record
+
+    while True:
+        # results pages still to do: add their restaurants to the journal, minus restaurants already on another page
+        seen = {record.get('restaurant_id') for record in journal.records(borough, date)}
+        for i, page_i in journal.pages_to_fetch(borough, date, max_attempts):
+            print(page_i)
+            try:
+                with tracer.context(borough = borough, url = page_i):
+                    results_html = results_fetcher.fetch(page_i)
+                    if num_results_pages is None:
+                        total_restaurants = extract_total_count(results_html)
+                        print(total_restaurants)
+                        num_results_pages = results_page_count(total_restaurants)
+                        print(f'Total results pages: {num_results_pages}')
+                        journal.start(borough, date, [results_page_url(borough, date, page) for page in range(1, num_results_pages + 1)])
+                    records = restaurant_cards(page_i, results_fetcher, ids, seen, results_html)
+            except Exception as e:
+                journal.page_failed(borough, date, i, e, retry_backoff)
+                print(f'results page {i} failed: {e!r}')
+                continue
+            # unchanged restaurants are filled in from their snapshot and recorded as done
+            carried = snapshots.carry_forward(records, max_age) if refresh else set()
+            carried_total += len(carried)
+            journal.page_done(borough, date, i, records, carried)
+
+        # restaurant pages still to do, fetched in parallel and recorded as each one finishes
+        todo = journal.restaurants_to_fetch(borough, date, max_attempts)
+        with ThreadPoolExecutor(max_workers = workers) as executor:
+            futures = {executor.submit(tracer.bind(fetch_info, borough = borough), record): (page, position, record)
+                       for page, position, record in todo}
+            for future in as_completed(futures):
+                page, position, record = futures[future]
+                try:
+                    record = future.result()
+                    journal.restaurant_done(borough, date, page, position, record)
+                    if snapshots is not None:
+                        snapshots.put_many([record])
+                    print(record['name'], end = ', ')
+                except Exception as e:
+                    journal.restaurant_failed(borough, date, page, position, e, retry_backoff)
+                    print(f'\n{record["url"]} failed: {e!r}')
+
+        # wait for the next failed page that may be retried, stop when there is none
+        next_retry = journal.next_retry(borough, date, max_attempts)
+        if next_retry is None:
+            break
+        time.sleep(max(0, next_retry - time.time()))
+
+    print()
+    if num_results_pages is None:
+        print(f'front page failed {max_attempts} times, nothing to export: {journal.status(borough, date)}')
+        num_results_pages = 0
+    for i in range(1, num_results_pages + 1):
+        with tracer.context(borough = borough):
+            restaurants_to_csv(journal.records(borough, date, i), f'{date}_{borough}_page{i}.csv', REST_KEYS)
         print(f'exported page {i}')
-     
-def get_restaurants(results_url):
+    print(journal.status(borough, date))
+    if refresh:
+        print(f'{carried_total} unchanged restaurants carried forward from {snapshot_path}')
+
+    journal.close()
+    if snapshots is not None:
+        snapshots.close()
+    get_pool().report()
+    wait_log.report()
+    tracer.report()
+    if cache is not None:
+        cache.report()
+
+def restaurant_cards(results_url, results_fetcher = None, ids = None, seen = None, results_html = None):
     """
-    get_restaurants: gets names, urls, and promoted status of all restaurant pages on a given search results page
-        Calls get_restaurant_info() on each of the urls found.
+    restaurant_cards: gets names, urls, and promoted status of all restaurants on a given search results page, without
+        visiting the restaurant pages
     
     args:
         results_url: the url of the search results page to scrape
+        results_fetcher: fetch backend used for the results page, it needs scrolling to load every restaurant.
+            SeleniumFetcher(scroll = True) if None
+        ids: RestaurantIds from restaurant_ids.py, get_ids() if None
+        seen: set of restaurant ids already scraped, e.g. on earlier results pages. Cards of those restaurants, and
+            repeated cards on this page, are dropped. The ids of this page are added to it
+        results_html: string, html of the page if it was already fetched, e.g. the front page read for its page count
         
     output:
-        rest_list: a list of dictionaries, each containing the information from one restaurant, scraped both by
-        this function and by get_restaurant_info()
+        rest_list: a list of dictionaries with every key in REST_KEYS, in results page order, one per restaurant.
+        Only name, url, is_member, promoted and restaurant_id are filled in
     """
-    driver=webdriver.Chrome()
-    driver.get(results_url)
-
-    # scroll down page incrementally to load restaurant elements
-    y = 500
-    for timer in range(0,70):
-        driver.execute_script("window.scrollTo(0, "+str(y)+")")
-        y += 500
-        time.sleep(0.05)
-    results_html = driver.page_source
-    time.sleep(0.1)
-    driver.close()
+    if results_fetcher is None:
+        results_fetcher = SeleniumFetcher(maximize = False, scroll = True)
+    if ids is None:
+        ids = get_ids()
+    if seen is None:
+        seen = set()
+    with tracer.context(url = results_url):
+        if results_html is None:
+            results_html = results_fetcher.fetch(results_url)
+        cards = extract_cards(results_html)
+    print(f'{len(cards)} restaurants on results page {results_url} found')
     
+    rest_list = []
     
-    results = soup(results_html, 'html.parser')
-    restaurants = results.find_all('div', attrs = {"class" : "_3uVfVbI1iLfMbszbU6KoOL"})
-    print(f'{len(restaurants)} restaurants on results page {results_url} found')
-    
-    rest_list = [None]*len(restaurants)
-    
-    rest_keys = ['name', 'url', 'is_member', 'promoted', 'price_tier', 'review_count', 'overall', 'food', 'service', 'ambience', 'value',
-       'noise', 'pct_recommended', 'neighborhood', 'cuisines', 'dining_style', 'dress_code', 'chef', 'tags',
-       'primary_cuisine', 'sanitizing', 'distancing', 'ppe', 'screening']
-    
-    i = 0
-    for restaurant in restaurants:
+    for card, restaurant_id in zip(cards, ids.intern_many([card['url'] for card in cards])):
+        # the same restaurant can be listed twice, keep its first card
+        if restaurant_id in seen:
+            continue
+        seen.add(restaurant_id)
         
         # initialize all keys to None
-        curr_rest_dict = dict(zip(rest_keys, [None]*len(rest_keys)))
-        
-        # get restaurant name
-        restaurant_child = restaurant.find('a', attrs = {"class":"_1e9PcCDb012hY4BcGfraQB"})
-        curr_rest_dict['name'] = restaurant_child.get('aria-label')
-
-        # get restaurant url
-        rest_url = restaurant_child.get('href')
-        curr_rest_dict['url'] = rest_url
+        curr_rest_dict = dict(zip(REST_KEYS, [None]*len(REST_KEYS)))
+        curr_rest_dict['name'] = card['name']
+        curr_rest_dict['url'] = card['url']
+        curr_rest_dict['restaurant_id'] = restaurant_id
         
         # check whether restaurant is on opentable's reservation service. If not, there will be no details on restaurant page and we can skip
-        curr_rest_dict['is_member'] = 0 if restaurant.find('p', attrs = {"class":"_1RzTbFM0hmdDgWfT_RmXel"}) else 1
+        curr_rest_dict['is_member'] = card['is_member']
 
         if curr_rest_dict['is_member'] == 1:
 
             # get promoted status
-            curr_rest_dict['promoted'] = 1 if restaurant.get('data-promoted') == 'true' else 0
+            curr_rest_dict['promoted'] = card['promoted']
 
-            get_restaurant_info(curr_rest_dict['url'], curr_rest_dict)
+        rest_list.append(curr_rest_dict)
 
-        print(curr_rest_dict['name'], end = ', ')
-        rest_list[i] = curr_rest_dict
-        i+=1
-         
+    if len(rest_list) < len(cards):
+        print(f'{len(cards) - len(rest_list)} repeated restaurants dropped')
     return rest_list
 
-def get_restaurant_info(url, curr_rest_dict):
+def get_restaurants(results_url, workers = 1, fetcher = None, results_fetcher = None, ids = None, snapshots = None,
+                    max_age = MAX_AGE):
+    """
+    get_restaurants: gets names, urls, and promoted status of all restaurant pages on a given search results page
+        Calls get_restaurant_info() on each of the urls found.
+    
+    args:
+        results_url: the url of the search results page to scrape
+        workers: int, number of restaurant pages fetched and parsed in parallel. 1 fetches them one at a time.
+            Requests from all workers share the global limit in rate_limit.opentable_limiter
+        fetcher: fetch backend from fetch.py used for the restaurant pages, SeleniumFetcher if None.
+        results_fetcher: fetch backend used for the results page, it needs scrolling to load every restaurant.
+            SeleniumFetcher(scroll = True) if None
+        ids: RestaurantIds from restaurant_ids.py assigning each restaurant its 'restaurant_id', get_ids() if None
+        snapshots: SnapshotStore from snapshots.py. Restaurants whose card is unchanged since a snapshot at most
+            max_age seconds old are filled in from it instead of fetched, fetched restaurants are stored in it.
+            None fetches every restaurant page
+        max_age: float, seconds after which a snapshot is too old to be used, None to never expire snapshots
+        
+    output:
+        rest_list: a list of dictionaries, each containing the information from one restaurant, scraped both by
+        this function and by get_restaurant_info(). A restaurant listed twice on the page appears once
+    """
+    return list(iter_restaurants(results_url, workers, fetcher, results_fetcher, ids, snapshots, max_age))
+
+def iter_restaurants(results_url, workers = 1, fetcher = None, results_fetcher = None, ids = None, snapshots = None,
+                     max_age = MAX_AGE):
+    """
+    iter_restaurants: generator version of get_restaurants(), same args. Yields each restaurant dict as soon as its
+        restaurant page is scraped, in results page order, so it can be streamed into restaurants_to_csv()
+    """
+    rest_list = restaurant_cards(results_url, results_fetcher, ids)
+    carried = snapshots.carry_forward(rest_list, max_age) if snapshots is not None else set()
+    if carried:
+        print(f'{len(carried)} unchanged restaurants carried forward')
+
+    # fetch restaurant pages for members only. get_restaurant_info() fills in each dict in place, so dicts are
+    # yielded in the order of the results page however the detail pages are scheduled
+    members = [rest_dict for position, rest_dict in enumerate(rest_list)
+               if rest_dict['is_member'] == 1 and position not in carried]
+
+    def fetch_info(rest_dict):
+        get_restaurant_info(rest_dict['url'], rest_dict, fetcher)
+        return rest_dict
+
+    def fetched(rest_dict):
+        # snapshots are written from this thread only, see SnapshotStore
+        if snapshots is not None:
+            snapshots.put_many([rest_dict])
+        print(rest_dict['name'], end = ', ')
+
+    if workers > 1:
+        get_pool().grow(workers)
+        with ThreadPoolExecutor(max_workers = workers) as executor:
+            # executor.map returns members in submission order, which is their order in rest_list
+            results = executor.map(tracer.bind(fetch_info), members)
+            for position, rest_dict in enumerate(rest_list):
+                if rest_dict['is_member'] == 1 and position not in carried:
+                    fetched(next(results))
+                yield rest_dict
+    else:
+        for position, rest_dict in enumerate(rest_list):
+            if rest_dict['is_member'] == 1 and position not in carried:
+                fetched(fetch_info(rest_dict))
+            yield rest_dict
+
+def get_restaurant_info(url, curr_rest_dict, fetcher = None):
     """
     get_restaurant_info: extracts information from restaurant pages whose urls were found by get_restaurants()
     
     args:
         url: url of the restaurant page
         curr_rest_dict: the dict of information on each restaurant generated by get_restaurants()
+        fetcher: fetch backend from fetch.py used to download the page, SeleniumFetcher if None
     
     output:
         no return, mutating function
@@ -176,119 +351,41 @@ def get_restaurant_info(url, curr_rest_dict):
             screening: customer temperature checking, contact tracing
         
     """
-    driver=webdriver.Chrome()
-    driver.get(url)
-    driver.maximize_window() # maximize to make sure page sidebar is loaded
-    rest_html = driver.page_source
-    driver.close()
+    if fetcher is None:
+        fetcher = SeleniumFetcher()
+    with tracer.context(url = url):
+        rest_html = fetcher.fetch(url)
+        parse_restaurant_page(rest_html, curr_rest_dict)
 
-    curr_rest = soup(rest_html, 'html.parser')
-    
-    # get number of reviews, price range
-    divs = curr_rest.find_all('div', attrs = {"class" : "c3981cf8 _965a91d5"})
-    for div in divs:
-        spans = div.find_all('span')
-        for span in spans:
-            if "Reviews" in span.string:
-                curr_rest_dict['review_count'] = span.string
-            if "$" in span.string:
-                curr_rest_dict['price_tier'] = span.string
-                
-    has_reviews = 1 
-    if curr_rest_dict['review_count'] == "No Reviews":
-        has_reviews = 0
-    
-    # get overall rating and subratings
-    if has_reviews:
-        curr_rest_dict['overall'] = float(curr_rest.find('div', attrs = {"class" : "oc-reviews-491257d8"}).span.string)
-        subreviews = curr_rest.find_all('div', attrs = {"class" : "oc-reviews-15d38b07"})
-        if subreviews != []:
-            curr_rest_dict['food'] = float(subreviews[0].string)
-            curr_rest_dict['service'] = float(subreviews[1].string)
-            curr_rest_dict['ambience'] = float(subreviews[2].string)
-            curr_rest_dict['value'] = float(subreviews[3].string)
-
-    # get noise level
-    noise_level = curr_rest.find('span', attrs = {"class" : "oc-reviews-624ebf8b"})
-    if not (noise_level is None):
-        curr_rest_dict['noise'] = noise_level.string
-    
 
-    # get percent of reviewers who would recommended to a friend
-    if has_reviews:
-        recs_parent = curr_rest.find_all('div', attrs = {"class" : "oc-reviews-8c8e52a0"})
-        has_recs = 0
-        for div in recs_parent:
-            spans = div.find_all('span', attrs = {"class" : "oc-reviews-624ebf8b"})
-            for span in spans:
-                if span.string == 'would recommend it to a friend':
-                    has_recs = 1
-        
-        if has_recs == 1:
-            recs = curr_rest.find_all('div', attrs = {"class" : "oc-reviews-dfc07aec"})[1]
-            recs_2 = re.search('\d+%', recs.get_text())
-            if not (recs_2 is None):
-                rec_string = recs_2.group(0)
-                curr_rest_dict['pct_recommended'] = int(re.search('\d+', rec_string).group(0))
-
-    details_tags = ['neighborhood', 'cuisines', 'dining_style', 'dress_code', 'chef', 'tags']
-
-    # zip (field, value) tuples of restaurant page sidebar information into details_list
-    sidebar = curr_rest.find('div', attrs = {"class":"_1e466fbf"})
-    if not(sidebar is None):
-        details = sidebar.find_all('div', attrs = {"class":"df8add00"})
-        details_list = [zip(item.find_all('div', attrs = {"class":"c3981cf8 _965a91d5"}), 
-                            item.find_all('div', attrs = {"class":"e7ff71b6 b2f6d1a4"})) for item in details] 
-        for i in range(len(details_list)):
-            for x, y in details_list[i]:
-                details_list[i] = (x.string, y.string)
-
-        # filter details_list for desired information, add info to curr_rest_dict
-        desired_details = zip(['Neighborhood', 'Cuisines', 'Dining Style', 'Dress code', '(?i)(.*chef.*)', 'Additional'], details_tags)
-
-        for x, y in desired_details:
-            for a, b in details_list:
-                if re.search(x, a):
-                    curr_rest_dict[y] = b
+def parse_restaurant_page(rest_html, curr_rest_dict):
+    """
+    parse_restaurant_page: extracts the fields listed in get_restaurant_info() from the html of a restaurant page.
+        Works on html from any fetch backend, or from a saved page
     
-    # gets first tag in cuisines as primary cuisine
-    if not (curr_rest_dict['cuisines'] is None):
-        curr_rest_dict['primary_cuisine'] = curr_rest_dict['cuisines'].split(',')[0]
+    args:
+        rest_html: string, html of the restaurant page
+        curr_rest_dict: the dict of information on each restaurant generated by get_restaurants()
     
-    # check whether restaurant has safety information element at all
-    if not (curr_rest.find('div', attrs = {"id" : "safety-precautions"}) is None):
-        
-        safety_categories = ['Cleaning & Sanitizing', 'Physical Distancing', 'Protective Equipment','Screening']
-        safety_tags = ['sanitizing', 'distancing', 'ppe', 'screening']
-        
-        # set keys for safety information to 0
-        for item in safety_tags:
-            curr_rest_dict[item] = 0
-
-
-        # get COVID-19 safety information
-        safety_html = curr_rest.find_all('div', attrs = {"class" : "_77b505d0 _965a91d5"})
-        safety_features = [item.find('span').string for item in safety_html]
-
-        for i in range(len(safety_categories)):
-            for j in range(len(safety_features)):
-                if safety_categories[i] == safety_features[j]:
-                    curr_rest_dict[safety_tags[i]] = 1
+    output:
+        no return, mutating function, see get_restaurant_info()
+    """
+    extract_restaurant(rest_html, curr_rest_dict)
 
 
 def restaurants_to_csv(rest_list, filename, headings_list):
     """
-    writes information scraped by other functions to csv file
-    
-    Args: 
-        rest_list: the list of dictionaries of restaurant information created by get_restaurants()
+    writes information scraped by other functions to csv file, streaming: rows are written as rest_list produces them
+    and the file only appears under filename once it is complete (see csv_stream.py)
+
+    Args:
+        rest_list: iterable of dictionaries of restaurant information, e.g. the list from get_restaurants() or the
+            generator from iter_restaurants()
         filename: string, the name of the output csv file
-        headings_list: list containing column names for the csv file
-        
-    """
-    with open(filename, 'w', encoding = 'utf-8', newline='') as csvfile:
-        csv_writer = csv.writer(csvfile)
-        csv_writer.writerow(headings_list)
+        headings_list: list containing column names for the csv file, in column order
 
-        for rest_dict in rest_list:
-            csv_writer.writerow(rest_dict.values())
\ No newline at end of file
+    output:
+        count: int, number of restaurants written
+    """
+    with StreamingCsvWriter(filename, headings_list) as writer:
+        return writer.write_all(rest_list)
\ No newline at end of file
@@ -0,0 +1,221 @@
+import gzip
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from urls import canonical_url
+
+
+# seconds a cached page stays fresh, by page type. Restaurant details rarely change, search results carry the
+# booking counts and go stale within the day
+DEFAULT_TTLS = {'search': 60 * 60, 'restaurant': 7 * 24 * 60 * 60, 'reviews': 24 * 60 * 60}
+
+
+class CacheMiss(Exception):
+    """
+    CacheMiss: raised in replay mode when a page is not in the cache
+    """
+
+
+class PageCache:
+    """
+    PageCache: on-disk cache of raw page html. Pages are stored gzip compressed under the sha256 of their
+        content, so identical pages are stored once, and indexed in sqlite by canonical url and query date.
+
+    args:
+        cache_dir: string, directory holding index.db and the objects/ folder, created if needed
+        max_bytes: int, size limit of the compressed pages, least recently used pages are evicted past it
+        ttls: dict of page type -> seconds a page stays fresh, defaults to DEFAULT_TTLS
+        replay: bool, serve only from the cache and ignore ttls. A page that isn't cached raises CacheMiss,
+            nothing is ever fetched
+
+    layout:
+        <cache_dir>/index.db                     entries (url, query date, page type, digest, fetch/access times)
+        <cache_dir>/objects/ab/abcdef....html.gz page contents, named by sha256
+    """
+
+    def __init__(self, cache_dir, max_bytes=2 * 1024**3, ttls=None, replay=False):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.replay = replay
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(os.path.join(cache_dir, 'objects'), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(cache_dir, 'index.db'), check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                query_date TEXT NOT NULL,
+                page_type TEXT NOT NULL,
+                digest TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access);
+            CREATE INDEX IF NOT EXISTS entries_digest ON entries (digest);
+            CREATE TABLE IF NOT EXISTS objects (
+                digest TEXT PRIMARY KEY,
+                size INTEGER NOT NULL
+            );
+        """)
+        self._db.commit()
+
+    @staticmethod
+    def key(url, query_date=None):
+        """
+        key: index key of a page, '<query date>|<canonical url>'
+        """
+        return f'{query_date or ""}|{canonical_url(url)}'
+
+    def _object_path(self, digest):
+        return os.path.join(self.cache_dir, 'objects', digest[:2], digest + '.html.gz')
+
+    def get(self, url, page_type, query_date=None):
+        """
+        get: returns the cached html of url, or None if it isn't cached or is older than the ttl for page_type
+
+        args:
+            url: string, page url, any variant that canonicalizes to the same page
+            page_type: string, key of ttls, e.g. 'search' or 'restaurant'
+            query_date: string, the date the page was requested for, e.g. the search date 'YYYY-mm-dd'
+        """
+        key = self.key(url, query_date)
+        with self._lock:
+            row = self._db.execute('SELECT digest, fetched_at FROM entries WHERE key = ?', (key,)).fetchone()
+            fresh = row is not None and (self.replay or time.time() - row[1] <= self.ttls.get(page_type, 0))
+            if fresh:
+                self._db.execute('UPDATE entries SET last_access = ? WHERE key = ?', (time.time(), key))
+                self._db.commit()
+
+        if not fresh:
+            self.misses += 1
+            if self.replay:
+                raise CacheMiss(f'{key} is not in the cache')
+            return None
+
+        try:
+            with gzip.open(self._object_path(row[0]), 'rt', encoding='utf-8') as f:
+                html = f.read()
+        except FileNotFoundError:
+            # object removed from under the index, treat as a miss
+            self.misses += 1
+            if self.replay:
+                raise CacheMiss(f'{key} is missing from {self.cache_dir}')
+            return None
+        self.hits += 1
+        return html
+
+    def put(self, url, html, page_type, query_date=None):
+        """
+        put: stores the html of url, replacing any older copy, then evicts least recently used pages if the cache
+            is over max_bytes
+        """
+        data = html.encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._object_path(digest)
+
+        if not os.path.exists(path):
+            # write under a temporary name and rename, so a crash never leaves a truncated page behind
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with gzip.open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+
+        now = time.time()
+        key = self.key(url, query_date)
+        with self._lock:
+            old = self._db.execute('SELECT digest FROM entries WHERE key = ?', (key,)).fetchone()
+            self._db.execute('INSERT OR IGNORE INTO objects (digest, size) VALUES (?, ?)',
+                             (digest, os.path.getsize(path)))
+            self._db.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)',
+                             (key, canonical_url(url), query_date or '', page_type, digest, now, now))
+            # a page whose content changed moves to a new object, the old one goes unless another entry shares it
+            if old is not None and old[0] != digest:
+                self._drop_if_unreferenced(old[0])
+            self._db.commit()
+        self.evict()
+
+    def size(self):
+        """
+        size: total bytes of compressed pages referenced by the cache
+        """
+        with self._lock:
+            return self._db.execute('SELECT COALESCE(SUM(size), 0) FROM objects').fetchone()[0]
+
+    def evict(self):
+        """
+        evict: drops least recently used entries until the cache fits in max_bytes. Page files no longer
+            referenced by any entry are deleted
+        """
+        with self._lock:
+            total = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM objects').fetchone()[0]
+            if total <= self.max_bytes:
+                return
+
+            # objects left behind by caches written before put() removed replaced pages go first
+            for (digest,) in self._db.execute('SELECT digest FROM objects WHERE digest NOT IN (SELECT digest FROM entries)').fetchall():
+                total -= self._drop_if_unreferenced(digest)
+
+            for key, digest in self._db.execute('SELECT key, digest FROM entries ORDER BY last_access').fetchall():
+                if total <= self.max_bytes:
+                    break
+                self._db.execute('DELETE FROM entries WHERE key = ?', (key,))
+                total -= self._drop_if_unreferenced(digest)
+            self._db.commit()
+
+    def _drop_if_unreferenced(self, digest):
+        # deletes the object and its page file if no entry uses it, returns the bytes freed. Called with the lock held
+        if self._db.execute('SELECT 1 FROM entries WHERE digest = ? LIMIT 1', (digest,)).fetchone() is not None:
+            return 0
+        row = self._db.execute('SELECT size FROM objects WHERE digest = ?', (digest,)).fetchone()
+        self._db.execute('DELETE FROM objects WHERE digest = ?', (digest,))
+        try:
+            os.remove(self._object_path(digest))
+        except FileNotFoundError:
+            pass
+        return 0 if row is None else row[0]
+
+    def report(self):
+        """
+        report: prints hit/miss counts and the cache size
+        """
+        print(f'page cache: {self.hits} hits, {self.misses} misses, {self.size() / 1024**2:.1f} MB in {self.cache_dir}'
+              + (' (replay)' if self.replay else ''))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class CachedFetcher:
+    """
+    CachedFetcher: wraps a fetch backend (see fetch.py) with a PageCache
+
+    args:
+        fetcher: backend used on a cache miss, may be None in replay mode
+        cache: PageCache
+        page_type: string, page type the fetched pages are stored and expired as
+        query_date: string, date the pages are requested for, part of the cache key
+    """
+
+    def __init__(self, fetcher, cache, page_type, query_date=None):
+        self.fetcher = fetcher
+        self.cache = cache
+        self.page_type = page_type
+        self.query_date = query_date
+
+    def fetch(self, url):
+        """
+        fetch: returns the html of url from the cache, fetching and storing it on a miss
+        """
+        html = self.cache.get(url, self.page_type, self.query_date)
+        if html is None:
+            html = self.fetcher.fetch(url)
+            self.cache.put(url, html, self.page_type, self.query_date)
+        return html
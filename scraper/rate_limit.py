@@ -0,0 +1,65 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    TokenBucket: thread-safe token bucket used to cap the number of requests per second sent to OpenTable,
+    no matter how many workers are fetching pages
+
+    args:
+        rate: float, tokens added per second (sustained requests per second). None or 0 disables limiting
+        burst: int, maximum number of tokens that can be saved up, i.e. how many requests may go out back to back
+    """
+
+    def __init__(self, rate, burst=1):
+        self._lock = threading.Lock()
+        self.set_rate(rate, burst)
+
+    def set_rate(self, rate, burst=1):
+        """
+        set_rate: changes the rate and burst size, the bucket starts full
+        """
+        with self._lock:
+            self.rate = rate
+            self.burst = max(1, burst)
+            self._tokens = float(self.burst)
+            self._last = time.monotonic()
+
+    def acquire(self):
+        """
+        acquire: blocks until a token is available, then consumes it
+
+        output:
+            waited: float, seconds spent waiting for the token
+        """
+        if not self.rate:
+            return 0.0
+
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+
+# single bucket shared by every scraper function so concurrent workers stay under one global limit
+opentable_limiter = TokenBucket(rate=2, burst=2)
+
+
+def set_rate(rate, burst=1):
+    """
+    set_rate: sets the global requests per second limit for OpenTable
+
+    args:
+        rate: float, requests per second. None or 0 disables limiting
+        burst: int, number of requests allowed back to back
+    """
+    opentable_limiter.set_rate(rate, burst)
@@ -0,0 +1,107 @@
+import os
+import sqlite3
+import threading
+from urls import canonical_url
+
+
+# default id index of the scrapers. A BookingsStore keeps its index in its own sqlite file (see bookings_store.py),
+# scrapers writing for a store use that file instead so the ids in their csv files are the store's
+IDS_PATH = 'restaurant_ids.db'
+
+
+class RestaurantIds:
+    """
+    RestaurantIds: persistent index giving every restaurant a compact integer id. Every url variant of a restaurant
+        (tracking parameters, trailing slash, upper case host, see urls.canonical_url) gets the same id, and ids never
+        change once assigned. The whole index is held in a dict, sqlite only stores it between runs.
+
+    args:
+        path: string, sqlite file, created if needed
+
+    Safe to share between threads.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS restaurants (
+                id INTEGER PRIMARY KEY,
+                url TEXT NOT NULL UNIQUE
+            );
+        """)
+        self._db.commit()
+        self._ids = dict(self._db.execute('SELECT url, id FROM restaurants'))
+        self._urls = None
+
+    def intern(self, url):
+        """
+        intern: id of the restaurant at url, assigning the next free id if the restaurant is new
+        """
+        return self.intern_many([url])[0]
+
+    def intern_many(self, urls):
+        """
+        intern_many: list of ids for a list of urls, new restaurants are added in one transaction
+        """
+        keys = [canonical_url(url) for url in urls]
+        with self._lock:
+            new = [key for key in dict.fromkeys(keys) if key not in self._ids]
+            if new:
+                with self._db:
+                    for key in new:
+                        self._ids[key] = self._db.execute('INSERT INTO restaurants (url) VALUES (?)', (key,)).lastrowid
+                self._urls = None
+            return [self._ids[key] for key in keys]
+
+    def check(self, urls, restaurant_ids):
+        """
+        check: list of int ids from the restaurant_id column of a scraper csv, after checking that this index gave
+            them to those urls. Raises ValueError for a file written with another index
+        """
+        restaurant_ids = [int(restaurant_id) for restaurant_id in restaurant_ids]
+        for url, restaurant_id in zip(urls, restaurant_ids):
+            if self._ids.get(canonical_url(url)) != restaurant_id:
+                raise ValueError(f'restaurant_id {restaurant_id} of {url} was not assigned by {self.path}, the file '
+                                 'was written with another restaurant id index')
+        return restaurant_ids
+
+    def get(self, url):
+        """
+        get: id of the restaurant at url, None if it has none yet
+        """
+        return self._ids.get(canonical_url(url))
+
+    def url(self, restaurant_id):
+        """
+        url: canonical url of a restaurant id
+        """
+        with self._lock:
+            if self._urls is None:
+                self._urls = {restaurant_id: url for url, restaurant_id in self._ids.items()}
+            return self._urls[restaurant_id]
+
+    def __len__(self):
+        return len(self._ids)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+# one RestaurantIds per file, by absolute path. Indexes stay open for the life of the process, stores and scrapers
+# holding one keep using it whichever other files are opened
+_ids = {}
+_ids_lock = threading.Lock()
+
+
+def get_ids(path=IDS_PATH):
+    """
+    get_ids: returns the process-wide RestaurantIds at path, opening it on first use
+    """
+    key = os.path.abspath(path)
+    with _ids_lock:
+        if key not in _ids:
+            _ids[key] = RestaurantIds(path)
+        return _ids[key]
@@ -0,0 +1,108 @@
+import hashlib
+import json
+import sqlite3
+import time
+
+
+# default snapshot file of nyc_opentable_scraper()
+SNAPSHOTS_PATH = 'restaurant_snapshots.db'
+# default age after which a restaurant page is read again even if its card hasn't changed, a week
+MAX_AGE = 7 * 24 * 3600
+
+# fields of a restaurant record read from its search results card (see opentablescraper.restaurant_cards()), the
+# rest come from the restaurant page. 'name' carries the 'Newly added' badge of the card
+CARD_FIELDS = ('name', 'url', 'is_member', 'promoted', 'restaurant_id')
+# card fields that change when the restaurant page is worth reading again. The url is left out, its tracking
+# parameters differ on every load
+FINGERPRINT_FIELDS = ('name', 'is_member', 'promoted')
+
+
+def card_fingerprint(record):
+    """
+    card_fingerprint: short hash of the card fields of a restaurant record that signal a change on its restaurant page
+    """
+    values = json.dumps([record.get(key) for key in FINGERPRINT_FIELDS], ensure_ascii=False)
+    return hashlib.sha1(values.encode('utf-8')).hexdigest()[:16]
+
+
+class SnapshotStore:
+    """
+    SnapshotStore: latest scraped record of every restaurant, keyed by restaurant id (see restaurant_ids.py), with
+        the fingerprint of the card it was scraped from and when its restaurant page was read. Lets a crawl skip the
+        restaurant pages of restaurants whose card hasn't changed since they were last read.
+
+    args:
+        path: string, sqlite file, created if needed
+
+    Only use a store from one thread, like the crawl journal.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._db = sqlite3.connect(path)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS snapshots (
+                restaurant_id INTEGER PRIMARY KEY,
+                fingerprint TEXT NOT NULL,
+                scraped_at REAL NOT NULL,
+                record TEXT NOT NULL
+            );
+        """)
+        self._db.commit()
+
+    def put_many(self, records, scraped_at=None):
+        """
+        put_many: stores the records of restaurants whose restaurant page was just read, replacing their snapshots
+
+        args:
+            records: iterable of restaurant dicts with every key in REST_KEYS
+            scraped_at: float, time.time() the pages were read, now by default
+        """
+        scraped_at = time.time() if scraped_at is None else scraped_at
+        with self._db:
+            self._db.executemany('INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?)',
+                                 [(record['restaurant_id'], card_fingerprint(record), scraped_at, json.dumps(record))
+                                  for record in records])
+
+    def carry_forward(self, records, max_age=None):
+        """
+        carry_forward: fills in the restaurant page fields of every member restaurant whose card is unchanged since
+            its snapshot and whose snapshot is at most max_age seconds old. Card fields keep today's values
+
+        args:
+            records: list of restaurant dicts from the results page cards, changed in place
+            max_age: float, seconds after which a restaurant page is read again even if its card is unchanged. None
+                to never expire snapshots
+
+        output:
+            carried: set of positions in records that were filled in and need no restaurant page fetch. Every other
+            member restaurant is new, changed or stale
+        """
+        members = {record['restaurant_id']: position for position, record in enumerate(records)
+                   if record['is_member'] == 1}
+        if not members:
+            return set()
+        oldest = 0 if max_age is None else time.time() - max_age
+        carried = set()
+        ids = list(members)
+        # sqlite limits the number of parameters of a query, look ids up in chunks
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            rows = self._db.execute(f"""SELECT restaurant_id, fingerprint, record FROM snapshots
+                                        WHERE scraped_at >= ? AND restaurant_id IN ({', '.join('?' * len(chunk))})""",
+                                    [oldest] + chunk)
+            for restaurant_id, fingerprint, snapshot in rows:
+                record = records[members[restaurant_id]]
+                if fingerprint != card_fingerprint(record):
+                    continue
+                for key, value in json.loads(snapshot).items():
+                    if key not in CARD_FIELDS:
+                        record[key] = value
+                carried.add(members[restaurant_id])
+        return carried
+
+    def __len__(self):
+        return self._db.execute('SELECT COUNT(*) FROM snapshots').fetchone()[0]
+
+    def close(self):
+        self._db.close()
@@ -0,0 +1,282 @@
+"""
+tracing: per-stage timing of the scrapers. Every instrumented stage (browser launch, page load, scrolling, page_source,
+parsing, csv writes) is recorded as a span with its duration and the url and borough it was working on, written as
+one json line per span. Tracing is off by default and then costs one attribute check per stage.
+
+usage:
+    from tracing import tracer
+    tracer.enable('trace.jsonl')       # or set OPENTABLE_TRACE=trace.jsonl before starting python
+    nyc_opentable_scraper('manhattan', '2021-07-20')    # prints tracer.report() at the end
+    tracer.disable()
+
+    python tracing.py trace.jsonl [--top 10]
+        prints the slowest stages and pages of every run in a trace file
+
+Instrumenting code:
+    with tracer.span('parse', url = url):       # one timed stage
+        ...
+    with tracer.context(borough = borough):      # fields added to every span recorded inside the block
+        ...
+    @traced('parse')                             # times every call of a function
+    def extract_cards(html): ...
+    executor.submit(tracer.bind(fetch), url)     # carries the current context fields into a worker thread
+"""
+import argparse
+import contextvars
+import functools
+import json
+import math
+import os
+import threading
+import time
+
+
+# fields of the enclosing tracer.context() blocks
+_fields = contextvars.ContextVar('trace_fields', default={})
+
+
+class _NullSpan:
+    # returned by span() and context() while tracing is off
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **fields):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """
+    Span: one timed stage, see Tracer.span(). set() adds fields known only once the stage has run, e.g. a page size
+    """
+    __slots__ = ('tracer', 'stage', 'fields', 'wall', 'start')
+
+    def __init__(self, tracer, stage, fields):
+        self.tracer = tracer
+        self.stage = stage
+        self.fields = fields
+
+    def set(self, **fields):
+        self.fields.update(fields)
+
+    def __enter__(self):
+        self.wall = time.time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.start
+        if exc_type is not None:
+            self.fields['error'] = exc_type.__name__
+        self.tracer._emit(self.stage, self.wall, seconds, self.fields)
+        return False
+
+
+class _Context:
+    __slots__ = ('fields', 'token')
+
+    def __init__(self, fields):
+        self.fields = fields
+
+    def __enter__(self):
+        self.token = _fields.set({**_fields.get(), **self.fields})
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _fields.reset(self.token)
+        return False
+
+
+class Tracer:
+    """
+    Tracer: records spans to a json lines file while enabled. Each line is one span:
+        {"run": "20210720-201500-4242", "stage": "get", "start": 1626811200.12, "seconds": 1.734,
+         "url": "https://www.opentable.com/r/...", "borough": "manhattan", "thread": "ThreadPoolExecutor-0_1"}
+    plus any other fields given to span() or context(), and "error" with the exception type if the stage raised.
+
+    Safe to share between threads. The spans of the current run are also kept in memory for report().
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.path = None
+        self.run = None
+        self.records = []
+        self._file = None
+        self._lock = threading.Lock()
+
+    def enable(self, path='trace.jsonl'):
+        """
+        enable: starts a new run, appending its spans to the json lines file at path
+        """
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+            self.path = path
+            self.run = time.strftime('%Y%m%d-%H%M%S') + f'-{os.getpid()}'
+            self.records = []
+            self._file = open(path, 'a', encoding='utf-8', buffering=1)
+            self.enabled = True
+
+    def disable(self):
+        """
+        disable: stops recording and closes the trace file
+        """
+        with self._lock:
+            self.enabled = False
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def span(self, stage, **fields):
+        """
+        span: context manager timing one stage, e.g. with tracer.span('get', url = url): driver.get(url)
+        """
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, stage, fields)
+
+    def context(self, **fields):
+        """
+        context: context manager adding fields (url, borough, ...) to every span recorded inside it, in this thread
+        """
+        if not self.enabled:
+            return NULL_SPAN
+        return _Context(fields)
+
+    def bind(self, func, **fields):
+        """
+        bind: wraps func to run with the current context fields (plus fields), for functions handed to worker threads,
+            which don't see the submitting thread's context. Returns func itself while tracing is off
+        """
+        if not self.enabled:
+            return func
+        bound_fields = {**_fields.get(), **fields}
+
+        @functools.wraps(func)
+        def bound(*args, **kwargs):
+            token = _fields.set(bound_fields)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _fields.reset(token)
+        return bound
+
+    def _emit(self, stage, wall, seconds, fields):
+        record = {'run': self.run, 'stage': stage, 'start': round(wall, 3), 'seconds': round(seconds, 6),
+                  **_fields.get(), **fields, 'thread': threading.current_thread().name}
+        line = json.dumps(record, default=str)
+        with self._lock:
+            if self._file is None:
+                return
+            self.records.append(record)
+            self._file.write(line + '\n')
+
+    def report(self, top=10):
+        """
+        report: prints summary() of the current run, nothing if tracing is off
+        """
+        if self.enabled and self.records:
+            print_summary(summary(self.records, top), self.run, self.path)
+
+
+def traced(stage, **fields):
+    """
+    traced: decorator recording a span named stage, with the function name as 'call', for every call of the function
+    """
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return func(*args, **kwargs)
+            with Span(tracer, stage, {'call': func.__name__, **fields}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def _percentile(values, q):
+    # nearest-rank percentile of a sorted list
+    return values[max(0, math.ceil(q / 100 * len(values)) - 1)]
+
+
+def summary(records, top=10):
+    """
+    summary: slowest stages and pages of a list of span records
+
+    output:
+        {'stages': list of (stage, {'count', 'total', 'mean', 'p95', 'max', 'errors'}), largest total first,
+         'pages': list of (url, {'total', 'stages': {stage: seconds}}) of the top slowest urls, by the total time of
+            their spans}
+    """
+    durations = {}
+    errors = {}
+    pages = {}
+    for record in records:
+        stage, seconds = record['stage'], record['seconds']
+        durations.setdefault(stage, []).append(seconds)
+        if 'error' in record:
+            errors[stage] = errors.get(stage, 0) + 1
+        url = record.get('url')
+        if url is not None:
+            page = pages.setdefault(url, {'total': 0.0, 'stages': {}})
+            page['total'] += seconds
+            page['stages'][stage] = page['stages'].get(stage, 0.0) + seconds
+
+    stages = []
+    for stage, values in durations.items():
+        values.sort()
+        stages.append((stage, {'count': len(values), 'total': sum(values), 'mean': sum(values) / len(values),
+                               'p95': _percentile(values, 95), 'max': values[-1], 'errors': errors.get(stage, 0)}))
+    stages.sort(key=lambda item: item[1]['total'], reverse=True)
+    slowest = sorted(pages.items(), key=lambda item: item[1]['total'], reverse=True)[:top]
+    return {'stages': stages, 'pages': slowest}
+
+
+def print_summary(s, run=None, path=None):
+    print(f'trace of run {run}' + (f' ({path})' if path else ''))
+    for stage, t in s['stages']:
+        errors = f", {t['errors']} errors" if t['errors'] else ''
+        print(f"  {stage:<12}{t['count']:6d} spans {t['total']:9.2f}s total {t['mean']:7.3f}s mean "
+              f"{t['p95']:7.3f}s p95 {t['max']:7.3f}s max{errors}")
+    if s['pages']:
+        print('  slowest pages:')
+    for url, page in s['pages']:
+        stages = ', '.join(f'{stage} {seconds:.2f}s' for stage, seconds in
+                           sorted(page['stages'].items(), key=lambda item: item[1], reverse=True))
+        print(f"    {page['total']:7.2f}s  {url}  ({stages})")
+
+
+def read_trace(path):
+    """
+    read_trace: dict of run -> list of span records of a trace file, in file order
+    """
+    runs = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                runs.setdefault(record.get('run'), []).append(record)
+    return runs
+
+
+# shared by all scrapers, like the driver pool and wait_log
+tracer = Tracer()
+if os.environ.get('OPENTABLE_TRACE'):
+    tracer.enable(os.environ['OPENTABLE_TRACE'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='slowest stages and pages of every run in a trace file')
+    parser.add_argument('path')
+    parser.add_argument('--top', type=int, default=10, help='number of slowest pages shown per run')
+    args = parser.parse_args()
+
+    for run, records in read_trace(args.path).items():
+        print_summary(summary(records, args.top), run)
+        print()
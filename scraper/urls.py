@@ -0,0 +1,30 @@
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+import os
+
+
+# site the scrapers request search results from. OPENTABLE_BASE_URL points them elsewhere, e.g. at the stand-in server
+# in benchmarks/standin_server.py
+BASE_URL = os.environ.get('OPENTABLE_BASE_URL', 'https://www.opentable.com').rstrip('/')
+
+# query parameters OpenTable adds for tracking/session state, they don't change the page content
+TRACKING_PARAMS = {'corrid', 'avt', 'p', 'sd', 'queryUnderstandingType'}
+
+
+def canonical_url(url):
+    """
+    canonical_url: normalizes an OpenTable url so that every variant of the same page gives the same string.
+        Lowercases the scheme and host, drops tracking parameters, the fragment and trailing slashes, and sorts the
+        remaining query parameters
+
+    args:
+        url: string, any OpenTable url, e.g. a restaurant link from a search results card
+
+    output:
+        url: string, e.g. 'https://www.opentable.com/r/seaport-house-new-york' for
+            'https://www.opentable.com/r/seaport-house-new-york?corrid=fc65...&avt=eyJ2...&p=1&sd=2021-07-20T20%3A00%3A00'
+    """
+    parts = urlsplit(url.strip())
+    query = sorted((key, value) for key, value in parse_qsl(parts.query, keep_blank_values = True)
+                   if key not in TRACKING_PARAMS)
+    path = parts.path.rstrip('/') or '/'
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, urlencode(query), ''))
@@ -0,0 +1,159 @@
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.wait import WebDriverWait
+from urllib.parse import urlsplit, parse_qs
+import re
+import threading
+import time
+
+
+CARD_SELECTOR = 'div._3uVfVbI1iLfMbszbU6KoOL'
+TOTAL_SELECTOR = 'h3[data-test="multi-search-total-count"]'
+PAGE_SIZE = 100
+
+# scrolls one step and reports back in the same round trip: [cards loaded, reached the bottom of the page]
+SCROLL_SCRIPT = """
+window.scrollBy(0, arguments[1]);
+return [document.querySelectorAll(arguments[0]).length,
+        window.scrollY + window.innerHeight >= document.body.scrollHeight - 2];
+"""
+
+
+class WaitLog:
+    """
+    WaitLog: thread-safe record of how long each wait took and how it ended, so slow pages and waits that hit their
+        deadline show up in the run report
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.waits = []
+
+    def record(self, kind, seconds, outcome, url=None):
+        with self._lock:
+            self.waits.append((kind, seconds, outcome, url))
+
+    def summary(self):
+        """
+        summary: dict of wait kind -> {'count', 'total', 'mean', 'max', 'outcomes': {outcome: count}}
+        """
+        with self._lock:
+            waits = list(self.waits)
+        out = {}
+        for kind, seconds, outcome, url in waits:
+            s = out.setdefault(kind, {'count': 0, 'total': 0.0, 'max': 0.0, 'outcomes': {}})
+            s['count'] += 1
+            s['total'] += seconds
+            s['max'] = max(s['max'], seconds)
+            s['outcomes'][outcome] = s['outcomes'].get(outcome, 0) + 1
+        for s in out.values():
+            s['mean'] = s['total'] / s['count']
+        return out
+
+    def report(self):
+        """
+        report: prints one line per wait kind
+        """
+        for kind, s in self.summary().items():
+            outcomes = ', '.join(f'{n} {outcome}' for outcome, n in sorted(s['outcomes'].items()))
+            print(f"{kind}: {s['count']} waits, {s['total']:.1f}s total, {s['mean']:.2f}s mean, {s['max']:.2f}s max ({outcomes})")
+
+    def clear(self):
+        with self._lock:
+            self.waits = []
+
+
+# shared by all scrapers, like the driver pool
+wait_log = WaitLog()
+
+
+def expected_cards(driver, url):
+    """
+    expected_cards: number of restaurant cards a fully loaded search results page should show, from the total count
+        in the page header and the page number in the url. None if the header isn't there
+    """
+    try:
+        header = driver.find_element(By.CSS_SELECTOR, TOTAL_SELECTOR).text
+    except WebDriverException:
+        return None
+    total = re.search(r'\d+', header.replace(',', ''))
+    if total is None:
+        return None
+    page = int(parse_qs(urlsplit(url).query).get('page', ['1'])[0])
+    return max(0, min(PAGE_SIZE, int(total.group(0)) - (page - 1) * PAGE_SIZE))
+
+
+def scroll_until_loaded(driver, expected=None, deadline=30, step=1500, poll=0.05, stall=1.5, url=None):
+    """
+    scroll_until_loaded: scrolls a search results page down one step at a time until every restaurant card has
+        loaded, replacing the fixed 70 x 500px scroll loop
+
+    args:
+        driver: selenium webdriver with the results page loaded
+        expected: int, number of cards the page should have (see expected_cards()), None if unknown
+        deadline: float, seconds after which scrolling stops whatever the card count
+        step: int, pixels scrolled per step
+        poll: float, seconds between steps
+        stall: float, once at the bottom of the page, seconds without a new card after which the page is
+            considered fully loaded
+        url: string, page url, only used in the wait log
+
+    output:
+        count: int, number of cards loaded. How the wait ended is recorded in wait_log as 'complete' (expected
+        reached), 'stalled' (count stopped growing at the bottom of the page) or 'deadline'
+    """
+    start = time.monotonic()
+    last_count = -1
+    last_growth = start
+    while True:
+        count, at_bottom = driver.execute_script(SCROLL_SCRIPT, CARD_SELECTOR, step)
+        now = time.monotonic()
+        if count > last_count:
+            last_count = count
+            last_growth = now
+
+        if expected is not None and count >= expected:
+            outcome = 'complete'
+            break
+        if at_bottom and now - last_growth >= stall:
+            outcome = 'stalled'
+            break
+        if now - start >= deadline:
+            outcome = 'deadline'
+            break
+        time.sleep(poll)
+
+    wait_log.record('scroll', time.monotonic() - start, outcome, url)
+    return count
+
+
+def wait_for_change(driver, locator, before, deadline=15, poll=0.1, kind='dom_change'):
+    """
+    wait_for_change: waits until the innerHTML of an element differs from a snapshot taken earlier, e.g. until the
+        review list has been replaced after clicking a pagination button
+
+    args:
+        driver: selenium webdriver
+        locator: (By, selector) tuple of the element to watch
+        before: string, innerHTML of the element before the action
+        deadline: float, seconds to wait at most
+        poll: float, seconds between checks
+
+    output:
+        changed: bool, False if the element was still unchanged (or missing) at the deadline
+    """
+    def changed(driver):
+        try:
+            return driver.find_element(*locator).get_attribute('innerHTML') != before
+        except WebDriverException:
+            return False
+
+    start = time.monotonic()
+    try:
+        WebDriverWait(driver, deadline, poll_frequency=poll).until(changed)
+        outcome = 'changed'
+    except TimeoutException:
+        outcome = 'deadline'
+    wait_log.record(kind, time.monotonic() - start, outcome, driver.current_url)
+    return outcome == 'changed'
+